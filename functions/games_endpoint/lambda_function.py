@@ -3,7 +3,7 @@ import psycopg2
 import os
 from typing import Optional, List
 from enum import Enum
-from pydantic import BaseModel, Field, validator, ValidationError
+from pydantic import BaseModel, Field, validator, ValidationError, UUID4
 
 # Database settings
 rds_host = os.environ['DB_HOST']
@@ -29,8 +29,58 @@ class OrderDirection(str, Enum):
     ASC = "ASC"
     DESC = "DESC"
 
+# Counts in the summary tables process_trackman fills at ingest (game_summary, team_game_summary and
+# player_game_summary). Team lines are batting lines; player lines are batting or pitching lines.
+SUMMARY_COLUMNS = (
+    'pitches', 'plate_appearances', 'strikeouts', 'walks', 'hit_by_pitch',
+    'singles', 'doubles', 'triples', 'home_runs', 'hits', 'runs',
+)
+
+def summary_fields(table):
+    return ', '.join(f"'{column}', {table}.{column}" for column in SUMMARY_COLUMNS)
+
+# A game with its summary, its two team lines and every player line, as one JSON object.
+GAME_SUMMARY_QUERY = f"""
+SELECT json_build_object(
+    'game_id', game.game_id,
+    'home_team_name', home_team.team_name,
+    'visiting_team_name', visiting_team.team_name,
+    'ballpark_name', ballpark.ballpark_name,
+    'date', game.date,
+    'innings', game_summary.innings,
+    'totals', json_build_object({summary_fields('game_summary')}),
+    'teams', (
+        SELECT json_agg(json_build_object(
+            'team_id', team_game_summary.team_id, 'team_name', team.team_name, 'home', team_game_summary.home,
+            {summary_fields('team_game_summary')}
+        ) ORDER BY team_game_summary.home)
+        FROM team_game_summary
+        JOIN team ON team.team_id = team_game_summary.team_id
+        WHERE team_game_summary.game_id = game.game_id
+    ),
+    'players', (
+        SELECT json_agg(json_build_object(
+            'player_id', player_game_summary.player_id, 'player_name', player.player_name,
+            'role', player_game_summary.role, 'team_id', player_game_summary.team_id,
+            'home', player_game_summary.home,
+            {summary_fields('player_game_summary')}
+        ) ORDER BY player_game_summary.role, player_game_summary.home, player.player_name)
+        FROM player_game_summary
+        JOIN player ON player.player_id = player_game_summary.player_id
+        WHERE player_game_summary.game_id = game.game_id
+    )
+)
+FROM game
+JOIN game_summary ON game_summary.game_id = game.game_id
+JOIN team AS home_team ON game.home_team_id = home_team.team_id
+JOIN team AS visiting_team ON game.visiting_team_id = visiting_team.team_id
+JOIN ballpark ON game.ballpark_id = ballpark.ballpark_id
+WHERE game.game_id = %s
+"""
+
 # Define the request model
 class GameQueryParams(BaseModel):
+    game_id: Optional[UUID4] = None
     home_team_name: Optional[TeamNameEnum] = Field(None)
     visiting_team_name: Optional[TeamNameEnum] = Field(None)
     ballpark_name: Optional[str] = Field(None, max_length=100)
@@ -38,6 +88,13 @@ class GameQueryParams(BaseModel):
     page: Optional[int] = Field(1, ge=1)  # Default to 1, minimum 1
     limit: Optional[int] = Field(20, ge=1, le=1000)  # Default to 20, between 1 and 1000
     order: OrderDirection = OrderDirection.DESC
+    summary: bool = False  # return the box-score summary of game_id instead of a list of games
+
+    @validator('summary')
+    def validate_summary(cls, v, values):
+        if v and values.get('game_id') is None:
+            raise ValueError('summary requires a game_id')
+        return v
 
     class Config:
         # Allow extra fields (API Gateway might include other params)
@@ -98,6 +155,9 @@ def lambda_handler(event, context):
             }
         }
     
+    if params.summary:
+        return get_game_summary(conn, params.game_id)
+
     # Calculate offset for pagination
     offset = (params.page - 1) * params.limit
     
@@ -114,6 +174,10 @@ def lambda_handler(event, context):
     filters = []
     args = []
     
+    if params.game_id is not None:
+        filters.append("game.game_id = %s")
+        args.append(str(params.game_id))
+
     if params.home_team_name is not None:
         filters.append("home_team.team_name = %s")
         args.append(params.home_team_name.value)
@@ -186,4 +250,55 @@ def lambda_handler(event, context):
         }
 
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+def get_game_summary(conn, game_id):
+    """Return the summary of one game, read with a single query."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(GAME_SUMMARY_QUERY, (str(game_id),))
+            row = cur.fetchone()
+
+        if row is None:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({
+                    'success': False,
+                    'message': 'No summary for this game',
+                }),
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': "*",
+                }
+            }
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'success': True,
+                'message': 'Game summary retrieved successfully',
+                'data': row[0],
+            }, default=str),
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': "*",
+            }
+        }
+
+    except psycopg2.DatabaseError as e:
+        print(f"ERROR: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'success': False,
+                'message': "Error fetching game summary",
+            }),
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': "*",
+            }
+        }
+
+    finally:
+        conn.close()
@@ -60,6 +60,20 @@ class OrderDirection(str, Enum):
     ASC = "ASC"
     DESC = "DESC"
 
+class PitchFields(str, Enum):
+    ALL = "all"
+    TRAJECTORY = "trajectory"
+
+# Columns returned with fields=trajectory: enough to identify the pitch, plus the trajectory
+# features process_trackman derives from the pitch_trajectory_* coefficients.
+TRAJECTORY_COLUMNS = (
+    'pitch_id', 'game_id', 'pitch_number', 'date', 'time', 'pitcher_id', 'batter_id',
+    'auto_pitch_type', 'tagged_pitch_type', 'rel_speed',
+    'trajectory_plate_time', 'trajectory_plate_side', 'trajectory_plate_height',
+    'trajectory_plate_vx', 'trajectory_plate_vy', 'trajectory_plate_vz',
+    'trajectory_horz_break_40', 'trajectory_vert_break_40', 'trajectory_induced_vert_break_40',
+)
+
 # Pitch Query Parameters Model
 class PitchQueryParams(BaseModel):
     game_id: Optional[UUID4] = None
@@ -80,6 +94,7 @@ class PitchQueryParams(BaseModel):
     page: Optional[int] = Field(1, ge=1)
     limit: Optional[int] = Field(20, ge=1, le=1000)
     order: OrderDirection = OrderDirection.DESC
+    fields: PitchFields = PitchFields.ALL
 
     @validator('date_range_start', 'date_range_end', 'date', pre=True, always=False)
     def validate_date(cls, v):
@@ -159,8 +174,9 @@ def lambda_handler(event, context):
     offset = (params.page - 1) * params.limit
     
     # Base SQL query
-    query = """
-    SELECT * 
+    columns = '*' if params.fields == PitchFields.ALL else ', '.join(TRAJECTORY_COLUMNS)
+    query = f"""
+    SELECT {columns}
     FROM pitch
     """
 
@@ -0,0 +1,186 @@
+""" Reprocess the TrackMan files in S3 for a date range.
+
+Files are read from the YYYY/MM/DD/CSV/ prefixes the FTP job writes and ingested with the same
+pipeline as the Lambda, on a pool of processes that each hold one DB connection.
+
+Example:
+    python backfill.py --bucket alpb-ftp-test --start 2024-05-01 --end 2024-09-30 --workers 8
+"""
+import os
+import json
+import time
+import argparse
+import boto3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+try:
+    from . import main
+except ImportError:
+    # run as a script from this directory, or in the Lambda image where src/ is copied flat.
+    import main
+
+
+FILE_TYPES = {
+    'all': None,
+    'pitch': 'pitch data',
+    'positioning': 'player positioning',
+}
+
+
+def day_prefixes(start, end):
+    """Return the S3 prefix of every day from start to end, inclusive."""
+    prefixes = []
+    day = start
+    while day <= end:
+        prefixes.append(f'{day.year}/{day.month:02d}/{day.day:02d}/CSV/')
+        day += timedelta(days=1)
+    return prefixes
+
+
+def list_files(bucket, prefixes, file_type, s3):
+    """Return [(key, size)] for the TrackMan CSVs under the prefixes, keeping only file_type (None for all)."""
+    files = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                file_name = key.split('/')[-1]
+                if not file_name.endswith('.csv') or len(file_name.split('-')) < 3:
+                    continue
+                if file_type and main.get_file_type(file_name) != file_type:
+                    continue
+                files.append((key, obj['Size']))
+    return files
+
+
+def group_game_files(files):
+    """ Group files by game (date, ballpark and game number from the file name).
+    A game's files are processed in order by one worker so two workers never race to create the
+    same game: pitch data before player positioning, and unverified before verified.
+
+    Returns:
+        list: One list of (key, size) per game.
+    """
+    groups = {}
+    for key, size in files:
+        groups.setdefault(main.get_game_file_key(key.split('/')[-1]), []).append((key, size))
+    return [
+        sorted(group, key=lambda file: main.game_file_order(file[0].split('/')[-1]))
+        for _, group in sorted(groups.items())
+    ]
+
+
+def process_game_files(bucket, keys, force):
+    """ Ingest one game's files in a worker process.
+
+    Returns:
+        list: (key, status, error) for each key; status is 'processed', 'skipped' or 'failed'.
+    """
+    s3 = main.get_s3_client()
+    conn = None
+    results = []
+    try:
+        for key in keys:
+            try:
+                if conn is None or conn.closed:
+                    conn = main.acquire_connection()
+                if main.process_s3_file(bucket, key, conn, s3, force=force):
+                    results.append((key, 'processed', None))
+                else:
+                    results.append((key, 'skipped', None))
+            except Exception as e:
+                if conn is not None and not conn.closed:
+                    conn.rollback()
+                print(f'Error processing {key}: {e}')
+                results.append((key, 'failed', str(e)))
+    finally:
+        if conn is not None:
+            main.release_connection(conn)
+    return results
+
+
+def load_checkpoint(path):
+    """Return the keys a previous run finished, from its checkpoint file."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as file:
+        return set(json.load(file)['done'])
+
+
+def save_checkpoint(path, done):
+    # write to a temporary file first so an interrupted run never leaves a truncated checkpoint.
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({'done': sorted(done)}, file)
+    os.replace(temp_path, path)
+
+
+def backfill(bucket, start, end, file_type=None, workers=4, checkpoint=None, force=False):
+    """ Ingest every file in the date range on a pool of `workers` processes (and DB connections).
+    Finished files are recorded in the checkpoint file, and skipped when the run is restarted.
+
+    Returns:
+        dict: Number of files 'processed', 'skipped' and 'failed'.
+    """
+    s3 = boto3.client('s3')
+    done = load_checkpoint(checkpoint)
+    files = [file for file in list_files(bucket, day_prefixes(start, end), file_type, s3) if file[0] not in done]
+    groups = group_game_files(files)
+    total_bytes = sum(size for _, size in files)
+    print(f'Backfilling {len(files)} files ({total_bytes / 1e6:.1f} MB, {len(groups)} games) with {workers} workers; '
+          f'{len(done)} already done.')
+
+    counts = {'processed': 0, 'skipped': 0, 'failed': 0}
+    sizes = dict(files)
+    finished_bytes = 0
+    start_time = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for group in groups:
+            keys = [key for key, _ in group]
+            futures[executor.submit(process_game_files, bucket, keys, force)] = keys
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                # the worker itself died (ex: the pool broke); none of the group's files are known to be done.
+                print(f'Error processing {futures[future][0]} and the rest of its game: {e}')
+                results = [(key, 'failed', str(e)) for key in futures[future]]
+            for key, status, error in results:
+                counts[status] += 1
+                finished_bytes += sizes[key]
+                if status != 'failed':
+                    done.add(key)
+            if checkpoint:
+                save_checkpoint(checkpoint, done)
+            elapsed = max(time.monotonic() - start_time, 1e-9)
+            finished = sum(counts.values())
+            print(f'[{finished}/{len(files)}] {finished / elapsed:.2f} files/s, '
+                  f'{finished_bytes / 1e6 / elapsed:.2f} MB/s, {counts["failed"]} failed')
+
+    elapsed = time.monotonic() - start_time
+    print(f'Backfill finished in {elapsed:.0f}s: {counts}')
+    return counts
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reprocess TrackMan files in S3 over a date range.')
+    parser.add_argument('--bucket', default=os.environ.get('BUCKET'), help='Bucket the FTP job writes to.')
+    parser.add_argument('--start', type=parse_date, required=True, help='First day, YYYY-MM-DD.')
+    parser.add_argument('--end', type=parse_date, required=True, help='Last day, YYYY-MM-DD (inclusive).')
+    parser.add_argument('--file-type', choices=FILE_TYPES, default='all')
+    parser.add_argument('--workers', type=int, default=4, help='Processes, and so DB connections, to use.')
+    parser.add_argument('--checkpoint', default='backfill_checkpoint.json', help='File used to resume a run.')
+    parser.add_argument('--force', action='store_true',
+                        help='Reingest files already in the ingested_file ledger, replacing their games\' rows.')
+    args = parser.parse_args()
+    counts = backfill(args.bucket, args.start, args.end, FILE_TYPES[args.file_type], args.workers,
+                      args.checkpoint, args.force)
+    if counts['failed']:
+        raise SystemExit(1)
@@ -1,39 +1,554 @@
+import io
 import os
+import csv
+import json
+import math
+import hashlib
+import time
+import queue
+import itertools
+import threading
 import boto3
 import psycopg2
+import psycopg2.extras
 import pandas as pd
 from dotenv import load_dotenv
 from io import StringIO
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
 from datetime import datetime, timedelta
 
+try:
+    from . import trajectory
+except ImportError:
+    # in the Lambda image src/ is copied flat, so main is not part of a package.
+    import trajectory
+
+load_dotenv()
+
+# Kept at module scope so warm invocations of the same container reuse them instead of
+# creating a new S3 client and opening new DB connections every time.
+s3_client = None
+idle_connections = []
+idle_connections_lock = threading.Lock()
+
+# team_code -> team_id and ballpark_name -> ballpark_id. Both tables hold a few dozen rows, so they
+# are loaded whole on the first lookup, kept for the life of the container and reloaded on a miss.
+team_ids = {}
+ballpark_ids = {}
+
+# the pitch table's columns and the database's tables, to tell which optional migrations
+# (ex: sql/003_pitch_row_hash.sql) have been applied; read once per container.
+pitch_columns = None
+table_names = None
+pitch_indexes = None
+
+
 def handler(event, context):
-    """Entry point for Lambda."""
-    s3 = boto3.client('s3') # init. S3 client
-    csv, file_name = get_csv(event, s3)
-    conn = connect_to_db()
-    process_csv(csv, file_name, conn, s3)
-    conn.close()
+    """ Entry point for Lambda. Processes every record in the event (S3 notifications, or SQS
+    messages wrapping them), running independent files concurrently.
+
+    Returns:
+        dict: 'results' has one entry per record. 'batchItemFailures' lists the SQS messages that
+            failed so only those are retried (ReportBatchItemFailures).
+    """
+    s3 = get_s3_client()
+    results = process_records(event['Records'], s3)
+    return {
+        'results': results,
+        'batchItemFailures': [
+            {'itemIdentifier': result['message_id']}
+            for result in results if result['status'] == 'failed' and result.get('message_id')
+        ],
+    }
+
+
+def get_s3_client():
+    """Return the container's S3 client, creating it on the first (cold) invocation."""
+    global s3_client
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    return s3_client
+
+
+def get_max_workers():
+    """Files processed at once (MAX_WORKERS environment variable). Each worker holds one DB connection."""
+    return max(int(os.environ.get('MAX_WORKERS') or 4), 1)
+
+
+def process_records(records, s3):
+    """ Process records on a thread pool. Each worker holds one DB connection (reused from an
+    earlier invocation when possible) and takes groups of records from a shared queue until none are left.
+    A game's records are one group, processed in order by one worker (see group_game_records).
+
+    Returns:
+        list: One result dict per record, in the same order as records.
+    """
+    pending = queue.SimpleQueue()
+    groups = group_game_records(records)
+    for group in groups:
+        pending.put(group)
+    results = [None] * len(records)
+
+    def work():
+        conn = None
+        try:
+            conn = acquire_connection()
+            while True:
+                try:
+                    group = pending.get_nowait()
+                except queue.Empty:
+                    return
+                for index in group:
+                    results[index] = process_record(records[index], conn, s3)
+                    if conn.closed:
+                        # the connection dropped mid-record; reconnect for the rest of the queue.
+                        conn = acquire_connection()
+        except Exception as e:
+            print(f'Error in ingest worker: {e}')
+        finally:
+            if conn:
+                release_connection(conn)
+
+    workers = [threading.Thread(target=work) for _ in range(min(get_max_workers(), len(groups)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # records left behind by a worker that could not connect are reported as failed.
+    for index, record in enumerate(records):
+        if results[index] is None:
+            results[index] = {
+                'message_id': record.get('messageId'),
+                'keys': [key for _, key in get_record_locations(record)],
+                'status': 'failed',
+                'error': 'record was not processed',
+            }
+    return results
+
+
+def group_game_records(records):
+    """ Group record indexes by the game of the record's first file, each group in game_file_order.
+    Two workers loading the same game at once could both find no game row and both insert one, so a
+    game's files are only ever loaded by one worker (as in backfill.group_game_files).
+
+    Returns:
+        list: One list of indexes into records per game.
+    """
+    groups = {}
+    for index, record in enumerate(records):
+        try:
+            # an S3 notification, or the SQS message wrapping it, carries a single file.
+            file_name = get_record_locations(record)[0][1].split('/')[-1]
+        except Exception:
+            # process_record reports the record as it is.
+            file_name = ''
+        groups.setdefault(get_game_file_key(file_name) if file_name else (index,), []).append((file_name, index))
+    return [
+        [index for _, index in sorted(group, key=lambda item: game_file_order(item[0]))]
+        for group in groups.values()
+    ]
+
+
+def process_record(record, conn, s3):
+    """Ingest every file referenced by one event record. Errors are caught and reported in the result."""
+    locations = get_record_locations(record)
+    result = {
+        'message_id': record.get('messageId'),
+        'keys': [key for _, key in locations],
+        'status': 'processed',
+        'skipped': [],
+        'metrics': [],
+    }
+    try:
+        for bucket, key in locations:
+            metrics = process_s3_file(bucket, key, conn, s3)
+            if metrics:
+                result['metrics'].append(metrics)
+            else:
+                result['skipped'].append(key)
+    except Exception as e:
+        if not conn.closed:
+            conn.rollback()
+        print(f'Error processing {result["keys"]}: {e}')
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    return result
+
+
+def get_record_locations(record):
+    """Return [(bucket, key)] for an S3 event record, or for every S3 record in an SQS message's body."""
+    if record.get('eventSource') == 'aws:sqs':
+        body = json.loads(record['body'])
+        # S3 sends an s3:TestEvent with no Records when a notification is first configured.
+        return [location for s3_record in body.get('Records', []) for location in get_record_locations(s3_record)]
+    bucket = record['s3']['bucket']['name']
+    key = unquote_plus(record['s3']['object']['key']) # path to CSV file in S3 bucket
+    return [(bucket, key)]
+
+
+def process_s3_file(bucket, key, conn, s3, force=False):
+    """ Ingest one S3 object unless the ingested_file ledger shows this exact content was already loaded.
+    force=True ingests it regardless and replaces the rows of its game (ex: a backfill after a schema change).
+
+    Returns:
+        dict: The file's metrics (see IngestMetrics.as_dict); False if the file was skipped, either as a
+            duplicate delivery or because determine_game_id did not insert its game.
+    """
+    metrics = IngestMetrics(key)
+    metrics_state.metrics = metrics
+    try:
+        with metrics.stage('s3_fetch'):
+            res = s3.get_object(Bucket=bucket, Key=key)
+        etag = res['ETag'].strip('"')
+        file_name = key.split('/')[-1]
+        file_type = get_file_type(file_name)
+        if not force and is_file_ingested(key, etag, conn):
+            # nothing has been downloaded yet besides the response headers.
+            res['Body'].close()
+            print(f'Skipping {file_name}: this version was already ingested.')
+            return False
+
+        start = time.monotonic()
+        metrics.bytes = res.get('ContentLength')
+        with metrics.stage('s3_fetch'):
+            csv = body_to_csv(res['Body'])
+        print("Got csv:", file_name)
+        if get_transaction_mode() == 'file':
+            # the game, its pitches and the ledger entry become visible together, or not at all.
+            with file_transaction(conn) as transaction:
+                ingest = process_csv(csv, file_name, transaction, s3, force)
+                # the rejected rows are kept before the ledger can mark the file done, so they can be replayed.
+                if ingest and not write_quarantine(bucket, key, ingest['rejected'], s3):
+                    ingest['clean'] = False
+                if ingest and ingest['clean']:
+                    elapsed_ms = int((time.monotonic() - start) * 1000)
+                    with savepoint(transaction), metrics.stage('commit'):
+                        record_ingested_file(key, etag, file_type, ingest['game_id'], ingest['rows'], elapsed_ms, transaction)
+        else:
+            ingest = process_csv(csv, file_name, conn, s3, force)
+            if ingest and not write_quarantine(bucket, key, ingest['rejected'], s3):
+                ingest['clean'] = False
+            if ingest and ingest['clean']:
+                elapsed_ms = int((time.monotonic() - start) * 1000)
+                with metrics.stage('commit'):
+                    record_ingested_file(key, etag, file_type, ingest['game_id'], ingest['rows'], elapsed_ms, conn)
+        if not ingest:
+            return False
+        if not ingest['clean']:
+            # a redelivery or retry of the same content must load it again to fill in what is missing.
+            print(f'Not recording {file_name} as ingested: it did not load or quarantine cleanly.')
+        metrics.rows = ingest['rows']
+        metrics.rejected = len(ingest['rejected'])
+        metrics.emit(file_type)
+        return metrics.as_dict()
+    finally:
+        metrics_state.metrics = None
+
+
+# Stages of a file's ingest, in order, as reported by IngestMetrics.
+INGEST_STAGES = ('s3_fetch', 'parse', 'game', 'players', 'load', 'commit')
+METRICS_NAMESPACE = 'ProcessTrackman'
+
+# The IngestMetrics of the file the current thread is loading, if any.
+metrics_state = threading.local()
+
+
+class IngestMetrics:
+    """ Per-stage elapsed time and SQL statement counts for one file, emitted as one CloudWatch
+    Embedded Metric Format line. Statements are counted by CountingCursor toward the stage that is running.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.started = time.monotonic()
+        self.ms = dict.fromkeys(INGEST_STAGES, 0.0)
+        self.statements = dict.fromkeys(INGEST_STAGES + ('other',), 0)
+        self.current_stage = None
+        self.rows = 0
+        self.rejected = 0
+        self.bytes = None
+
+    @contextmanager
+    def stage(self, name):
+        previous = self.current_stage
+        self.current_stage = name
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.ms[name] += (time.monotonic() - start) * 1000
+            self.current_stage = previous
+
+    def count_statements(self, count=1):
+        self.statements[self.current_stage or 'other'] += count
+
+    def as_dict(self):
+        elapsed_ms = (time.monotonic() - self.started) * 1000
+        return {
+            'key': self.key,
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'bytes': self.bytes,
+            'elapsed_ms': round(elapsed_ms, 1),
+            'rows_per_s': round(self.rows / elapsed_ms * 1000, 1) if elapsed_ms else None,
+            'statements': sum(self.statements.values()),
+            'stages': {
+                name: {
+                    'ms': round(self.ms[name], 1),
+                    'statements': self.statements[name],
+                    'rows_per_s': round(self.rows / self.ms[name] * 1000, 1) if self.ms[name] else None,
+                }
+                for name in INGEST_STAGES
+            },
+        }
+
+    def emit(self, file_type):
+        """Print the metrics as one EMF JSON line; CloudWatch Logs turns it into metrics dimensioned by file type."""
+        metrics = self.as_dict()
+        values = {
+            'Rows': (metrics['rows'], 'Count'),
+            'RejectedRows': (metrics['rejected'], 'Count'),
+            'Bytes': (metrics['bytes'] or 0, 'Bytes'),
+            'ElapsedMs': (metrics['elapsed_ms'], 'Milliseconds'),
+            'RowsPerSecond': (metrics['rows_per_s'] or 0, 'Count/Second'),
+            'Statements': (metrics['statements'], 'Count'),
+        }
+        for name, stage in metrics['stages'].items():
+            stage_name = ''.join(part.title() for part in name.split('_'))
+            values[f'{stage_name}Ms'] = (stage['ms'], 'Milliseconds')
+            if name not in ('s3_fetch', 'parse'):
+                values[f'{stage_name}Statements'] = (stage['statements'], 'Count')
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['FileType']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in values.items()],
+                }],
+            },
+            'FileType': file_type,
+            'Key': self.key,
+            **{name: value for name, (value, _) in values.items()},
+        }))
+
+
+@contextmanager
+def metrics_stage(name):
+    """Time the block as a stage of the current file's metrics; does nothing outside process_s3_file."""
+    metrics = getattr(metrics_state, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+def staged(iterator, name):
+    """Yield from an iterator, timing each step as a metrics stage."""
+    while True:
+        with metrics_stage(name):
+            item = next(iterator, None)
+        if item is None:
+            return
+        yield item
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Cursor that counts the statements it sends toward the current file's metrics."""
+    def count(self, statements=1):
+        metrics = getattr(metrics_state, 'metrics', None)
+        if metrics is not None:
+            metrics.count_statements(statements)
+
+    def execute(self, query, vars=None):
+        self.count()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        self.count(len(vars_list))
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self.count()
+        return super().copy_expert(sql, file, size)
+
+
+def get_transaction_mode():
+    """Return how a file's writes are committed, set by the TRANSACTION_MODE environment variable.
+
+    'statement' (default): each insert/update commits on its own.
+    'file': the whole file loads in one transaction that commits once. Rows are written in
+        batches under savepoints, so a bad row only rolls back itself.
+    """
+    return os.environ.get('TRANSACTION_MODE', 'statement').strip().lower()
+
+
+class FileTransaction:
+    """ Connection wrapper used while a file loads in a single transaction.
+    The ingest functions commit and roll back as if every statement were its own transaction;
+    through this wrapper commit() does nothing and rollback() only returns to the innermost
+    savepoint. Everything else is passed through to the connection.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.savepoints = []
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def commit(self):
+        pass # the file commits once, in file_transaction.
+
+    def rollback(self):
+        if not self.savepoints:
+            self.conn.rollback()
+            forget_reference_ids()
+            return
+        cursor = self.conn.cursor()
+        cursor.execute(f'ROLLBACK TO SAVEPOINT {self.savepoints[-1]};')
+        cursor.close()
+
+
+@contextmanager
+def file_transaction(conn):
+    """Load inside one transaction on conn: commit once if the block finishes, otherwise roll everything back."""
+    try:
+        yield FileTransaction(conn)
+        with metrics_stage('commit'):
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        forget_reference_ids()
+        raise
+
+
+@contextmanager
+def savepoint(conn):
+    """ Run the block under a savepoint when conn is a FileTransaction; an error inside it rolls
+    back to the savepoint and is re-raised. For a plain connection this does nothing.
+    """
+    if not isinstance(conn, FileTransaction):
+        yield
+        return
+    name = f'ingest_{len(conn.savepoints)}'
+    cursor = conn.conn.cursor()
+    cursor.execute(f'SAVEPOINT {name};')
+    conn.savepoints.append(name)
+    try:
+        yield
+    except Exception:
+        cursor.execute(f'ROLLBACK TO SAVEPOINT {name};')
+        raise
+    finally:
+        conn.savepoints.pop()
+        if not conn.conn.closed and conn.conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            cursor.execute(f'RELEASE SAVEPOINT {name};')
+        cursor.close()
+
+
+def is_file_ingested(key, etag, conn):
+    """Check the ledger for a file with this key and ETag (the content's MD5 for single-part uploads)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT 1 FROM ingested_file
+            WHERE s3_key = %s AND etag = %s;
+            """,
+            (key, etag)
+        )
+        return cursor.fetchone() is not None
+    except psycopg2.Error as e:
+        # without the ledger every delivery is ingested, as before.
+        conn.rollback()
+        print(f'Error checking ingested_file ledger: {e}')
+        return False
+    finally:
+        cursor.close()
+
+
+def is_game_ingested(game_id, file_type, conn):
+    """ Check the ledger for a file of this type that loaded the game completely. Without the ledger
+    (sql/002), every game counts as ingested.
+    """
+    if not has_table(conn, 'ingested_file'):
+        return True
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT 1 FROM ingested_file
+            WHERE game_id = %s AND file_type = %s;
+            """,
+            (game_id, file_type)
+        )
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+
+def record_ingested_file(key, etag, file_type, game_id, row_count, elapsed_ms, conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO ingested_file (s3_key, etag, file_type, game_id, row_count, elapsed_ms)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (s3_key, etag) DO UPDATE
+            SET file_type = EXCLUDED.file_type,
+                game_id = EXCLUDED.game_id,
+                row_count = EXCLUDED.row_count,
+                elapsed_ms = EXCLUDED.elapsed_ms,
+                ingested_at = now();
+            """,
+            (key, etag, file_type, game_id, row_count, elapsed_ms)
+        )
+        conn.commit()
+        print(f'Recorded {key}: {row_count} rows in {elapsed_ms} ms')
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f'Error recording ingested file: {e}')
+    finally:
+        cursor.close()
 
 
 def get_csv(event, s3):
-    """Use event object's JSON to return a CSV from the S3 bucket."""
-    bucket = event['Records'][0]['s3']['bucket']['name']
-    key = event['Records'][0]['s3']['object']['key'] # path to CSV file in S3 bucket
-    res = s3.get_object(Bucket=bucket, Key=key)
+    """Use event object's JSON to return the first record's CSV from the S3 bucket."""
+    bucket, key = get_record_locations(event['Records'][0])[0]
+    return read_s3_csv(bucket, key, s3)
 
 
-    string = res['Body'].read().decode('utf-8')
-    csv = StringIO(string)
+def read_s3_csv(bucket, key, s3):
+    """Return a CSV from the S3 bucket and its file name."""
+    res = s3.get_object(Bucket=bucket, Key=key)
+    csv = body_to_csv(res['Body'])
     file_name = key.split('/')[-1]
     print("Got csv:", file_name)
 
     return csv, file_name
 
 
+def body_to_csv(body):
+    """Return a file-like object pandas can read from an S3 StreamingBody."""
+    pipeline_depth = get_pipeline_depth()
+    if pipeline_depth:
+        # a reader thread keeps downloading blocks while earlier ones are parsed.
+        blocks = run_in_background(lambda: body.iter_chunks(PIPELINE_BLOCK_SIZE), pipeline_depth)
+        return io.BufferedReader(BlockReader(blocks), buffer_size=PIPELINE_BLOCK_SIZE)
+    if get_chunk_size():
+        # hand the StreamingBody straight to pandas, which reads it incrementally.
+        return body
+    string = body.read().decode('utf-8')
+    return StringIO(string)
+
+
 def connect_to_db():
     """Use environment variables to return a connection object to the PostgreSQL database."""
     # get database details from environment
-    load_dotenv()
     db_name = os.environ['DB_NAME']
     db_username = os.environ['DB_USERNAME']
     db_password = os.environ['DB_PASSWORD']
@@ -46,338 +561,1494 @@ def connect_to_db():
         user=db_username,
         password=db_password,
         host=db_host,
-        port=db_port
+        port=db_port,
+        cursor_factory=CountingCursor
     )
     return conn
 
 
-def process_csv(file, file_name, conn, s3):
-    """ Read CSV, operate on the data, and insert the data into the database."""
+def acquire_connection():
+    """Return a healthy connection, reusing one left open by an earlier invocation when possible."""
+    while True:
+        with idle_connections_lock:
+            conn = idle_connections.pop() if idle_connections else None
+        if conn is None:
+            return connect_to_db()
+        if is_connection_healthy(conn):
+            return conn
+        print('Discarding stale database connection.')
+        close_connection(conn)
+
+
+def release_connection(conn):
+    """Keep a connection open for the next invocation, unless it is broken."""
+    if conn.closed:
+        return
+    try:
+        # never carry an open transaction into the next invocation.
+        conn.rollback()
+    except psycopg2.Error:
+        close_connection(conn)
+        return
+    with idle_connections_lock:
+        idle_connections.append(conn)
+
+
+def is_connection_healthy(conn):
+    """Check that a reused connection still reaches the server (RDS may have closed it while the container was frozen)."""
+    if conn.closed:
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1;')
+        cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def close_connection(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def process_csv(file, file_name, conn, s3, force=False):
+    """ Read CSV, operate on the data, and insert the data into the database.
+    force=True replaces the rows of a game that already exists (see determine_game_id).
+
+    Returns:
+        dict: {'game_id', 'rows', 'rejected', 'clean'} for the loaded game, where 'rows' counts the rows written,
+            'rejected' lists the quarantine records of the rows find_rejected_rows set aside or the database
+            refused, and 'clean' is False if the database refused a row or the players could not be resolved;
+            None if the data was not inserted.
+    """
     print("Processing csv...")
-    df = pd.read_csv(file)
-    df = df.where(pd.notnull(df), None) # cast empty values to None (instead of Float, for ex.)
-    game = get_game_info(file_name, df, conn, s3)
-    game_id = determine_game_id(file_name, conn, df, game, s3)
-    if not game_id:
-        print("Not inserting game.")
-        return # "game_id == None" tells us that we should not insert the given data.
-    
-    # check if game exists already
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT 1
-        FROM pitch
-        WHERE game_id = %s;
-        """,
-        (game_id,)
-    )
-    game_exists = True if cursor.fetchone() else False
-    
+    file_type = get_file_type(file_name)
+    chunk_size = get_chunk_size()
+    pipeline_depth = get_pipeline_depth()
+    if pipeline_depth:
+        # a parser thread reads ahead while this thread writes the chunks it has already parsed.
+        chunks = run_in_background(
+            lambda: read_trackman_csv(file, file_type, chunksize=chunk_size or PIPELINE_CHUNK_SIZE),
+            pipeline_depth
+        )
+    elif chunk_size:
+        # only one chunk of rows is in memory at a time; the first one identifies the game.
+        chunks = read_trackman_csv(file, file_type, chunksize=chunk_size)
+    else:
+        with metrics_stage('parse'):
+            chunks = iter([read_trackman_csv(file, file_type)])
+    try:
+        return load_csv_chunks(chunks, file_name, conn, s3, force)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def load_csv_chunks(chunks, file_name, conn, s3, force=False):
+    """Identify the game from the first chunk, then validate and load every chunk. Returns process_csv's result."""
+    if not has_pitch_upsert_key(conn):
+        # without it every upsert fails, so refuse the file before its game is created.
+        raise RuntimeError(
+            'pitch has no unique (game_id, pitch_number) index: apply sql/004_pitch_game_pitch_number_key.sql'
+        )
+    # in chunked and pipelined modes, reading the next chunk is where the parsing (and download) happens.
+    chunks = staged(chunks, 'parse')
+    df = next(chunks)
+    with metrics_stage('game'):
+        game = get_game_info(file_name, df, conn, s3)
+        game_id = determine_game_id(file_name, conn, df, game, s3, force)
+        if not game_id:
+            print("Not inserting game.")
+            return None # "game_id == None" tells us that we should not insert the given data.
+
     if game['file_type'] == 'pitch data':
-        handle_pitch_data(conn, df, game_id, game_exists)
+        column_map, player_fields = PITCH_COLUMN_MAP, PITCH_PLAYER_FIELDS
     elif game['file_type'] == 'player positioning':
-        handle_playerpos_data(conn, df, game_id, game_exists)
+        column_map, player_fields = PLAYERPOS_COLUMN_MAP, PLAYERPOS_PLAYER_FIELDS
     else:
         print(f'Error: invalid file type. {file_name} was not inserted.')
+        return None
+    rows = 0
+    rejected = []
+    clean = True
+    # the few columns plate appearances and summaries are built from, kept for the whole file since a PA
+    # can span chunks.
+    game_pitches = []
+    for chunk in itertools.chain([df], chunks):
+        # rows the database would refuse are set aside before loading, so one bad value
+        # does not push a whole COPY or batch onto the row-by-row path.
+        with metrics_stage('parse'):
+            reasons = find_rejected_rows(chunk, column_map)
+            if len(reasons):
+                rejected.extend(quarantine_records(chunk.loc[reasons.index], reasons))
+                chunk = chunk.drop(index=reasons.index)
+        # in a file transaction, the errors the helpers handle themselves (ex: resolve_players, a COPY
+        # falling back to row upserts) roll back to this savepoint instead of undoing the earlier chunks.
+        # An error that escapes is re-raised, and file_transaction rolls back the whole file.
+        with savepoint(conn):
+            # every player in the chunk is resolved at once instead of a lookup per row.
+            with metrics_stage('players'):
+                players = resolve_players(chunk, player_fields, conn)
+            if players is None:
+                # the rows are still loaded, without player ids, and the file is left for a retry.
+                players = {}
+                clean = False
+            if game['file_type'] == 'pitch data':
+                pitches, failed = handle_pitch_data(conn, chunk, game_id, players)
+                game_pitches.append(pitches.drop(index=failed.index))
+            else:
+                failed = handle_playerpos_data(conn, chunk, game_id, players)
+        # rows the database refused on the row-by-row path are quarantined with the database's error.
+        rejected.extend(quarantine_records(chunk.loc[failed.index], failed))
+        rows += len(chunk) - len(failed)
+        clean = clean and failed.empty
+    if game_pitches:
+        with metrics_stage('load'):
+            write_game_tables(pd.concat(game_pitches), game_id, conn)
+    return {'game_id': game_id, 'rows': rows, 'rejected': rejected, 'clean': clean}
+
+
+def find_rejected_rows(df, column_map):
+    """ Vectorized check for values the pitch table cannot store. Only needed when a column was not
+    read as a number (a lenient chunked read, or a file that did not fit the TrackMan schema).
+
+    Returns:
+        series: The reason for each rejected row, indexed like df. Empty if every row is valid.
+    """
+    reasons = pd.Series('', index=df.index, dtype=object)
+    for csv_column, _, transform in column_map:
+        if csv_column not in df.columns or TRACKMAN_DTYPES.get(csv_column, 'float64') in ('category', str):
+            continue
+        series = df[csv_column]
+        if pd.api.types.is_numeric_dtype(series):
+            continue
+        values = transform(series) if transform else series
+        bad = values.notna() & pd.to_numeric(values, errors='coerce').isna()
+        reasons[bad] += f'{csv_column} is not a number; '
+    reasons = reasons[reasons != '']
+    return reasons.str[:-2]
+
+
+def quarantine_records(df, reasons):
+    """Build one quarantine record per rejected row: its CSV line number, the reason, and the row's original values."""
+    values = df.astype(object).where(df.notna(), None)
+    return [
+        # line 1 is the header, so data row i (counting from 0) is on line i + 2.
+        {'line': int(index) + 2, 'reason': reason, 'row': row}
+        for index, reason, row in zip(df.index, reasons, values.to_dict('records'))
+    ]
+
+
+def get_quarantine_location():
+    """ Where rejected rows are written, set by the QUARANTINE_LOCATION environment variable:
+    an s3://bucket/prefix or a local directory. Unset, rejected rows are only printed.
+    An S3 prefix should be outside the bucket's CSV notification so quarantine files are not ingested.
+    """
+    return os.environ.get('QUARANTINE_LOCATION', '').strip()
+
+
+def write_quarantine(bucket, key, rejected, s3):
+    """ Write a file's rejected rows as one NDJSON object named after the source key.
+    Returns False if they could not be written.
+    """
+    if not rejected:
+        return True
+    location = get_quarantine_location()
+    if not location:
+        for record in rejected:
+            print(f'Rejected line {record["line"]} of {key}: {record["reason"]}')
+        return True
+    body = ''.join(json.dumps(record, default=str) + '\n' for record in rejected)
+    name = f'{key}.rejected.ndjson'
+    try:
+        if location.startswith('s3://'):
+            quarantine_bucket, _, prefix = location[len('s3://'):].partition('/')
+            quarantine_key = f'{prefix.rstrip("/")}/{name}' if prefix else name
+            s3.put_object(Bucket=quarantine_bucket, Key=quarantine_key, Body=body.encode('utf-8'))
+            print(f'Quarantined {len(rejected)} rows of {key} to s3://{quarantine_bucket}/{quarantine_key}')
+        else:
+            path = os.path.join(location, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(body)
+            print(f'Quarantined {len(rejected)} rows of {key} to {path}')
+        return True
+    except Exception as e:
+        print(f'Error writing quarantine for {key}: {e}')
+        return False
 
 
-def handle_pitch_data(conn, df, game_id, game_exists):
+def get_chunk_size():
+    """Rows per chunk when streaming a file (CHUNK_SIZE environment variable). 0 reads the whole file at once."""
+    return int(os.environ.get('CHUNK_SIZE') or 0)
+
+
+# Bytes per block the S3 reader thread hands to the parser, and rows per chunk the parser hands to
+# the writer when pipelining without CHUNK_SIZE.
+PIPELINE_BLOCK_SIZE = 1024 * 1024
+PIPELINE_CHUNK_SIZE = 5000
+
+
+def get_pipeline_depth():
+    """ Blocks/chunks buffered between the download, parse and write stages (PIPELINE_DEPTH environment
+    variable). 0 (default) runs them one after another on the calling thread.
+    """
+    return int(os.environ.get('PIPELINE_DEPTH') or 0)
+
+
+def run_in_background(make_iterator, depth):
+    """ Run an iterator on a background thread, passing its items through a queue of at most `depth`.
+    Yields the items in order and re-raises the producer's exception, if any. Closing the generator
+    (ex: the writer failed) stops the producer.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in make_iterator():
+                if not put(('item', item)):
+                    return
+            put(('done', None))
+        except Exception as e:
+            put(('error', e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class BlockReader(io.RawIOBase):
+    """Read-only file over an iterator of byte blocks, so pandas can parse while the blocks download."""
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.block = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.block:
+            self.block = next(self.blocks, b'')
+            if not self.block:
+                return 0
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def close(self):
+        if hasattr(self.blocks, 'close'):
+            self.blocks.close()
+        super().close()
+
+
+def handle_pitch_data(conn, df, game_id, players):
     # create PITCH table linked to game_id; insert data into PITCH table.
-    cursor = conn.cursor()
+    # players is resolve_players' map of every pitcher, batter, and catcher in the chunk.
+    # Returns the chunk's GAME_PITCH_COLUMNS and load_mapped_rows' failed rows.
+    with metrics_stage('load'):
+        mapped = map_columns(df, PITCH_COLUMN_MAP, PITCH_PLAYER_FIELDS, players, game_id)
+        if has_trajectory_columns(conn):
+            # derived once here so clients do not fetch every coefficient to redo the math.
+            mapped = mapped.join(trajectory.trajectory_features(mapped))
+        if has_row_hash_column(conn):
+            # a re-delivered game usually only changes a few tagged fields; the upsert leaves the
+            # pitches whose hash did not change alone.
+            mapped['row_hash'] = row_hashes(mapped)
+        failed = load_mapped_rows(mapped, conn)
+        if has_table(conn, 'batted_ball'):
+            write_batted_balls(mapped, game_id, conn)
+    return mapped[list(GAME_PITCH_COLUMNS)], failed
+
+
+def handle_playerpos_data(conn, df, game_id, players):
+    # players is resolve_players' map of the chunk's fielders.
+    # Returns load_mapped_rows' failed rows.
+    with metrics_stage('load'):
+        mapped = map_columns(df, PLAYERPOS_COLUMN_MAP, PLAYERPOS_PLAYER_FIELDS, players, game_id)
+        if has_row_hash_column(conn):
+            mapped['row_hash'] = None
+        return load_mapped_rows(mapped, conn, insert_only=PLAYERPOS_INSERT_ONLY_COLUMNS)
+
+
+def get_pitch_columns(conn):
+    """Return the pitch table's column names, read from the database once per container."""
+    global pitch_columns
+    if pitch_columns is None:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'pitch';
+            """
+        )
+        pitch_columns = frozenset(column for column, in cursor.fetchall())
+        cursor.close()
+    return pitch_columns
 
-    columns = (
-        'hit_trajectory_zc2', 'pitcher_id', 'batter_id', 'game_id', 'date', 'time', 'pa_of_inning', 'pitch_of_pa', 'hit_trajectory_zc7', 
-        'hit_trajectory_zc8', 'throw_speed', 'pop_time', 'exchange_time', 'time_to_base', 'catch_position_x', 'catch_position_y', 
-        'catch_position_z', 'throw_position_x', 'throw_position_y', 'throw_position_z', 'base_position_x', 'base_position_y', 
-        'base_position_z', 'throw_trajectory_xc0', 'throw_trajectory_xc1', 'throw_trajectory_xc2', 'throw_trajectory_yc0', 
-        'throw_trajectory_yc1', 'throw_trajectory_yc2', 'throw_trajectory_zc0', 'throw_trajectory_zc1', 'throw_trajectory_zc2', 
-        'inning', 'outs', 'balls', 'strikes', 'outs_on_play', 'runs_scored', 'tilt', 'y0', 'local_date_time', 'catcher_id', 
-        'pitch_number', 'rel_speed', 'vert_rel_angle', 'horz_rel_angle', 'spin_rate', 
-        'spin_axis', 'rel_height', 'rel_side', 'extension', 'vert_break', 'induced_vert_break', 'horz_break', 'plate_loc_height', 
-        'plate_loc_side', 'zone_speed', 'vert_appr_angle', 'horz_appr_angle', 'zone_time', 'exit_speed', 'angle', 'direction', 
-        'hit_spin_rate', 'position_at_110_x', 'position_at_110_y', 'position_at_110_z', 'distance', 'last_tracked_distance', 
-        'bearing', 'hang_time', 'pfxx', 'pfxz', 'x0', 'z0', 'vx0', 'vy0', 'vz0', 'ax0', 'ay0', 'az0', 'effective_velo', 
-        'max_height', 'measured_duration', 'speed_drop', 'pitch_last_measured_x', 'pitch_last_measured_y', 'pitch_last_measured_z', 
-        'contact_position_x', 'contact_position_y', 'contact_position_z', 'pitch_trajectory_xc0', 'pitch_trajectory_xc1', 
-        'pitch_trajectory_xc2', 'pitch_trajectory_yc0', 'pitch_trajectory_yc1', 'pitch_trajectory_yc2', 'pitch_trajectory_zc0', 
-        'pitch_trajectory_zc1', 'pitch_trajectory_zc2', 'hit_spin_axis', 'hit_trajectory_xc0', 'hit_trajectory_xc1', 
-        'hit_trajectory_xc2', 'hit_trajectory_xc3', 'hit_trajectory_xc4', 'hit_trajectory_xc5', 'hit_trajectory_xc6', 
-        'hit_trajectory_xc7', 'hit_trajectory_xc8', 'hit_trajectory_yc0', 'hit_trajectory_yc1', 'hit_trajectory_yc2', 
-        'hit_trajectory_yc3', 'hit_trajectory_yc4', 'hit_trajectory_yc5', 'hit_trajectory_yc6', 'hit_trajectory_yc7', 
-        'hit_trajectory_yc8', 'hit_trajectory_zc0', 'hit_trajectory_zc1', 'hit_trajectory_zc3', 'hit_trajectory_zc4', 
-        'hit_trajectory_zc5', 'hit_trajectory_zc6', 'pitcher_throws', 'pitcher_team_code', 'batter_side', 'batter_team_code', 'pitcher_set', 
-        'catcher_throws', 'top_or_bottom', 'hit_launch_confidence', 'hit_landing_confidence', 'tagged_pitch_type', 
-        'auto_pitch_type', 'pitch_call', 'k_or_bb', 'tagged_hit_type', 'play_result', 'catcher_throw_catch_confidence', 
-        'catcher_throw_release_confidence', 'notes', 'catcher_throw_location_confidence', 'pitch_release_confidence', 
-        'pitch_location_confidence', 'auto_hit_type', 'pitch_movement_confidence'
+
+def has_table(conn, table_name):
+    """Check whether a table exists; the database's table names are read once per container."""
+    global table_names
+    if table_names is None:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = current_schema();
+            """
         )
-    
-    placeholders_str = ', '.join(['%s'] * len(columns))
-    # iterate over each row in the DataFrame to insert pitch data
-    for index, row in df.iterrows():
-        # Get or insert player data for pitcher, batter, and catcher
-        pitcher_id = get_or_insert_player(row['Pitcher'], row['PitcherThrows'], row['PitcherTeam'], "pitcher", conn)
-        batter_id = get_or_insert_player(row['Batter'], row['BatterSide'], row['BatterTeam'], "batter", conn)
-        catcher_id = get_or_insert_player(row['Catcher'], row['CatcherThrows'], row['CatcherTeam'], "catcher", conn)
-        pitcher_set = check_undefined_or_nan(row['PitcherSet'])
-
-        values = ( 
-            row['HitTrajectoryZc2'], pitcher_id, batter_id, game_id, row['Date'], row['Time'], row['PAofInning'], 
-            row['PitchofPA'], row['HitTrajectoryZc7'], row['HitTrajectoryZc8'], row['ThrowSpeed'], row['PopTime'], row['ExchangeTime'], row['TimeToBase'], 
-            row['CatchPositionX'], row['CatchPositionY'], row['CatchPositionZ'], row['ThrowPositionX'], row['ThrowPositionY'], 
-            row['ThrowPositionZ'], row['BasePositionX'], row['BasePositionY'], row['BasePositionZ'], row['ThrowTrajectoryXc0'], 
-            row['ThrowTrajectoryXc1'], row['ThrowTrajectoryXc2'], row['ThrowTrajectoryYc0'], row['ThrowTrajectoryYc1'], 
-            row['ThrowTrajectoryYc2'], row['ThrowTrajectoryZc0'], row['ThrowTrajectoryZc1'], row['ThrowTrajectoryZc2'], row['Inning'], 
-            row['Outs'], row['Balls'], row['Strikes'], row['OutsOnPlay'], row['RunsScored'], row['Tilt'], row['y0'], 
-            row['LocalDateTime'], 
-            catcher_id, row['PitchNo'], row['RelSpeed'], row['VertRelAngle'], row['HorzRelAngle'], 
-            row['SpinRate'], row['SpinAxis'], row['RelHeight'], row['RelSide'], row['Extension'], row['VertBreak'], row['InducedVertBreak'], 
-            row['HorzBreak'], row['PlateLocHeight'], row['PlateLocSide'], row['ZoneSpeed'], row['VertApprAngle'], row['HorzApprAngle'], 
-            row['ZoneTime'], row['ExitSpeed'], row['Angle'], row['Direction'], row['HitSpinRate'], row['PositionAt110X'], 
-            row['PositionAt110Y'], row['PositionAt110Z'], row['Distance'], row['LastTrackedDistance'], row['Bearing'], row['HangTime'], 
-            row['pfxx'], row['pfxz'], row['x0'], row['z0'], row['vx0'], row['vy0'], row['vz0'], row['ax0'], row['ay0'], row['az0'], 
-            row['EffectiveVelo'], row['MaxHeight'], row['MeasuredDuration'], row['SpeedDrop'], row['PitchLastMeasuredX'],
-            row['PitchLastMeasuredY'], row['PitchLastMeasuredZ'], row['ContactPositionX'], row['ContactPositionY'], 
-            row['ContactPositionZ'], row['PitchTrajectoryXc0'], row['PitchTrajectoryXc1'], row['PitchTrajectoryXc2'], row['PitchTrajectoryYc0'], 
-            row['PitchTrajectoryYc1'], row['PitchTrajectoryYc2'], row['PitchTrajectoryZc0'], row['PitchTrajectoryZc1'], row['PitchTrajectoryZc2'], 
-            row['HitSpinAxis'], row['HitTrajectoryXc0'], row['HitTrajectoryXc1'], row['HitTrajectoryXc2'], row['HitTrajectoryXc3'], 
-            row['HitTrajectoryXc4'], row['HitTrajectoryXc5'], row['HitTrajectoryXc6'], row['HitTrajectoryXc7'], row['HitTrajectoryXc8'], 
-            row['HitTrajectoryYc0'], row['HitTrajectoryYc1'], row['HitTrajectoryYc2'], row['HitTrajectoryYc3'], row['HitTrajectoryYc4'], 
-            row['HitTrajectoryYc5'], row['HitTrajectoryYc6'], row['HitTrajectoryYc7'], row['HitTrajectoryYc8'], row['HitTrajectoryZc0'], 
-            row['HitTrajectoryZc1'], row['HitTrajectoryZc3'], row['HitTrajectoryZc4'], row['HitTrajectoryZc5'], 
-            row['HitTrajectoryZc6'], row['PitcherThrows'], row['PitcherTeam'], row['BatterSide'], row['BatterTeam'], pitcher_set, 
-            row['CatcherThrows'], row['Top/Bottom'], row['HitLaunchConfidence'], row['HitLandingConfidence'], 
-            row['TaggedPitchType'], row['AutoPitchType'], row['PitchCall'], row['KorBB'], row['TaggedHitType'], row['PlayResult'], 
-            row['CatcherThrowCatchConfidence'], row['CatcherThrowReleaseConfidence'], row['Notes'], row['CatcherThrowLocationConfidence'], 
-            row['PitchReleaseConfidence'], row['PitchLocationConfidence'], row['AutoHitType'], row['PitchMovementConfidence']
-            )
-        
-        if game_exists:
-            insert_data_game_exists(columns, values, game_id, row['PitchNo'], conn)
-        else:
-            insert_data_game_dne(columns, values, placeholders_str, conn)
+        table_names = frozenset(name for name, in cursor.fetchall())
+        cursor.close()
+    return table_name in table_names
 
 
-def check_undefined_or_nan(val):
-    if isinstance(val, str) and (val == "Undefined" or val.lower() == "nan"):
-        return None
-    return val
+def has_pitch_upsert_key(conn):
+    """ Check whether the unique (game_id, pitch_number) index from sql/004 exists; every pitch write is an
+    ON CONFLICT on it. The pitch table's index names are read once per container.
+    """
+    global pitch_indexes
+    if pitch_indexes is None:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = 'pitch';
+            """
+        )
+        pitch_indexes = frozenset(name for name, in cursor.fetchall())
+        cursor.close()
+    return 'pitch_game_id_pitch_number_key' in pitch_indexes
 
-def handle_playerpos_data(conn, df, game_id, game_exists):
-    cursor = conn.cursor()
-    columns = (
-        'pitch_number', 'date', 'time', 'pitch_call', 'play_result', 'detected_shift', 'first_b_position_at_release_x', 'first_b_position_at_release_z',
-        'second_b_position_at_release_x', 'second_b_position_at_release_z', 'third_b_position_at_release_x', 'third_b_position_at_release_z',
-        'ss_position_at_release_x', 'ss_position_at_release_z', 'lf_position_at_release_x', 'lf_position_at_release_z', 'cf_position_at_release_x',
-        'cf_position_at_release_z', 'rf_position_at_release_x', 'rf_position_at_release_z', 'first_b_player_id', 'second_b_player_id',
-        'third_b_player_id', 'ss_player_id', 'lf_player_id', 'cf_player_id', 'rf_player_id'
+
+def has_row_hash_column(conn):
+    """Check whether the pitch.row_hash migration (sql/003) has been applied."""
+    return 'row_hash' in get_pitch_columns(conn)
+
+
+def has_trajectory_columns(conn):
+    """Check whether the trajectory feature migration (sql/005) has been applied."""
+    return get_pitch_columns(conn).issuperset(trajectory.FEATURE_COLUMNS)
+
+
+def row_hashes(mapped):
+    """ Return an MD5 digest of each row's mapped values, for pitch.row_hash.
+    game_id is left out since rows are compared within a game. The column names are part of the
+    digest, so changing a column map makes every row look changed once.
+    """
+    columns = [column for column in mapped.columns if column != 'game_id']
+    header = '\x1f'.join(columns)
+    return pd.Series(
+        [
+            hashlib.md5(
+                '\x1e'.join([header, *('' if val is None else str(val) for val in values)]).encode('utf-8')
+            ).hexdigest()
+            for values in mapped[columns].itertuples(index=False, name=None)
+        ],
+        index=mapped.index,
+        dtype=object
+    )
+
+
+def write_derived(name, write, conn):
+    """ Run write(cursor) for a table derived from the pitches under a savepoint and commit it. An error is
+    rolled back and re-raised so the file fails: in a file transaction the pitches are rolled back with it,
+    otherwise the file stays out of the ingested_file ledger and its retry rebuilds the table.
+    """
+    with savepoint(conn):
+        cursor = conn.cursor()
+        try:
+            write(cursor)
+            conn.commit()
+            print(f'wrote {name}')
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f'Error writing {name}: {e}')
+            raise
+        finally:
+            cursor.close()
+
+
+def write_batted_balls(mapped, game_id, conn):
+    """ Replace the batted_ball rows of the frame's pitches with the ones solved from their hit trajectories
+    (a re-delivered pitch may no longer be a batted ball). batted_ball holds one row per ball in play:
+    its solved landing point, distance, spray angle, apex and hang time. Runs after the pitches are
+    written, since batted_ball rows point at pitch_id.
+    """
+    balls = trajectory.batted_ball_features(mapped)
+    balls.insert(0, 'pitch_number', mapped.loc[balls.index, 'pitch_number'])
+    balls = balls[balls['pitch_number'].notna()]
+    pitch_numbers = [pitch_number for pitch_number in mapped['pitch_number'] if pitch_number is not None]
+    columns_str = ', '.join(trajectory.BATTED_BALL_COLUMNS)
+    # pitch has its own distance and hang_time (TrackMan's), so the solved ones are read through the alias.
+    balls_columns_str = ', '.join(f'balls.{column}' for column in trajectory.BATTED_BALL_COLUMNS)
+
+    def write(cursor):
+        cursor.execute(
+            """
+            DELETE FROM batted_ball
+            USING pitch
+            WHERE batted_ball.pitch_id = pitch.pitch_id
+            AND pitch.game_id = %s
+            AND pitch.pitch_number = ANY(%s);
+            """,
+            (game_id, pitch_numbers)
         )
-    placeholders_str = ', '.join(['%s'] * len(columns))
-    for index, row in df.iterrows():
-        # could optimize these queries to only run if trackman-generated player ids in the current row
-        # are different than those in the previous row, but speed does not seem to be a high priority
-        # for our application.
-        first_base_player_id = get_or_insert_player(row['1B_Name'], None, row['PitcherTeam'], "defense", conn)
-        second_base_player_id = get_or_insert_player(row['2B_Name'], None, row['PitcherTeam'], "defense", conn)
-        third_base_player_id = get_or_insert_player(row['3B_Name'], None, row['PitcherTeam'], "defense", conn)
-        ss_player_id = get_or_insert_player(row['SS_Name'], None, row['PitcherTeam'], "defense", conn)
-        lf_player_id = get_or_insert_player(row['LF_Name'], None, row['PitcherTeam'], "defense", conn)
-        cf_player_id = get_or_insert_player(row['CF_Name'], None, row['PitcherTeam'], "defense", conn)
-        rf_player_id = get_or_insert_player(row['RF_Name'], None, row['PitcherTeam'], "defense", conn)
-        play_result = check_undefined_or_nan(row['PlayResult'])
-
-        values = (
-            row['PitchNo'], row['Date'], row['Time'], row['PitchCall'], play_result, row['DetectedShift'], row['1B_PositionAtReleaseX'], 
-            row['1B_PositionAtReleaseZ'], row['2B_PositionAtReleaseX'], row['2B_PositionAtReleaseZ'], row['3B_PositionAtReleaseX'],
-            row['3B_PositionAtReleaseZ'], row['SS_PositionAtReleaseX'], row['SS_PositionAtReleaseZ'], row['LF_PositionAtReleaseX'],
-            row['LF_PositionAtReleaseZ'], row['CF_PositionAtReleaseX'], row['CF_PositionAtReleaseZ'], row['RF_PositionAtReleaseX'],
-            row['RF_PositionAtReleaseZ'], first_base_player_id, second_base_player_id, third_base_player_id, ss_player_id, lf_player_id,
-            cf_player_id, rf_player_id
+        if not balls.empty:
+            # the casts type the VALUES columns even when a whole column is NULL.
+            psycopg2.extras.execute_values(
+                cursor,
+                f"""
+                INSERT INTO batted_ball (pitch_id, game_id, {columns_str})
+                SELECT pitch.pitch_id, pitch.game_id, {balls_columns_str}
+                FROM (VALUES %s) AS balls (game_id, pitch_number, {columns_str})
+                JOIN pitch
+                ON pitch.game_id = balls.game_id
+                AND pitch.pitch_number = balls.pitch_number;
+                """,
+                [(game_id, *values) for values in balls.itertuples(index=False, name=None)],
+                template='(%s::uuid, %s::integer' + ', %s::double precision' * len(trajectory.BATTED_BALL_COLUMNS) + ')',
+                page_size=UPSERT_PAGE_SIZE
             )
-        
-        if game_exists:
-            insert_data_game_exists(columns, values, game_id, row['PitchNo'], conn)
-        else:
-            insert_data_game_dne(columns, values, placeholders_str, conn)
 
+    write_derived(f'{len(balls)} batted balls', write, conn)
 
-def insert_data_game_exists(columns, values, game_id, pitch_number, conn):
-    cursor = conn.cursor()
-    try:
-        set_clause = construct_set_clause(columns)
-        # update data
+
+# Pitch columns a plate appearance is built from, and the plate_appearance table's columns (sql/007).
+PLATE_APPEARANCE_KEY = ('inning', 'top_or_bottom', 'pa_of_inning')
+PLATE_APPEARANCE_PITCH_COLUMNS = (
+    'pitch_number', *PLATE_APPEARANCE_KEY, 'batter_id', 'pitcher_id', 'outs', 'balls', 'strikes',
+    'pitch_call', 'k_or_bb', 'play_result', 'outs_on_play', 'runs_scored',
+)
+PLATE_APPEARANCE_COLUMNS = (
+    'game_id', *PLATE_APPEARANCE_KEY, 'batter_id', 'pitcher_id', 'first_pitch_number', 'last_pitch_number',
+    'pitch_count', 'outs', 'result', 'k_or_bb', 'play_result', 'outs_on_play', 'runs_scored', 'counts',
+)
+
+
+def plate_appearances(pitches, game_id):
+    """ Group a game's pitches into plate appearances by (inning, top_or_bottom, pa_of_inning).
+    The batter, pitcher, result and *_on_play values are the last pitch's; outs are the first pitch's.
+    Pitches missing a key or pitch_number are left out.
+
+    Returns:
+        dataframe: PLATE_APPEARANCE_COLUMNS, one row per PA in pitch order, with missing values as None.
+    """
+    key = list(PLATE_APPEARANCE_KEY)
+    pitches = pitches.dropna(subset=['pitch_number', *key])
+    pitches = pitches.sort_values('pitch_number', kind='stable')
+    first = pitches.drop_duplicates(key, keep='first').set_index(key)
+    last = pitches.drop_duplicates(key, keep='last').set_index(key)
+    counts = (
+        pitches['balls'].astype('Int64').astype('string') + '-' + pitches['strikes'].astype('Int64').astype('string')
+    ).astype(object)
+    counts = counts.where(counts.notna(), None).groupby([pitches[column] for column in key], sort=False).agg(list)
+    # a strikeout or walk is in KorBB, a ball in play in PlayResult and a hit batter only in PitchCall.
+    result = (
+        pd.Series(None, index=last.index, dtype=object)
+        .mask(last['pitch_call'] == 'HitByPitch', 'HitByPitch')
+        .mask(last['play_result'].notna() & (last['play_result'] != 'Undefined'), last['play_result'])
+        .mask(last['k_or_bb'].notna() & (last['k_or_bb'] != 'Undefined'), last['k_or_bb'])
+    )
+    appearances = pd.DataFrame({
+        'game_id': game_id,
+        'batter_id': last['batter_id'],
+        'pitcher_id': last['pitcher_id'],
+        'first_pitch_number': first['pitch_number'],
+        'last_pitch_number': last['pitch_number'],
+        'pitch_count': pitches.groupby(key, sort=False).size(),
+        'outs': first['outs'],
+        'result': result,
+        'k_or_bb': last['k_or_bb'],
+        'play_result': last['play_result'],
+        'outs_on_play': last['outs_on_play'],
+        'runs_scored': last['runs_scored'],
+        'counts': counts,
+    }, index=last.index).reset_index()[list(PLATE_APPEARANCE_COLUMNS)].astype(object)
+    return appearances.where(appearances.notna(), None)
+
+
+def write_game_tables(pitches, game_id, conn):
+    """Rebuild the plate appearances and summaries of a game from all the pitches of its pitch data file."""
+    appearances = plate_appearances(pitches, game_id)
+    if has_table(conn, 'plate_appearance'):
+        write_plate_appearances(appearances, game_id, conn)
+    if has_table(conn, 'game_summary'):
+        write_game_summaries(pitches, appearances, game_id, conn)
+    if has_table(conn, 'player_season_pitch_type'):
+        write_season_stats(pitches, game_id, conn)
+
+
+def write_plate_appearances(appearances, game_id, conn):
+    """ Replace the game's plate appearances with the ones built from its pitch data file. plate_appearance
+    holds one row per PA: its batter, pitcher, pitch range, count sequence and result.
+    """
+    columns_str = ', '.join(PLATE_APPEARANCE_COLUMNS)
+
+    def write(cursor):
+        cursor.execute("DELETE FROM plate_appearance WHERE game_id = %s;", (game_id,))
+        psycopg2.extras.execute_values(
+            cursor,
+            f"INSERT INTO plate_appearance ({columns_str}) VALUES %s;",
+            list(appearances.itertuples(index=False, name=None)),
+            page_size=UPSERT_PAGE_SIZE
+        )
+
+    write_derived(f'{len(appearances)} plate appearances', write, conn)
+
+
+# Counts every summary table (sql/008) has, and the PA results that are hits.
+SUMMARY_COLUMNS = (
+    'pitches', 'plate_appearances', 'strikeouts', 'walks', 'hit_by_pitch',
+    'singles', 'doubles', 'triples', 'home_runs', 'hits', 'runs',
+)
+HIT_RESULTS = {'Single': 'singles', 'Double': 'doubles', 'Triple': 'triples', 'HomeRun': 'home_runs'}
+
+
+def summary_counts(pitches, appearances, by):
+    """ Count SUMMARY_COLUMNS for each group of pitches and plate appearances, grouped by the `by` column
+    both frames have (rows with a missing key are left out). Pitches and runs come from the pitches,
+    the other counts from the PA results.
+
+    Returns:
+        dataframe: SUMMARY_COLUMNS as integers, indexed by the group.
+    """
+    pitch_groups = pitches.groupby(by, sort=False)
+    counts = pd.DataFrame({'pitches': pitch_groups.size(), 'runs': pitch_groups['runs'].sum()})
+    result = appearances['result']
+    outcomes = pd.DataFrame({
+        'plate_appearances': 1,
+        'strikeouts': result == 'Strikeout',
+        'walks': result == 'Walk',
+        'hit_by_pitch': result == 'HitByPitch',
+        **{column: result == play_result for play_result, column in HIT_RESULTS.items()},
+    }, index=appearances.index).astype(int)
+    outcomes['hits'] = outcomes[list(HIT_RESULTS.values())].sum(axis=1)
+    counts = counts.join(outcomes.groupby(appearances[by], sort=False).sum(), how='outer')
+    return counts.fillna(0).astype(int)[list(SUMMARY_COLUMNS)]
+
+
+def game_summaries(pitches, appearances, game_id):
+    """ Summarize a game from its pitches (PLATE_APPEARANCE_PITCH_COLUMNS) and plate_appearances().
+    Teams are told apart by `home`: the bottom of an inning is the home team batting.
+
+    Returns:
+        3-tuple: (game, teams, players) dataframes with the columns of game_summary, team_game_summary
+            (without team_id) and player_game_summary (without team_id), as Python values.
+    """
+    batting_home = {'Top': False, 'Bottom': True}
+    pitches = pitches.assign(
+        game_id=game_id,
+        home=pitches['top_or_bottom'].map(batting_home),
+        runs=pd.to_numeric(pitches['runs_scored'], errors='coerce').fillna(0),
+    )
+    appearances = appearances.assign(home=appearances['top_or_bottom'].map(batting_home))
+
+    game = summary_counts(pitches, appearances, 'game_id')
+    game.insert(0, 'innings', pd.to_numeric(pitches['inning'], errors='coerce').max())
+    teams = summary_counts(pitches, appearances, 'home')
+    players = []
+    for role, player_column, pitcher in (('batting', 'batter_id', False), ('pitching', 'pitcher_id', True)):
+        lines = summary_counts(pitches, appearances, player_column)
+        # a pitcher's team is the one in the field; the first inning half a player shows up in decides it.
+        home = pitches.dropna(subset=['home']).groupby(player_column, sort=False)['home'].first().reindex(lines.index)
+        lines.insert(0, 'home', home.map({True: False, False: True}) if pitcher else home)
+        lines.insert(0, 'role', role)
+        players.append(lines.rename_axis('player_id').reset_index())
+    players = pd.concat(players, ignore_index=True)
+    game = game.rename_axis('game_id').reset_index()
+    teams = teams.rename_axis('home').reset_index()
+    teams['home'] = teams['home'].astype(bool)
+    return tuple(frame.astype(object).where(frame.notna(), None) for frame in (game, teams, players))
+
+
+def write_game_summaries(pitches, appearances, game_id, conn):
+    """ Replace the game's rows in game_summary, team_game_summary and player_game_summary: the box score
+    counts (SUMMARY_COLUMNS) of the game, of each team and of each player's batting and pitching lines.
+    Team ids come from the game row; a player whose inning half is unknown has no home flag and no team.
+    """
+    game, teams, players = game_summaries(pitches, appearances, game_id)
+    columns_str = ', '.join(SUMMARY_COLUMNS)
+    summary_columns_str = ', '.join(f'summary.{column}' for column in SUMMARY_COLUMNS)
+    counts_template = ', %s::integer' * len(SUMMARY_COLUMNS) + ')'
+    team_id_sql = (
+        "CASE WHEN summary.home IS NULL THEN NULL"
+        " WHEN summary.home THEN game.home_team_id ELSE game.visiting_team_id END"
+    )
+
+    def write(cursor):
+        for table in ('game_summary', 'team_game_summary', 'player_game_summary'):
+            cursor.execute(f"DELETE FROM {table} WHERE game_id = %s;", (game_id,))
+        psycopg2.extras.execute_values(
+            cursor,
+            f"INSERT INTO game_summary (game_id, innings, {columns_str}) VALUES %s;",
+            list(game.itertuples(index=False, name=None))
+        )
+        psycopg2.extras.execute_values(
+            cursor,
+            f"""
+            INSERT INTO team_game_summary (game_id, team_id, home, {columns_str})
+            SELECT game.game_id, {team_id_sql}, summary.home, {summary_columns_str}
+            FROM (VALUES %s) AS summary (game_id, home, {columns_str})
+            JOIN game ON game.game_id = summary.game_id;
+            """,
+            [(game_id, *values) for values in teams.itertuples(index=False, name=None)],
+            template='(%s::uuid, %s::boolean' + counts_template
+        )
+        psycopg2.extras.execute_values(
+            cursor,
+            f"""
+            INSERT INTO player_game_summary (game_id, player_id, role, team_id, home, {columns_str})
+            SELECT game.game_id, summary.player_id, summary.role, {team_id_sql}, summary.home, {summary_columns_str}
+            FROM (VALUES %s) AS summary (game_id, player_id, role, home, {columns_str})
+            JOIN game ON game.game_id = summary.game_id;
+            """,
+            [(game_id, *values) for values in players.itertuples(index=False, name=None)],
+            template='(%s::uuid, %s::uuid, %s, %s::boolean' + counts_template,
+            page_size=UPSERT_PAGE_SIZE
+        )
+
+    write_derived(f'the game summary with {len(players)} player lines', write, conn)
+
+
+# Pitch measures the season tables (sql/009) accumulate, and their accumulator columns.
+SEASON_MEASURES = ('rel_speed', 'spin_rate', 'horz_break', 'induced_vert_break', 'exit_speed')
+SEASON_STAT_COLUMNS = (
+    'pitches',
+    *(f'{measure}_{accumulator}' for measure in SEASON_MEASURES for accumulator in ('count', 'sum', 'sum_squares')),
+)
+SEASON_KEY = ('player_id', 'role', 'season', 'pitch_type')
+
+# The columns of a pitch data file kept until the whole file is loaded (see write_game_tables).
+GAME_PITCH_COLUMNS = (*PLATE_APPEARANCE_PITCH_COLUMNS, 'tagged_pitch_type', 'auto_pitch_type', *SEASON_MEASURES)
+
+
+def season_accumulators(pitches):
+    """ Sum SEASON_STAT_COLUMNS over a game's pitches (GAME_PITCH_COLUMNS) for each pitcher and batter
+    and pitch type. The pitch type is tagged_pitch_type, or auto_pitch_type when the pitch was not tagged.
+
+    Returns:
+        dataframe: player_id, role, pitch_type and SEASON_STAT_COLUMNS, as Python values.
+    """
+    tagged = pitches['tagged_pitch_type']
+    pitch_type = tagged.where(tagged.notna() & (tagged != 'Undefined'), pitches['auto_pitch_type'])
+    pitch_type = pitch_type.where(pitch_type.notna(), 'Undefined').rename('pitch_type')
+    accumulators = {'pitches': pd.Series(1, index=pitches.index)}
+    for measure in SEASON_MEASURES:
+        values = pd.to_numeric(pitches[measure], errors='coerce').astype('float64')
+        accumulators[f'{measure}_count'] = values.notna().astype(int)
+        accumulators[f'{measure}_sum'] = values.fillna(0)
+        accumulators[f'{measure}_sum_squares'] = values.fillna(0) ** 2
+    accumulators = pd.DataFrame(accumulators)
+    roles = []
+    for role, player_column in (('batting', 'batter_id'), ('pitching', 'pitcher_id')):
+        sums = accumulators.groupby([pitches[player_column].rename('player_id'), pitch_type], sort=False).sum()
+        sums.insert(0, 'role', role)
+        roles.append(sums.reset_index())
+    stats = pd.concat(roles, ignore_index=True)[['player_id', 'role', 'pitch_type', *SEASON_STAT_COLUMNS]]
+    return stats.astype(object)
+
+
+def remove_season_stats(game_ids, cursor):
+    """ Subtract the games' contributions from player_season_pitch_type and delete their player_game_pitch_type
+    rows. Season rows left without pitches are deleted. Rows are changed in key order, so concurrent ingests
+    of games with the same players wait for each other instead of deadlocking.
+    """
+    key_str = ', '.join(SEASON_KEY)
+    columns_str = ', '.join(SEASON_STAT_COLUMNS)
+    cursor.execute(
+        f"""
+        INSERT INTO player_season_pitch_type ({key_str}, {columns_str})
+        SELECT {key_str}, {', '.join(f'-SUM({column})' for column in SEASON_STAT_COLUMNS)}
+        FROM player_game_pitch_type
+        WHERE game_id = ANY(%s::uuid[])
+        GROUP BY {key_str}
+        ORDER BY {key_str}
+        ON CONFLICT ({key_str}) DO UPDATE SET
+        {', '.join(f'{column} = player_season_pitch_type.{column} + EXCLUDED.{column}' for column in SEASON_STAT_COLUMNS)}
+        RETURNING {key_str}, pitches;
+        """,
+        (list(game_ids),)
+    )
+    emptied = tuple(row[:-1] for row in cursor.fetchall() if row[-1] == 0)
+    if emptied:
+        cursor.execute(
+            f"DELETE FROM player_season_pitch_type WHERE ({key_str}) IN %s AND pitches = 0;",
+            (emptied,)
+        )
+    cursor.execute("DELETE FROM player_game_pitch_type WHERE game_id = ANY(%s::uuid[]);", (list(game_ids),))
+
+
+def write_season_stats(pitches, game_id, conn):
+    """ Replace the game's contribution to the season accumulators: its old player_game_pitch_type rows are
+    subtracted from player_season_pitch_type, then the new ones are added. Both tables hold the pitch count
+    and the count, sum and sum of squares of each SEASON_MEASURES value per player, role and pitch type;
+    the season is the game date's year.
+    """
+    stats = season_accumulators(pitches)
+    key_str = ', '.join(SEASON_KEY)
+    columns_str = ', '.join(SEASON_STAT_COLUMNS)
+    stats_columns_str = ', '.join(f'stats.{column}' for column in SEASON_STAT_COLUMNS)
+    counts_template = ''.join(
+        ', %s::integer' if column == 'pitches' or column.endswith('_count') else ', %s::double precision'
+        for column in SEASON_STAT_COLUMNS
+    )
+
+    def write(cursor):
+        remove_season_stats([game_id], cursor)
+        psycopg2.extras.execute_values(
+            cursor,
+            f"""
+            INSERT INTO player_game_pitch_type (game_id, {key_str}, {columns_str})
+            SELECT game.game_id, stats.player_id, stats.role, EXTRACT(YEAR FROM game.date::date)::integer,
+                stats.pitch_type, {stats_columns_str}
+            FROM (VALUES %s) AS stats (game_id, player_id, role, pitch_type, {columns_str})
+            JOIN game ON game.game_id = stats.game_id;
+            """,
+            [(game_id, *values) for values in stats.dropna(subset=['player_id']).itertuples(index=False, name=None)],
+            template='(%s::uuid, %s::uuid, %s, %s' + counts_template + ')',
+            page_size=UPSERT_PAGE_SIZE
+        )
         cursor.execute(
             f"""
-            UPDATE pitch
-            SET {set_clause}
+            INSERT INTO player_season_pitch_type ({key_str}, {columns_str})
+            SELECT {key_str}, {columns_str}
+            FROM player_game_pitch_type
             WHERE game_id = %s
-            AND pitch_number = %s;
+            ORDER BY {key_str}
+            ON CONFLICT ({key_str}) DO UPDATE SET
+            {', '.join(f'{column} = player_season_pitch_type.{column} + EXCLUDED.{column}' for column in SEASON_STAT_COLUMNS)};
             """,
-            values + (game_id,) + (pitch_number,)
+            (game_id,)
+        )
+
+    write_derived(f'{len(stats)} season pitch type accumulators', write, conn)
+
+
+def get_load_mode():
+    """Return how pitch rows are written, set by the LOAD_MODE environment variable. Either way, rows are
+    upserted on (game_id, pitch_number), so new games, re-delivered games and partially loaded games take
+    the same path.
+
+    'row' (default): multi-row INSERT ... ON CONFLICT statements, committed once per file (savepoint
+        batches when TRANSACTION_MODE is 'file').
+    'copy': the rows are streamed into a staging table with COPY and upserted into pitch with one
+        INSERT ... SELECT ... ON CONFLICT, inside one transaction.
+    """
+    return os.environ.get('LOAD_MODE', 'row').strip().lower()
+
+
+def load_mapped_rows(mapped, conn, insert_only=()):
+    """ Write a frame returned by map_columns to the pitch table. The insert_only columns are written
+    for new pitches but left alone on existing ones.
+
+    Returns:
+        series: The database error for each row that could not be written, indexed like mapped.
+    """
+    columns = tuple(mapped.columns)
+    rows = list(mapped.itertuples(index=False, name=None))
+    if not rows:
+        failed = []
+    elif get_load_mode() == 'copy':
+        with savepoint(conn):
+            failed = load_rows_bulk(columns, rows, conn, insert_only)
+    else:
+        failed = write_rows(columns, rows, conn, insert_only)
+    return pd.Series(
+        [error for _, error in failed], index=mapped.index[[position for position, _ in failed]], dtype=object
+    )
+
+
+# Rows written under one savepoint in a file transaction. A failed batch is replayed row by row.
+SAVEPOINT_BATCH_SIZE = 1000
+# Rows per INSERT ... ON CONFLICT statement sent by execute_values.
+UPSERT_PAGE_SIZE = 1000
+
+
+def upsert_sql(columns, source, insert_only=()):
+    """ INSERT ... ON CONFLICT (game_id, pitch_number) DO UPDATE of the columns from source
+    ('VALUES %s', or a SELECT), except the insert_only ones. Needs the unique index from
+    sql/004_pitch_game_pitch_number_key.sql.
+    """
+    set_clause = ', '.join(
+        f'{column} = EXCLUDED.{column}' for column in columns
+        if column not in ('game_id', 'pitch_number', *insert_only)
+    )
+    # pitches whose digest did not change are left alone, so they do not get a new row version.
+    # Positioning rows carry no digest and are always applied.
+    where_clause = (
+        'WHERE EXCLUDED.row_hash IS NULL OR pitch.row_hash IS DISTINCT FROM EXCLUDED.row_hash'
+        if 'row_hash' in columns else ''
+    )
+    return f"""
+        INSERT INTO pitch ({', '.join(columns)})
+        {source}
+        ON CONFLICT (game_id, pitch_number) DO UPDATE
+        SET {set_clause}
+        {where_clause};
+    """
+
+
+def upsert_rows(columns, rows, conn, insert_only=()):
+    """Upsert rows in pages of UPSERT_PAGE_SIZE without committing. Returns the number of rows written; errors are raised."""
+    cursor = conn.cursor()
+    sql = upsert_sql(columns, 'VALUES %s', insert_only)
+    written = 0
+    try:
+        for start in range(0, len(rows), UPSERT_PAGE_SIZE):
+            page = rows[start:start + UPSERT_PAGE_SIZE]
+            psycopg2.extras.execute_values(cursor, sql, page, page_size=len(page))
+            written += cursor.rowcount
+    finally:
+        cursor.close()
+    return written
+
+
+def write_rows(columns, rows, conn, insert_only=()):
+    """ Upsert rows and commit once. If that fails, each row is retried with its own commit so one bad
+    pitch does not drop the rest. Inside a file transaction, rows are written in savepoint batches instead.
+
+    Returns:
+        list: (position in rows, database error) for each row that could not be written.
+    """
+    if isinstance(conn, FileTransaction):
+        failed = []
+        for start in range(0, len(rows), SAVEPOINT_BATCH_SIZE):
+            batch_failed = write_batch_in_savepoint(
+                columns, rows[start:start + SAVEPOINT_BATCH_SIZE], conn, insert_only
             )
-        # commit the transaction
+            failed.extend((start + position, error) for position, error in batch_failed)
+        return failed
+
+    try:
+        written = upsert_rows(columns, rows, conn, insert_only)
         conn.commit()
-        print('updated row')
-    except psycopg2.DataError as e:
-        conn.rollback()
-        print(f"DataError inserting data: {e}")
-        print(f"Problematic values: {values}")
-    except Exception as e:
-        # rollback the transaction in case of error
+        print(f'upserted {written} of {len(rows)} rows')
+        return []
+    except psycopg2.Error as e:
         conn.rollback()
-        print(f"Error inserting data when game exists in DB: {e}")
-    finally:
-        cursor.close()
+        print(f'Error upserting rows, retrying row by row: {e}')
+    failed = []
+    for position, values in enumerate(rows):
+        try:
+            upsert_rows(columns, [values], conn, insert_only)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f'Error writing row: {e}')
+            print(f'Problematic values: {values}')
+            failed.append((position, e.diag.message_primary or str(e).strip()))
+    return failed
 
-def insert_data_game_dne(columns, values, placeholders_str, conn):
-    columns_str = ', '.join(columns)
+
+def write_batch_in_savepoint(columns, batch, conn, insert_only=()):
+    """ Upsert a batch under one savepoint. If it fails, retry each row under its own savepoint and skip the bad ones.
+    Returns write_rows' (position, error) list for the skipped rows, with positions within the batch.
+    """
+    try:
+        with savepoint(conn):
+            written = upsert_rows(columns, batch, conn, insert_only)
+        print(f'upserted {written} of {len(batch)} rows')
+        return []
+    except psycopg2.Error as e:
+        print(f'Error writing batch of {len(batch)} rows, retrying row by row: {e}')
+    failed = []
+    for position, values in enumerate(batch):
+        try:
+            with savepoint(conn):
+                upsert_rows(columns, [values], conn, insert_only)
+        except psycopg2.Error as e:
+            print(f'Error writing row: {e}')
+            print(f'Problematic values: {values}')
+            failed.append((position, e.diag.message_primary or str(e).strip()))
+    return failed
+
+
+def undefined_to_null(series):
+    """Null out the "Undefined" and "nan" strings TrackMan writes for missing values."""
+    return series.mask(series.eq('Undefined') | series.astype(str).str.lower().eq('nan'))
+
+
+def to_integer(series):
+    """Counts read next to blank cells come back as floats (ex: 3.0); store them as integers."""
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        return series.astype('Int64')
+    return series
+
+
+# (CSV header, pitch column, transform) for every value copied from a TrackMan file.
+# Player IDs come from the *_PLAYER_FIELDS below and game_id from determine_game_id.
+PITCH_COLUMN_MAP = (
+    ('HitTrajectoryZc2', 'hit_trajectory_zc2', None),
+    ('Date', 'date', None),
+    ('Time', 'time', None),
+    ('PAofInning', 'pa_of_inning', to_integer),
+    ('PitchofPA', 'pitch_of_pa', to_integer),
+    ('HitTrajectoryZc7', 'hit_trajectory_zc7', None),
+    ('HitTrajectoryZc8', 'hit_trajectory_zc8', None),
+    ('ThrowSpeed', 'throw_speed', None),
+    ('PopTime', 'pop_time', None),
+    ('ExchangeTime', 'exchange_time', None),
+    ('TimeToBase', 'time_to_base', None),
+    ('CatchPositionX', 'catch_position_x', None),
+    ('CatchPositionY', 'catch_position_y', None),
+    ('CatchPositionZ', 'catch_position_z', None),
+    ('ThrowPositionX', 'throw_position_x', None),
+    ('ThrowPositionY', 'throw_position_y', None),
+    ('ThrowPositionZ', 'throw_position_z', None),
+    ('BasePositionX', 'base_position_x', None),
+    ('BasePositionY', 'base_position_y', None),
+    ('BasePositionZ', 'base_position_z', None),
+    ('ThrowTrajectoryXc0', 'throw_trajectory_xc0', None),
+    ('ThrowTrajectoryXc1', 'throw_trajectory_xc1', None),
+    ('ThrowTrajectoryXc2', 'throw_trajectory_xc2', None),
+    ('ThrowTrajectoryYc0', 'throw_trajectory_yc0', None),
+    ('ThrowTrajectoryYc1', 'throw_trajectory_yc1', None),
+    ('ThrowTrajectoryYc2', 'throw_trajectory_yc2', None),
+    ('ThrowTrajectoryZc0', 'throw_trajectory_zc0', None),
+    ('ThrowTrajectoryZc1', 'throw_trajectory_zc1', None),
+    ('ThrowTrajectoryZc2', 'throw_trajectory_zc2', None),
+    ('Inning', 'inning', to_integer),
+    ('Outs', 'outs', to_integer),
+    ('Balls', 'balls', to_integer),
+    ('Strikes', 'strikes', to_integer),
+    ('OutsOnPlay', 'outs_on_play', to_integer),
+    ('RunsScored', 'runs_scored', to_integer),
+    ('Tilt', 'tilt', None),
+    ('y0', 'y0', None),
+    ('LocalDateTime', 'local_date_time', None),
+    ('PitchNo', 'pitch_number', to_integer),
+    ('RelSpeed', 'rel_speed', None),
+    ('VertRelAngle', 'vert_rel_angle', None),
+    ('HorzRelAngle', 'horz_rel_angle', None),
+    ('SpinRate', 'spin_rate', None),
+    ('SpinAxis', 'spin_axis', None),
+    ('RelHeight', 'rel_height', None),
+    ('RelSide', 'rel_side', None),
+    ('Extension', 'extension', None),
+    ('VertBreak', 'vert_break', None),
+    ('InducedVertBreak', 'induced_vert_break', None),
+    ('HorzBreak', 'horz_break', None),
+    ('PlateLocHeight', 'plate_loc_height', None),
+    ('PlateLocSide', 'plate_loc_side', None),
+    ('ZoneSpeed', 'zone_speed', None),
+    ('VertApprAngle', 'vert_appr_angle', None),
+    ('HorzApprAngle', 'horz_appr_angle', None),
+    ('ZoneTime', 'zone_time', None),
+    ('ExitSpeed', 'exit_speed', None),
+    ('Angle', 'angle', None),
+    ('Direction', 'direction', None),
+    ('HitSpinRate', 'hit_spin_rate', None),
+    ('PositionAt110X', 'position_at_110_x', None),
+    ('PositionAt110Y', 'position_at_110_y', None),
+    ('PositionAt110Z', 'position_at_110_z', None),
+    ('Distance', 'distance', None),
+    ('LastTrackedDistance', 'last_tracked_distance', None),
+    ('Bearing', 'bearing', None),
+    ('HangTime', 'hang_time', None),
+    ('pfxx', 'pfxx', None),
+    ('pfxz', 'pfxz', None),
+    ('x0', 'x0', None),
+    ('z0', 'z0', None),
+    ('vx0', 'vx0', None),
+    ('vy0', 'vy0', None),
+    ('vz0', 'vz0', None),
+    ('ax0', 'ax0', None),
+    ('ay0', 'ay0', None),
+    ('az0', 'az0', None),
+    ('EffectiveVelo', 'effective_velo', None),
+    ('MaxHeight', 'max_height', None),
+    ('MeasuredDuration', 'measured_duration', None),
+    ('SpeedDrop', 'speed_drop', None),
+    ('PitchLastMeasuredX', 'pitch_last_measured_x', None),
+    ('PitchLastMeasuredY', 'pitch_last_measured_y', None),
+    ('PitchLastMeasuredZ', 'pitch_last_measured_z', None),
+    ('ContactPositionX', 'contact_position_x', None),
+    ('ContactPositionY', 'contact_position_y', None),
+    ('ContactPositionZ', 'contact_position_z', None),
+    ('PitchTrajectoryXc0', 'pitch_trajectory_xc0', None),
+    ('PitchTrajectoryXc1', 'pitch_trajectory_xc1', None),
+    ('PitchTrajectoryXc2', 'pitch_trajectory_xc2', None),
+    ('PitchTrajectoryYc0', 'pitch_trajectory_yc0', None),
+    ('PitchTrajectoryYc1', 'pitch_trajectory_yc1', None),
+    ('PitchTrajectoryYc2', 'pitch_trajectory_yc2', None),
+    ('PitchTrajectoryZc0', 'pitch_trajectory_zc0', None),
+    ('PitchTrajectoryZc1', 'pitch_trajectory_zc1', None),
+    ('PitchTrajectoryZc2', 'pitch_trajectory_zc2', None),
+    ('HitSpinAxis', 'hit_spin_axis', None),
+    ('HitTrajectoryXc0', 'hit_trajectory_xc0', None),
+    ('HitTrajectoryXc1', 'hit_trajectory_xc1', None),
+    ('HitTrajectoryXc2', 'hit_trajectory_xc2', None),
+    ('HitTrajectoryXc3', 'hit_trajectory_xc3', None),
+    ('HitTrajectoryXc4', 'hit_trajectory_xc4', None),
+    ('HitTrajectoryXc5', 'hit_trajectory_xc5', None),
+    ('HitTrajectoryXc6', 'hit_trajectory_xc6', None),
+    ('HitTrajectoryXc7', 'hit_trajectory_xc7', None),
+    ('HitTrajectoryXc8', 'hit_trajectory_xc8', None),
+    ('HitTrajectoryYc0', 'hit_trajectory_yc0', None),
+    ('HitTrajectoryYc1', 'hit_trajectory_yc1', None),
+    ('HitTrajectoryYc2', 'hit_trajectory_yc2', None),
+    ('HitTrajectoryYc3', 'hit_trajectory_yc3', None),
+    ('HitTrajectoryYc4', 'hit_trajectory_yc4', None),
+    ('HitTrajectoryYc5', 'hit_trajectory_yc5', None),
+    ('HitTrajectoryYc6', 'hit_trajectory_yc6', None),
+    ('HitTrajectoryYc7', 'hit_trajectory_yc7', None),
+    ('HitTrajectoryYc8', 'hit_trajectory_yc8', None),
+    ('HitTrajectoryZc0', 'hit_trajectory_zc0', None),
+    ('HitTrajectoryZc1', 'hit_trajectory_zc1', None),
+    ('HitTrajectoryZc3', 'hit_trajectory_zc3', None),
+    ('HitTrajectoryZc4', 'hit_trajectory_zc4', None),
+    ('HitTrajectoryZc5', 'hit_trajectory_zc5', None),
+    ('HitTrajectoryZc6', 'hit_trajectory_zc6', None),
+    ('PitcherThrows', 'pitcher_throws', None),
+    ('PitcherTeam', 'pitcher_team_code', None),
+    ('BatterSide', 'batter_side', None),
+    ('BatterTeam', 'batter_team_code', None),
+    ('PitcherSet', 'pitcher_set', undefined_to_null),
+    ('CatcherThrows', 'catcher_throws', None),
+    ('Top/Bottom', 'top_or_bottom', None),
+    ('HitLaunchConfidence', 'hit_launch_confidence', None),
+    ('HitLandingConfidence', 'hit_landing_confidence', None),
+    ('TaggedPitchType', 'tagged_pitch_type', None),
+    ('AutoPitchType', 'auto_pitch_type', None),
+    ('PitchCall', 'pitch_call', None),
+    ('KorBB', 'k_or_bb', None),
+    ('TaggedHitType', 'tagged_hit_type', None),
+    ('PlayResult', 'play_result', None),
+    ('CatcherThrowCatchConfidence', 'catcher_throw_catch_confidence', None),
+    ('CatcherThrowReleaseConfidence', 'catcher_throw_release_confidence', None),
+    ('Notes', 'notes', None),
+    ('CatcherThrowLocationConfidence', 'catcher_throw_location_confidence', None),
+    ('PitchReleaseConfidence', 'pitch_release_confidence', None),
+    ('PitchLocationConfidence', 'pitch_location_confidence', None),
+    ('AutoHitType', 'auto_hit_type', None),
+    ('PitchMovementConfidence', 'pitch_movement_confidence', None),
+)
+
+PLAYERPOS_COLUMN_MAP = (
+    ('PitchNo', 'pitch_number', to_integer),
+    ('Date', 'date', None),
+    ('Time', 'time', None),
+    ('PitchCall', 'pitch_call', None),
+    ('PlayResult', 'play_result', undefined_to_null),
+    ('DetectedShift', 'detected_shift', None),
+    ('1B_PositionAtReleaseX', 'first_b_position_at_release_x', None),
+    ('1B_PositionAtReleaseZ', 'first_b_position_at_release_z', None),
+    ('2B_PositionAtReleaseX', 'second_b_position_at_release_x', None),
+    ('2B_PositionAtReleaseZ', 'second_b_position_at_release_z', None),
+    ('3B_PositionAtReleaseX', 'third_b_position_at_release_x', None),
+    ('3B_PositionAtReleaseZ', 'third_b_position_at_release_z', None),
+    ('SS_PositionAtReleaseX', 'ss_position_at_release_x', None),
+    ('SS_PositionAtReleaseZ', 'ss_position_at_release_z', None),
+    ('LF_PositionAtReleaseX', 'lf_position_at_release_x', None),
+    ('LF_PositionAtReleaseZ', 'lf_position_at_release_z', None),
+    ('CF_PositionAtReleaseX', 'cf_position_at_release_x', None),
+    ('CF_PositionAtReleaseZ', 'cf_position_at_release_z', None),
+    ('RF_PositionAtReleaseX', 'rf_position_at_release_x', None),
+    ('RF_PositionAtReleaseZ', 'rf_position_at_release_z', None),
+)
+# Pitch data columns a positioning file also carries. They are written for pitches its game's pitch data has
+# not delivered yet but never overwritten, since the derived tables are built from the pitch data. An inserted
+# pitch has no row_hash, so the pitch data delivery rewrites it; an existing pitch keeps its digest.
+PLAYERPOS_INSERT_ONLY_COLUMNS = ('date', 'time', 'pitch_call', 'play_result', 'row_hash')
+
+
+def map_columns(df, column_map, player_fields, players, game_id):
+    """ Apply a column map to the whole DataFrame at once.
+
+    Parameters:
+        df (dataframe): Dataframe containing the CSV's data.
+        column_map (tuple): (CSV header, pitch column, transform) tuples.
+        player_fields (tuple): The *_PLAYER_FIELDS the players map was resolved with.
+        players (dict): Map returned by resolve_players.
+        game_id: ID of the game the file belongs to.
+
+    Returns:
+        dataframe: One column per pitch column, with missing values as None, ready to load.
+    """
+    mapped = {}
+    for csv_column, db_column, transform in column_map:
+        mapped[db_column] = transform(df[csv_column]) if transform else df[csv_column]
+    for name_column, _, team_column, _, id_column in player_fields:
+        mapped[id_column] = pd.Series(
+            [players.get(key) for key in map(player_key, df[name_column], df[team_column])],
+            index=df.index,
+            dtype=object
+        )
+    mapped = pd.DataFrame(mapped, index=df.index)
+    mapped['game_id'] = game_id
+    # cast empty values to None so they are stored as NULL.
+    return mapped.astype(object).where(mapped.notna(), None)
+
+
+# TrackMan columns that are not measurements. Everything else in a column map is read as float64;
+# float32 would change the values stored in the double precision pitch columns (ex: 39.16657 -> 39.166568756).
+TRACKMAN_DTYPES = {
+    'PitchNo': 'Int32',
+    **dict.fromkeys(
+        ('Inning', 'Outs', 'Balls', 'Strikes', 'OutsOnPlay', 'RunsScored', 'PAofInning', 'PitchofPA'),
+        'Int16'
+    ),
+    **dict.fromkeys(
+        (
+            'HomeTeam', 'AwayTeam', 'PitcherTeam', 'BatterTeam', 'CatcherTeam', 'Pitcher', 'Batter', 'Catcher',
+            '1B_Name', '2B_Name', '3B_Name', 'SS_Name', 'LF_Name', 'CF_Name', 'RF_Name',
+            'PitcherThrows', 'BatterSide', 'CatcherThrows', 'PitcherSet', 'Top/Bottom', 'DetectedShift',
+            'TaggedPitchType', 'AutoPitchType', 'PitchCall', 'KorBB', 'TaggedHitType', 'PlayResult', 'AutoHitType',
+            'HitLaunchConfidence', 'HitLandingConfidence', 'CatcherThrowCatchConfidence',
+            'CatcherThrowReleaseConfidence', 'CatcherThrowLocationConfidence', 'PitchReleaseConfidence',
+            'PitchLocationConfidence', 'PitchMovementConfidence',
+        ),
+        'category'
+    ),
+    **dict.fromkeys(('Date', 'Time', 'LocalDateTime', 'Tilt', 'Notes'), str),
+}
+
+
+def get_trackman_schema(file_type, strict=True):
+    """ Return the read_csv options for a file type.
+    With strict=False, numeric columns are left to pandas' inference so parsing cannot fail on a bad value.
+
+    Returns:
+        3-tuple: (columns to read, {column: dtype}, {column: extra NA strings}).
+    """
+    if file_type == 'player positioning':
+        column_map, player_fields = PLAYERPOS_COLUMN_MAP, PLAYERPOS_PLAYER_FIELDS
+    else:
+        column_map, player_fields = PITCH_COLUMN_MAP, PITCH_PLAYER_FIELDS
+    columns = {'HomeTeam', 'AwayTeam', 'Date'}
+    columns.update(csv_column for csv_column, _, _ in column_map)
+    for name_column, hand_column, team_column, _, _ in player_fields:
+        columns.update(column for column in (name_column, hand_column, team_column) if column)
+    dtype = {column: TRACKMAN_DTYPES.get(column, 'float64') for column in columns}
+    if not strict:
+        dtype = {column: kind for column, kind in dtype.items() if kind in ('category', str)}
+    # only columns that are nulled out anyway; "Undefined" is a real value for ex. PitchCall.
+    na_values = {
+        csv_column: ['Undefined'] for csv_column, _, transform in column_map if transform is undefined_to_null
+    }
+    return columns, dtype, na_values
+
+
+def read_trackman_csv(file, file_type, chunksize=None):
+    """ Read only the columns we load, with explicit dtypes, so the frame stays numeric until it is mapped.
+    Falls back to pandas' type inference if a value does not fit the schema (ex: text in a count column).
+
+    With a chunksize, returns an iterator of DataFrames instead. A stream cannot be re-read, so
+    numeric columns are inferred per chunk rather than risk failing halfway through the file.
+    """
+    if chunksize:
+        columns, dtype, na_values = get_trackman_schema(file_type, strict=False)
+        return pd.read_csv(
+            file, usecols=lambda column: column in columns, dtype=dtype, na_values=na_values,
+            chunksize=chunksize, encoding='utf-8'
+        )
+
+    columns, dtype, na_values = get_trackman_schema(file_type)
+    try:
+        return pd.read_csv(file, usecols=lambda column: column in columns, dtype=dtype, na_values=na_values)
+    except (ValueError, TypeError) as e:
+        print(f'CSV does not match the TrackMan schema, reading it without one: {e}')
+        file.seek(0)
+        return pd.read_csv(file)
+
+
+def load_rows_bulk(columns, rows, conn, insert_only=()):
+    """ Stream a file's rows into a temporary staging table with COPY ... FROM STDIN, then upsert them into
+    pitch with one INSERT ... SELECT ... ON CONFLICT and commit once. If that fails, the transaction is
+    rolled back and the rows are upserted by write_rows instead, so a single bad pitch does not drop the
+    whole game. Returns write_rows' failed rows (none when the COPY succeeds).
+    """
     cursor = conn.cursor()
-    # insert data
+    columns_str = ', '.join(columns)
     try:
+        # in a file transaction the previous chunk's staging table has not been dropped yet.
+        cursor.execute('DROP TABLE IF EXISTS pitch_staging;')
         cursor.execute(
             f"""
-            INSERT INTO pitch ({columns_str})
-            VALUES ({placeholders_str});
+            CREATE TEMP TABLE pitch_staging ON COMMIT DROP AS
+            SELECT {columns_str} FROM pitch WITH NO DATA;
+            """
+        )
+        cursor.copy_expert(
+            f"""
+            COPY pitch_staging ({columns_str})
+            FROM STDIN WITH (FORMAT csv);
             """,
-            values
+            rows_to_csv_buffer(rows)
         )
+        cursor.execute(upsert_sql(columns, f'SELECT {columns_str} FROM pitch_staging', insert_only))
+        written = cursor.rowcount
         conn.commit()
-        print('inserted row')
+        print(f'copied {len(rows)} rows, upserted {written}')
+        return []
     except Exception as e:
-        # rollback the transaction in case of error
         conn.rollback()
-        print(f"Error inserting data when game previously DNE in DB: {e}")
+        print(f"Error copying data, falling back to row upserts: {e}")
+        return write_rows(columns, rows, conn, insert_only)
     finally:
         cursor.close()
 
 
-def validate_type(data):
-    return data if isinstance(data, str) else None
-
-def construct_set_clause(columns):
-    set_clause = ''
-    for i in range(len(columns)):
-        set_clause += (f'{columns[i]} = %s, ')
-    set_clause = set_clause[:-2] # remove final ', '
-    return set_clause  
-
+def rows_to_csv_buffer(rows):
+    """Serialize value tuples into an in-memory CSV file for COPY. None and NaN become NULL."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for values in rows:
+        writer.writerow(
+            ['' if val is None or (isinstance(val, float) and math.isnan(val)) else val for val in values]
+        )
+    buffer.seek(0)
+    return buffer
+
+
+# (name column, handedness column, team column, player type, pitch column) for every player referenced by a file.
+PITCH_PLAYER_FIELDS = (
+    ('Pitcher', 'PitcherThrows', 'PitcherTeam', 'pitcher', 'pitcher_id'),
+    ('Batter', 'BatterSide', 'BatterTeam', 'batter', 'batter_id'),
+    ('Catcher', 'CatcherThrows', 'CatcherTeam', 'catcher', 'catcher_id'),
+)
+PLAYERPOS_PLAYER_FIELDS = tuple(
+    (f'{position}_Name', None, 'PitcherTeam', 'defense', f'{column_prefix}_player_id')
+    for position, column_prefix in (
+        ('1B', 'first_b'), ('2B', 'second_b'), ('3B', 'third_b'),
+        ('SS', 'ss'), ('LF', 'lf'), ('CF', 'cf'), ('RF', 'rf'),
+    )
+)
 
-def get_or_insert_player(player_name, handedness, team_code, player_type, conn):
-    """ Get the player ID from the player name, handedness, and team. Insert the player if they do not exist. """
 
-    # Edge case: player_name is null (not useful to us)
-    # Handle both string "nan" and pandas NaN (float)
-    if not player_name:
-        return None
-    if isinstance(player_name, str) and player_name.lower() == "nan":
+def clean_identity_value(val):
+    """Return None for the values TrackMan uses for a missing name, team or handedness."""
+    if val is None or (isinstance(val, float) and math.isnan(val)):
         return None
-    if isinstance(player_name, float) and pd.isna(player_name):
+    if isinstance(val, str) and (val == "" or val == "Undefined" or val.lower() == "nan"):
         return None
+    return val
 
-    # Edge case: plyaer_type is not a string
-    if not isinstance(player_type, str):
-        raise Exception("paramter player_type is not of type string")
-    
-    # Edge case: handedness is string "Undefined"
-    if handedness == "Undefined":
-        handedness = None
-    
-    team_id = get_or_insert_team_id(team_code, conn)
-    player_type = player_type.lower()
-    
+
+def player_key(player_name, team_code):
+    """Key used to look up a player ID in the map returned by resolve_players."""
+    return (clean_identity_value(player_name), clean_identity_value(team_code))
+
+
+def resolve_players(df, player_fields, conn):
+    """ Get or insert every player referenced by a file with a handful of set-based statements.
+
+    Collects the (name, team_code, player_type, handedness) appearances for the whole file,
+    inserts missing teams, looks up existing players in one query, and inserts the new
+    ones in one more. Each player's final handedness is reconciled for the whole file at once
+    (see reconcile_handedness) and every change is written with a single UPDATE.
+
+    Parameters:
+        df (dataframe): Dataframe containing the CSV's data.
+        player_fields (tuple): PITCH_PLAYER_FIELDS or PLAYERPOS_PLAYER_FIELDS.
+        conn (connection): PostgreSQL connection object.
+
+    Returns:
+        dict: {(player_name, team_code): player_id}. Look up rows with player_key().
+            None if the players could not be resolved.
+    """
+    frames = []
+    for name_column, hand_column, team_column, player_type, _ in player_fields:
+        people = pd.DataFrame({
+            'player_name': df[name_column].map(clean_identity_value),
+            'team_code': df[team_column].map(clean_identity_value),
+            'handedness': df[hand_column].map(clean_identity_value) if hand_column else None,
+        })
+        frames.append(people[people['player_name'].notna()].assign(player_type=player_type))
+    # one field after another, each in file order, which is the order handedness is merged in.
+    appearances = pd.concat(frames, ignore_index=True)
+    if appearances.empty:
+        return {}
+    appearances = appearances.astype(object).where(appearances.notna(), None)
+
+    cursor = conn.cursor()
     try:
-        cursor = conn.cursor()
-        # check if the player already exists
-        cursor.execute(
-            """
-            SELECT player_id, player_pitching_handedness, player_batting_handedness
-            FROM player 
-            WHERE player_name = %s AND team_id = %s;
-            """,
-            (player_name, team_id)
-        )
-        result = cursor.fetchone()
-        if result:
-            player_id = result[0]
-            existing_pitch_hand = result[1]
-            existing_bat_hand = result[2]
-            # player might be a switch hitter or have empty an empty batting/pitching field.
-            # update accordingly:
-            if player_type == "batter":
-                handle_update_batting_handedness(player_id, handedness, existing_bat_hand, conn)
-            elif player_type == "pitcher":
-                handle_update_pitching_handedness(player_id, handedness, existing_pitch_hand, conn)
-            return player_id
-        else:
-            # insert the player if they do not exist
-            if player_type == "batter":
-                cursor.execute(
-                    """
-                    INSERT INTO player (player_name, player_batting_handedness, team_id) 
-                    VALUES (%s, %s, %s) RETURNING player_id;
-                    """,
-                    (player_name, handedness, team_id)
-                )
-            elif player_type == "pitcher":
-                cursor.execute(
-                    """
-                    INSERT INTO player (player_name, player_pitching_handedness, team_id) 
-                    VALUES (%s, %s, %s) RETURNING player_id;
-                    """,
-                    (player_name, handedness, team_id)
-                )
-            else:
-                cursor.execute(
-                    """
-                    INSERT INTO player (player_name, team_id)
-                    VALUES (%s, %s) RETURNING player_id;
-                    """,
-                    (player_name, team_id)
-                )
-            conn.commit()
-            result = cursor.fetchone()
-            return result[0]
+        # teams already in the reference map exist; only unknown codes need the insert.
+        team_codes = sorted(set(appearances['team_code'].dropna()) - set(team_ids))
+        if team_codes:
+            insert_missing_teams(team_codes, cursor)
+
+        keys = list(dict.fromkeys(zip(appearances['player_name'], appearances['team_code'])))
+        existing = select_players(keys, cursor)
+        hands = reconcile_handedness(appearances, existing)
+        players = {key: existing.get(key, (None,))[0] for key in keys}
+
+        new_players = [(name, team_code, *hands[(name, team_code)]) for (name, team_code), player_id in players.items() if player_id is None]
+        inserted = {}
+        if new_players:
+            inserted = insert_players(new_players, cursor)
+            players.update(inserted)
+            # another ingest may have inserted some of them first; pick those up.
+            missing = [key for key, player_id in players.items() if player_id is None]
+            for key, (player_id, _, _) in select_players(missing, cursor).items():
+                players[key] = player_id
+
+        changes = [
+            (player_id, *hands[key])
+            for key, player_id in players.items()
+            if player_id is not None and key not in inserted
+            and existing.get(key, (None, None, None))[1:] != hands[key]
+        ]
+        if changes:
+            update_players_handedness(changes, cursor)
+        conn.commit()
+        return players
     except Exception as e:
-        print(f'Error getting or inserting player id: {e}')
+        conn.rollback()
+        print(f'Error resolving player ids: {e}')
         return None
+    finally:
+        cursor.close()
 
 
-def handle_update_batting_handedness(id, hand, existing_hand, conn):
-    try:
-        cursor = conn.cursor()
-        if isinstance(existing_hand, str) and existing_hand != hand:
-            hand = "Switch"
-        if not existing_hand or (isinstance(existing_hand, str) and (existing_hand.lower() == "nan" or hand == 'Switch')):
-            # batter_handedness DNE; insert it.
-            cursor.execute(
-                """
-                UPDATE player
-                SET player_batting_handedness = %s
-                WHERE player_id = %s;
-                """,
-                (hand, id)
-            )
-            conn.commit()
-    except Exception as e:
-        print(f'Error handling updating batter handedness: {e}')
+def insert_missing_teams(team_codes, cursor):
+    """Insert the team codes that are not in the team table yet (see get_or_insert_team_id)."""
+    psycopg2.extras.execute_values(
+        cursor,
+        """
+        INSERT INTO team (team_code)
+        SELECT codes.team_code
+        FROM (VALUES %s) AS codes (team_code)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM team
+            WHERE team.team_code = codes.team_code
+        )
+        ON CONFLICT DO NOTHING;
+        """,
+        [(team_code,) for team_code in team_codes],
+        page_size=len(team_codes)
+    )
 
 
-def handle_update_pitching_handedness(id, hand, existing_hand, conn):
-    try:
-        cursor = conn.cursor()
-        if not existing_hand or (isinstance(existing_hand, str) and (existing_hand.lower() == "nan")):
-            cursor.execute(
-                """
-                UPDATE player
-                SET player_pitching_handedness = %s
-                WHERE player_id = %s;
-                """,
-                (hand, id)
-            )
-            conn.commit()
-    except Exception as e:
-        print(f'Error handling updating batter handedness: {e}')
+def select_players(keys, cursor):
+    """Return {(player_name, team_code): (player_id, pitching hand, batting hand)} for players that exist."""
+    if not keys:
+        return {}
+    rows = psycopg2.extras.execute_values(
+        cursor,
+        """
+        SELECT keys.player_name, keys.team_code, player.player_id,
+            player.player_pitching_handedness, player.player_batting_handedness
+        FROM (VALUES %s) AS keys (player_name, team_code)
+        LEFT JOIN team ON team.team_code = keys.team_code
+        JOIN player ON player.player_name = keys.player_name
+            AND (player.team_id = team.team_id OR (player.team_id IS NULL AND team.team_id IS NULL));
+        """,
+        keys,
+        page_size=len(keys),
+        fetch=True
+    )
+    existing = {}
+    for name, team_code, player_id, pitch_hand, bat_hand in rows:
+        existing.setdefault((name, team_code), (player_id, pitch_hand, bat_hand))
+    return existing
+
+
+def insert_players(new_players, cursor):
+    """Insert (name, team_code, pitching hand, batting hand) tuples. Returns {(player_name, team_code): player_id}."""
+    rows = psycopg2.extras.execute_values(
+        cursor,
+        """
+        WITH inserted AS (
+            INSERT INTO player (player_name, team_id, player_pitching_handedness, player_batting_handedness)
+            SELECT new_players.player_name, team.team_id, new_players.pitch_hand, new_players.bat_hand
+            FROM (VALUES %s) AS new_players (player_name, team_code, pitch_hand, bat_hand)
+            LEFT JOIN team ON team.team_code = new_players.team_code
+            ON CONFLICT DO NOTHING
+            RETURNING player_id, player_name, team_id
+        )
+        SELECT inserted.player_name, team.team_code, inserted.player_id
+        FROM inserted
+        LEFT JOIN team ON team.team_id = inserted.team_id;
+        """,
+        new_players,
+        page_size=len(new_players),
+        fetch=True
+    )
+    return {(name, team_code): player_id for name, team_code, player_id in rows}
+
+
+def reconcile_handedness(appearances, existing):
+    """ Compute every player's final (pitching, batting) handedness for a file with one groupby per role,
+    going through the appearances in order, starting from the stored values. A hand is known unless it
+    is missing, empty, "nan" or "Undefined".
+    - batting: the first known hand, unless a later known hand differs from it (then "Switch").
+    - pitching: the first known hand; if there is none, the last value seen.
+
+    Parameters:
+        appearances (dataframe): player_name, team_code, handedness and player_type, in file order.
+        existing (dict): Map returned by select_players.
+
+    Returns:
+        dict: {(player_name, team_code): (pitching hand, batting hand)} for every player in appearances.
+    """
+    hands = {
+        key: existing.get(key, (None, None, None))[1:]
+        for key in zip(appearances['player_name'], appearances['team_code'])
+    }
+    for player_type, stored_index in (('pitcher', 1), ('batter', 2)):
+        role = appearances.loc[appearances['player_type'] == player_type, ['player_name', 'team_code', 'handedness']]
+        if role.empty:
+            continue
+        # seed each player's group with the stored value so it is merged first.
+        players = role[['player_name', 'team_code']].drop_duplicates()
+        stored = [existing.get(key, (None, None, None))[stored_index] for key in players.itertuples(index=False, name=None)]
+        role = pd.concat([players.assign(handedness=stored), role], ignore_index=True)
+        hand = role['handedness']
+        known = hand.notna() & hand.ne('') & ~hand.astype(str).str.lower().isin(('nan', 'undefined'))
+        group_ids = role.groupby(['player_name', 'team_code'], dropna=False, sort=False).ngroup()
+        by_player = lambda series: series.groupby(group_ids, sort=True)
+        if player_type == 'batter':
+            first = by_player(hand.where(known)).transform('first')
+            switched = by_player(known & hand.ne(first)).any()
+            final = by_player(first).first().mask(switched, 'Switch')
+        else:
+            is_last = by_player(hand).cumcount(ascending=False) == 0
+            final = by_player(hand.where(known)).first().fillna(by_player(hand.where(is_last)).first())
+        # ngroup numbers the players in order of first appearance, the same order as `players`.
+        for key, value in zip(players.itertuples(index=False, name=None), final.reindex(range(len(players)))):
+            value = None if pd.isna(value) else value
+            hands[key] = (value, hands[key][1]) if player_type == 'pitcher' else (hands[key][0], value)
+    return hands
+
+
+def update_players_handedness(changes, cursor):
+    """Apply (player_id, pitching hand, batting hand) tuples with one UPDATE ... FROM (VALUES ...)."""
+    psycopg2.extras.execute_values(
+        cursor,
+        """
+        UPDATE player
+        SET player_pitching_handedness = changes.pitch_hand,
+            player_batting_handedness = changes.bat_hand
+        FROM (VALUES %s) AS changes (player_id, pitch_hand, bat_hand)
+        WHERE player.player_id = changes.player_id::uuid;
+        """,
+        changes,
+        page_size=len(changes)
+    )
 
 
 def get_or_insert_team_id(team_code, conn):
@@ -386,31 +2057,24 @@ def get_or_insert_team_id(team_code, conn):
     Will not fill in "league" (North or South) or "home_ballpark_id" fields.
     """
     cursor = conn.cursor()
+    try:
+        return get_team_id(team_code, cursor)
+    except KeyError:
+        pass
+    # insert team if it does not exist. The next reload of the reference map picks it up.
     cursor.execute(
         """
-        SELECT team_id FROM team
-        WHERE team_code = %s;
+        INSERT INTO team (team_code)
+        VALUES (%s) RETURNING team_id;
         """,
         (team_code,)
     )
+    conn.commit()
     result = cursor.fetchone()
-    if result:
-        return result[0]
-    else:
-        # insert team if it does not exist
-        cursor.execute(
-            """
-            INSERT INTO team (team_code)
-            VALUES (%s) RETURNING team_id;
-            """,
-            (team_code,)
-        )
-        conn.commit()
-        result = cursor.fetchone()
-        return result[0]
-    
+    return result[0]
+
 
-def determine_game_id(file_name, conn, df, game, s3):
+def determine_game_id(file_name, conn, df, game, s3, force=False):
     """ Determine the appropriate game ID for the file.
     If the game does not already have an associated ID, 
     this function will create a new row in 'game'.
@@ -420,6 +2084,9 @@ def determine_game_id(file_name, conn, df, game, s3):
         conn (connection): PostgreSQL connection object.
         df (dataframe): Dataframe containing the CSV's data.
         game (dict): Contains crucial information about the game.
+        force (bool): Reuse the existing game's ID even if it was already ingested, so its rows are
+            replaced by this file's (ex: a backfill --force after a schema change). An unverified file
+            still never replaces a verified game.
 
     Returns:
         int: The game ID the new game is associated with; 
@@ -431,15 +2098,8 @@ def determine_game_id(file_name, conn, df, game, s3):
     try:
         cursor = conn.cursor()
         # get home_team and away_team based on ids.
-        team_id_query = """
-            SELECT team_id FROM team
-            WHERE team_code = %s;
-        """
-        cursor.execute(team_id_query, (game['home_team'],))
-        home_team_id = cursor.fetchone()[0]
-
-        cursor.execute(team_id_query, (game['away_team'],))
-        visiting_team_id = cursor.fetchone()[0]
+        home_team_id = get_team_id(game['home_team'], cursor)
+        visiting_team_id = get_team_id(game['away_team'], cursor)
         # query the databse to check if this game already exists.
         cursor.execute(
             """
@@ -472,6 +2132,11 @@ def determine_game_id(file_name, conn, df, game, s3):
                 # We assume that all player positioning data is unverified, so we can insert it regardless
                 # of whether the existing game is verified or not.
                 game_id = existing_game_id
+            elif game['verified'] == existing_is_verified and (
+                    force or not is_game_ingested(existing_game_id, game['file_type'], conn)):
+                # An earlier load of this game did not finish (ex: a row or table could not be written), so the
+                # retry fills it in; a forced file reloads it. Unverified data never replaces verified data.
+                game_id = existing_game_id
         else:
             cursor.execute(
                 """
@@ -530,15 +2195,14 @@ def get_game_info(file_name, df, conn, s3):
         game['verified'] = False
     else:
         game['verified'] = True
-    if len(file_name_details[2]) > 1 and file_name_details[2].endswith('playerpositioning_FHC.csv'):
-        game['file_type'] = 'player positioning'
+    game['file_type'] = get_file_type(file_name)
+    if game['file_type'] == 'player positioning':
         home_and_away = get_player_positioning_teams(file_name, s3)
         if not home_and_away:
             # Could not find corresponding pitch data in S3 for given player positioning data. Abort insertion.
             return None
         game['home_team'], game['away_team'] = home_and_away
     else:
-        game['file_type'] = 'pitch data'
         # only pitch data CSVs contain fields about home team and away team (for whatever reason)
         game['home_team'] = df['HomeTeam'][0][:3] # Some teams may have excess chars, like YOR_REV2 => only get first 3
         game['away_team'] = df['AwayTeam'][0][:3]
@@ -546,23 +2210,71 @@ def get_game_info(file_name, df, conn, s3):
     game['date'] = get_date_from_df(df)
 
     # query database for ids based on names.
-    ballpark_id_query = """
-        SELECT ballpark_id FROM ballpark
-        WHERE ballpark_name = %s;
-    """
-    cursor.execute(ballpark_id_query, (game['ballpark'],))
-    game['ballpark_id'] = cursor.fetchone()[0]
+    game['ballpark_id'] = get_ballpark_id(game['ballpark'], cursor)
+    game['home_team_id'] = get_team_id(game['home_team'], cursor)
+    game['away_team_id'] = get_team_id(game['away_team'], cursor)
+
+    return game
 
-    team_id_query = """
-        SELECT team_id FROM TEAM
-        WHERE team_code = %s;
+
+def get_team_id(team_code, cursor):
+    """Return the team_id for a team code from the reference map. Raises KeyError if the team does not exist."""
+    if team_code not in team_ids:
+        load_reference_ids(cursor)
+    if team_code not in team_ids:
+        raise KeyError(f'no team with team_code {team_code}')
+    return team_ids[team_code]
+
+
+def get_ballpark_id(ballpark_name, cursor):
+    """Return the ballpark_id for a ballpark name from the reference map. Raises KeyError if the ballpark does not exist."""
+    if ballpark_name not in ballpark_ids:
+        load_reference_ids(cursor)
+    if ballpark_name not in ballpark_ids:
+        raise KeyError(f'no ballpark named {ballpark_name}')
+    return ballpark_ids[ballpark_name]
+
+
+def load_reference_ids(cursor):
+    """(Re)load the team and ballpark reference maps with one query each."""
+    global team_ids, ballpark_ids
+    cursor.execute("SELECT team_code, team_id FROM team;")
+    loaded_team_ids = dict(cursor.fetchall())
+    cursor.execute("SELECT ballpark_name, ballpark_id FROM ballpark;")
+    loaded_ballpark_ids = dict(cursor.fetchall())
+    # swap in whole maps so other workers never see a half-loaded one.
+    team_ids, ballpark_ids = loaded_team_ids, loaded_ballpark_ids
+
+
+def forget_reference_ids():
+    """Empty the reference maps, which may hold ids from a transaction that was rolled back."""
+    global team_ids, ballpark_ids
+    team_ids, ballpark_ids = {}, {}
+
+
+def get_file_type(file_name):
+    """Return 'player positioning' or 'pitch data' based on the file's name."""
+    file_name_details = file_name.split('-')
+    if len(file_name_details[2]) > 1 and file_name_details[2].endswith('playerpositioning_FHC.csv'):
+        return 'player positioning'
+    return 'pitch data'
+
+
+def get_game_file_key(file_name):
+    """ The game a TrackMan file belongs to, from its name: (date, ballpark, daily game number).
+    A name that does not follow that pattern is its own game.
     """
-    cursor.execute(team_id_query, (game['home_team'],))
-    game['home_team_id'] = cursor.fetchone()[0]
-    cursor.execute(team_id_query, (game['away_team'],))
-    game['away_team_id'] = cursor.fetchone()[0]
+    file_name_details = file_name.split('-', 2)
+    if len(file_name_details) < 3 or not file_name_details[2]:
+        return (file_name,)
+    date, ballpark, rest = file_name_details
+    return (date, ballpark, rest[0])
 
-    return game
+
+def game_file_order(file_name):
+    """Sort key for a game's files: unverified pitch data, then verified pitch data, then player positioning."""
+    positioning = len(get_game_file_key(file_name)) == 3 and get_file_type(file_name) == 'player positioning'
+    return (positioning, 'unverified' not in file_name, file_name)
 
 
 def get_player_positioning_teams(file_name, s3):
@@ -590,33 +2302,50 @@ def get_player_positioning_teams(file_name, s3):
     key_prefixes = [None] * 2
     key_prefixes[0] = '/'.join([year, month, day, 'CSV'])
     key_prefixes[1] = '/'.join([day_after_year, day_after_month, day_after_day, 'CSV'])
-    file = None
+    # in order of preference: verified pitching data first, then unverified, for each folder.
+    candidate_keys = [
+        '/'.join([key_prefix, pitch_file_name])
+        for key_prefix in key_prefixes
+        for pitch_file_name in (verified_pitch_file_name, unverified_pitch_file_name)
+    ]
+
+    # probe every candidate at once; each probe only downloads the start of the file.
+    with ThreadPoolExecutor(max_workers=len(candidate_keys)) as executor:
+        probes = list(executor.map(lambda key: probe_csv_teams(bucket, key, s3), candidate_keys))
+
     exception_message = None
+    for teams, exception in probes:
+        if teams:
+            return teams
+        exception_message = exception
+    print(exception_message)
+    return None
 
-    for key_prefix in key_prefixes:
-        try:
-            # First, try to retrieve verified pitching data file.
-            verified_file_path = '/'.join([key_prefix, verified_pitch_file_name])
-            file = s3.get_object(Bucket=bucket, Key=verified_file_path)
-            break
-        except Exception:
-            try:
-                # Then, if unsuccessful, try to retrieve unverified pitching data file.
-                unverified_file_path = '/'.join([key_prefix, unverified_pitch_file_name])
-                file = s3.get_object(Bucket=bucket, Key=unverified_file_path)
-                break
-            except Exception as e:
-                exception_message = e
-    
-    if not file:
-        print(exception_message)
-        return None
-    
-    file_content = file['Body'].read().decode('utf-8')
-    csv = StringIO(file_content) # Convert file from str. to csv
-    df = pd.read_csv(csv)
 
-    return (df['HomeTeam'][0][:3], df['AwayTeam'][0][:3])
+def probe_csv_teams(bucket, key, s3):
+    """ Read (HomeTeam, AwayTeam) from the first data row of a pitch CSV.
+
+    Returns:
+        2-tuple: ((HomeTeam, AwayTeam), None), or (None, exception) if the file could not be read.
+    """
+    try:
+        return read_csv_head_teams(bucket, key, s3), None
+    except Exception as e:
+        return None, e
+
+
+def read_csv_head_teams(bucket, key, s3, head_bytes=16384):
+    """ Get the header and first data row with a ranged GET, only downloading the whole file
+    if the first row is longer than head_bytes.
+    """
+    file = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{head_bytes - 1}')
+    content = file['Body'].read()
+    if len(content) >= head_bytes and content.count(b'\n') < 2:
+        content = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    # the range may end partway through a multi-byte character; it is past the lines we need.
+    header, first_row = list(csv.reader(content.decode('utf-8', errors='ignore').splitlines()[:2]))
+    row = dict(zip(header, first_row))
+    return (row['HomeTeam'][:3], row['AwayTeam'][:3])
 
 
 def get_day_after(year, month, day):
@@ -0,0 +1,172 @@
+""" Pitch and batted ball features derived from TrackMan's trajectory coefficients.
+
+TrackMan fits both flights in one field frame, in feet: x from the back tip of home plate out toward the
+mound and center field, y toward the first base side (the same direction as PlateLocSide) and z up.
+A pitch is fit with one quadratic per axis in the time since release,
+    x(t) = xc0 + xc1 t + xc2 t^2 (and the same for y and z),
+so xc0 is around 50 ft and xc1 around -130 ft/s. A batted ball's flight is fit the same way with
+degree 8 polynomials (hit_trajectory_*c0..c8) in the time since contact. The functions here evaluate
+those polynomials for every pitch of a file at once with NumPy; a pitch without coefficients gets NaN
+features.
+"""
+import numpy as np
+import pandas as pd
+
+
+# x of the front edge of home plate, where a pitch "crosses the plate" (PlateLocSide/PlateLocHeight).
+PLATE_X = 17 / 12
+# x the break is measured from: deviation at the plate from the straight line the pitch was on at 40 ft.
+BREAK_X = 40.0
+GRAVITY = 32.174  # ft/s^2
+
+# Batted balls are followed on a grid of HIT_TIME_STEP seconds for up to HIT_MAX_TIME seconds.
+HIT_TIME_STEP = 0.01
+HIT_MAX_TIME = 12.0
+
+COEFFICIENT_COLUMNS = tuple(f'pitch_trajectory_{axis}c{power}' for axis in 'xyz' for power in range(3))
+
+# Features stored on the pitch row (sql/005_pitch_trajectory_features.sql). Times in s, positions in ft,
+# velocities in ft/s (in the field frame) and breaks in inches, with the side toward first base.
+FEATURE_COLUMNS = (
+    'trajectory_plate_time',
+    'trajectory_plate_side',
+    'trajectory_plate_height',
+    'trajectory_plate_vx',
+    'trajectory_plate_vy',
+    'trajectory_plate_vz',
+    'trajectory_horz_break_40',
+    'trajectory_vert_break_40',
+    'trajectory_induced_vert_break_40',
+)
+
+HIT_COEFFICIENT_COLUMNS = tuple(f'hit_trajectory_{axis}c{power}' for axis in 'xyz' for power in range(9))
+
+# Columns of the batted_ball table (sql/006_batted_ball.sql). Positions and distances in ft, the spray
+# angle in degrees from the center field line (positive toward first base) and times in s.
+BATTED_BALL_COLUMNS = ('landing_x', 'landing_y', 'distance', 'spray_angle', 'apex_height', 'hang_time')
+
+
+def coefficients(frame):
+    """Return the coefficients of a frame with COEFFICIENT_COLUMNS as an array of shape (3 axes, 3 powers, pitches)."""
+    values = frame[list(COEFFICIENT_COLUMNS)].astype('float64').to_numpy()
+    return values.T.reshape(3, 3, len(frame))
+
+
+def time_at_x(coef, x):
+    """ Time after release at which each pitch reaches x (a scalar or one value per pitch); NaN if it never does.
+    Uses the root of xc2 t^2 + xc1 t + (xc0 - x) = 0 written so it stays exact when xc2 is 0.
+    """
+    c0, c1, c2 = coef[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        discriminant = c1 * c1 - 4 * c2 * (c0 - x)
+        t = 2 * (c0 - x) / (np.sqrt(discriminant) - c1)
+    return np.where(t >= 0, t, np.nan)
+
+
+def position_at(coef, t):
+    """Position (x, y, z) of each pitch at time t, as an array of shape (3, pitches)."""
+    return coef[:, 0] + coef[:, 1] * t + coef[:, 2] * t * t
+
+
+def velocity_at(coef, t):
+    """Velocity (vx, vy, vz) of each pitch at time t, as an array of shape (3, pitches)."""
+    return coef[:, 1] + 2 * coef[:, 2] * t
+
+
+def state_at_x(coef, x):
+    """Time, position and velocity of each pitch where it reaches x."""
+    t = time_at_x(coef, x)
+    return t, position_at(coef, t), velocity_at(coef, t)
+
+
+def break_at_plate(coef, from_x=BREAK_X):
+    """ Horizontal and vertical break in inches: how far each pitch ends up at the plate from where it
+    would have been had it kept going straight from from_x. The induced vertical break leaves gravity out.
+
+    Returns:
+        3-tuple: (horizontal break, vertical break, induced vertical break), one array each.
+    """
+    t_from, start, velocity = state_at_x(coef, from_x)
+    t_plate, plate, _ = state_at_x(coef, PLATE_X)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        straight = start + velocity * ((PLATE_X - start[0]) / velocity[0])
+    horz_break, vert_break = (plate[1:] - straight[1:]) * 12
+    gravity_drop = GRAVITY * (t_plate - t_from) ** 2 / 2 * 12
+    return horz_break, vert_break, vert_break + gravity_drop
+
+
+def trajectory_features(frame):
+    """ Compute FEATURE_COLUMNS for every pitch of a frame holding COEFFICIENT_COLUMNS (ex: from map_columns).
+
+    Returns:
+        dataframe: One column per feature, indexed like frame, with missing values as None.
+    """
+    coef = coefficients(frame)
+    plate_time, plate, plate_velocity = state_at_x(coef, PLATE_X)
+    horz_break, vert_break, induced_vert_break = break_at_plate(coef)
+    features = pd.DataFrame(
+        dict(zip(FEATURE_COLUMNS, (
+            plate_time, plate[1], plate[2], *plate_velocity, horz_break, vert_break, induced_vert_break,
+        ))),
+        index=frame.index
+    ).replace([np.inf, -np.inf], np.nan)
+    return features.astype(object).where(features.notna(), None)
+
+
+def hit_coefficients(frame):
+    """Return the coefficients of a frame with HIT_COEFFICIENT_COLUMNS as an array of shape (3 axes, 9 powers, balls)."""
+    values = frame[list(HIT_COEFFICIENT_COLUMNS)].astype('float64').to_numpy()
+    return values.T.reshape(3, 9, len(frame))
+
+
+def evaluate(coef, t):
+    """ Evaluate one polynomial per ball (coef: (powers, balls)) at t, with Horner's rule.
+    t is one time per ball, or a column of times (shape (times, 1)) to evaluate every ball at each of them.
+    """
+    value = coef[-1] * np.ones_like(t)
+    for power in range(coef.shape[0] - 2, -1, -1):
+        value = value * t + coef[power]
+    return value
+
+
+def landing_time(z_coef):
+    """ Time after contact at which each ball first comes down to the ground (z = 0), found on the time
+    grid and refined by bisection. NaN if it does not land within HIT_MAX_TIME.
+    """
+    grid = np.arange(0, HIT_MAX_TIME + HIT_TIME_STEP / 2, HIT_TIME_STEP)[:, None]
+    heights = evaluate(z_coef, grid)
+    grounded = heights[1:] <= 0
+    lands = grounded.any(axis=0)
+    step = grounded.argmax(axis=0)
+    low, high = grid[step, 0], grid[step + 1, 0]
+    for _ in range(30):
+        middle = (low + high) / 2
+        above = evaluate(z_coef, middle) > 0
+        low = np.where(above, middle, low)
+        high = np.where(above, high, middle)
+    return np.where(lands, high, np.nan), grid, heights
+
+
+def batted_ball_features(frame):
+    """ Solve the hit trajectory of every batted ball in a frame holding HIT_COEFFICIENT_COLUMNS
+    (ex: from map_columns): landing point, distance, spray angle, apex height and hang time.
+
+    Returns:
+        dataframe: BATTED_BALL_COLUMNS for the rows with a hit trajectory, indexed like frame, with
+            missing values as None.
+    """
+    frame = frame[frame[list(HIT_COEFFICIENT_COLUMNS)].notna().all(axis=1)]
+    coef = hit_coefficients(frame)
+    hang_time, grid, heights = landing_time(coef[2])
+    landing_x, landing_y = evaluate(coef[0], hang_time), evaluate(coef[1], hang_time)
+    # the apex is taken on the time grid; with 0.01 s steps it is off by well under 0.01 ft.
+    in_flight = grid <= np.where(np.isnan(hang_time), 0, hang_time)
+    apex_height = np.where(in_flight, heights, -np.inf).max(axis=0, initial=-np.inf)
+    features = pd.DataFrame(
+        dict(zip(BATTED_BALL_COLUMNS, (
+            landing_x, landing_y, np.hypot(landing_x, landing_y), np.degrees(np.arctan2(landing_y, landing_x)),
+            np.where(np.isnan(hang_time), np.nan, apex_height), hang_time,
+        ))),
+        index=frame.index
+    )
+    return features.astype(object).where(features.notna(), None)
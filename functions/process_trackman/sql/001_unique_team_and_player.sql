@@ -0,0 +1,8 @@
+-- Lets process_trackman resolve a whole file's teams and players with INSERT ... ON CONFLICT DO NOTHING
+-- without two concurrent ingests creating the same team or player twice.
+-- Existing duplicates must be merged before these indexes can be built.
+CREATE UNIQUE INDEX IF NOT EXISTS team_team_code_key
+    ON team (team_code);
+
+CREATE UNIQUE INDEX IF NOT EXISTS player_player_name_team_id_key
+    ON player (player_name, team_id);
@@ -0,0 +1,13 @@
+-- Ledger of TrackMan files process_trackman has loaded. A delivery whose S3 key and ETag are
+-- already here is skipped before it is downloaded or parsed.
+CREATE TABLE IF NOT EXISTS ingested_file (
+    ingested_file_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    s3_key text NOT NULL,
+    etag text NOT NULL,
+    file_type text NOT NULL,
+    game_id uuid,
+    row_count integer,
+    elapsed_ms integer,
+    ingested_at timestamptz NOT NULL DEFAULT now(),
+    UNIQUE (s3_key, etag)
+);
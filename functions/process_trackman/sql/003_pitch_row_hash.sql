@@ -0,0 +1,4 @@
+-- Digest of the values process_trackman last wrote to a pitch from its pitch data file. When a game
+-- is re-delivered, only the pitches whose digest changed are rewritten. NULL means unknown (rows
+-- loaded before this column existed, or inserted by a player positioning file).
+ALTER TABLE pitch ADD COLUMN IF NOT EXISTS row_hash text;
@@ -0,0 +1,12 @@
+-- Lets process_trackman write every file with one INSERT ... ON CONFLICT (game_id, pitch_number) DO UPDATE,
+-- whether the game is new, re-delivered or only partially loaded.
+-- A pitch number can only appear once per game, so copies left by earlier loads are removed first
+-- (one row of each duplicate is kept).
+DELETE FROM pitch AS duplicate
+USING pitch AS kept
+WHERE duplicate.game_id = kept.game_id
+AND duplicate.pitch_number = kept.pitch_number
+AND duplicate.ctid < kept.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS pitch_game_id_pitch_number_key
+    ON pitch (game_id, pitch_number);
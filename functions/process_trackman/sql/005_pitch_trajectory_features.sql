@@ -0,0 +1,13 @@
+-- Pitch trajectory features process_trackman derives from the pitch_trajectory_* coefficients
+-- (see image/src/trajectory.py), so clients do not need every coefficient to compute them.
+-- Pitches loaded before this migration keep NULLs until they are written again.
+ALTER TABLE pitch
+    ADD COLUMN IF NOT EXISTS trajectory_plate_time double precision,            -- s from release to the front of the plate
+    ADD COLUMN IF NOT EXISTS trajectory_plate_side double precision,            -- ft, toward the first base side
+    ADD COLUMN IF NOT EXISTS trajectory_plate_height double precision,          -- ft
+    ADD COLUMN IF NOT EXISTS trajectory_plate_vx double precision,              -- ft/s at the plate, toward the mound
+    ADD COLUMN IF NOT EXISTS trajectory_plate_vy double precision,              -- toward the first base side
+    ADD COLUMN IF NOT EXISTS trajectory_plate_vz double precision,              -- up
+    ADD COLUMN IF NOT EXISTS trajectory_horz_break_40 double precision,         -- in, from the straight line at 40 ft
+    ADD COLUMN IF NOT EXISTS trajectory_vert_break_40 double precision,
+    ADD COLUMN IF NOT EXISTS trajectory_induced_vert_break_40 double precision; -- in, with gravity left out
@@ -0,0 +1,16 @@
+-- One row per batted ball with the landing point, spray angle, apex and hang time process_trackman
+-- solves from the pitch's hit_trajectory_* coefficients (see image/src/trajectory.py), so spray charts
+-- can read a few narrow columns instead of whole pitch rows.
+CREATE TABLE IF NOT EXISTS batted_ball (
+    pitch_id uuid PRIMARY KEY REFERENCES pitch (pitch_id) ON DELETE CASCADE,
+    game_id uuid NOT NULL,
+    landing_x double precision,    -- ft from home plate toward center field
+    landing_y double precision,    -- ft toward the first base side
+    distance double precision,     -- ft from home plate to the landing point
+    spray_angle double precision,  -- degrees from the center field line, positive toward first base
+    apex_height double precision,  -- ft
+    hang_time double precision     -- s from contact until the ball comes down
+);
+
+CREATE INDEX IF NOT EXISTS batted_ball_game_id_idx
+    ON batted_ball (game_id);
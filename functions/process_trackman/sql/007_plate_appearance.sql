@@ -0,0 +1,28 @@
+-- One row per plate appearance, rebuilt by process_trackman from a game's pitch data file in the
+-- same transaction as its pitches, so PA-level stats are lookups instead of window functions over pitch.
+-- The result and the *_on_play values are those of the PA's last pitch.
+CREATE TABLE IF NOT EXISTS plate_appearance (
+    game_id uuid NOT NULL REFERENCES game (game_id) ON DELETE CASCADE,
+    inning integer NOT NULL,
+    top_or_bottom text NOT NULL,
+    pa_of_inning integer NOT NULL,
+    batter_id uuid,
+    pitcher_id uuid,
+    first_pitch_number integer,
+    last_pitch_number integer,
+    pitch_count integer,
+    outs integer,                  -- outs when the PA started
+    result text,                   -- Strikeout, Walk, HitByPitch or the PlayResult; NULL if the PA ended otherwise
+    k_or_bb text,
+    play_result text,
+    outs_on_play integer,
+    runs_scored integer,
+    counts text[],                 -- the count before each pitch, as 'balls-strikes'
+    PRIMARY KEY (game_id, inning, top_or_bottom, pa_of_inning)
+);
+
+CREATE INDEX IF NOT EXISTS plate_appearance_batter_id_idx
+    ON plate_appearance (batter_id);
+
+CREATE INDEX IF NOT EXISTS plate_appearance_pitcher_id_idx
+    ON plate_appearance (pitcher_id);
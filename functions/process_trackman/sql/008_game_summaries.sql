@@ -0,0 +1,64 @@
+-- Box-score summaries process_trackman rebuilds from a game's pitch data file, in the same transaction as
+-- its plate appearances, so a game summary is one read instead of paging through the game's pitches.
+-- Every summary has the same counts: pitches, plate_appearances, strikeouts, walks, hit_by_pitch,
+-- singles, doubles, triples, home_runs, hits, and runs (the runs_scored of the pitches summed).
+-- Team rows are the team's batting line; player rows are a player's batting or pitching line.
+CREATE TABLE IF NOT EXISTS game_summary (
+    game_id uuid PRIMARY KEY REFERENCES game (game_id) ON DELETE CASCADE,
+    innings integer,
+    pitches integer NOT NULL,
+    plate_appearances integer NOT NULL,
+    strikeouts integer NOT NULL,
+    walks integer NOT NULL,
+    hit_by_pitch integer NOT NULL,
+    singles integer NOT NULL,
+    doubles integer NOT NULL,
+    triples integer NOT NULL,
+    home_runs integer NOT NULL,
+    hits integer NOT NULL,
+    runs integer NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS team_game_summary (
+    game_id uuid NOT NULL REFERENCES game (game_id) ON DELETE CASCADE,
+    team_id uuid NOT NULL,
+    home boolean NOT NULL,
+    pitches integer NOT NULL,
+    plate_appearances integer NOT NULL,
+    strikeouts integer NOT NULL,
+    walks integer NOT NULL,
+    hit_by_pitch integer NOT NULL,
+    singles integer NOT NULL,
+    doubles integer NOT NULL,
+    triples integer NOT NULL,
+    home_runs integer NOT NULL,
+    hits integer NOT NULL,
+    runs integer NOT NULL,
+    PRIMARY KEY (game_id, home)
+);
+
+CREATE TABLE IF NOT EXISTS player_game_summary (
+    game_id uuid NOT NULL REFERENCES game (game_id) ON DELETE CASCADE,
+    player_id uuid NOT NULL,
+    role text NOT NULL,            -- batting or pitching
+    team_id uuid,
+    home boolean,
+    pitches integer NOT NULL,
+    plate_appearances integer NOT NULL,
+    strikeouts integer NOT NULL,
+    walks integer NOT NULL,
+    hit_by_pitch integer NOT NULL,
+    singles integer NOT NULL,
+    doubles integer NOT NULL,
+    triples integer NOT NULL,
+    home_runs integer NOT NULL,
+    hits integer NOT NULL,
+    runs integer NOT NULL,
+    PRIMARY KEY (game_id, player_id, role)
+);
+
+CREATE INDEX IF NOT EXISTS team_game_summary_team_id_idx
+    ON team_game_summary (team_id);
+
+CREATE INDEX IF NOT EXISTS player_game_summary_player_id_idx
+    ON player_game_summary (player_id);
@@ -0,0 +1,59 @@
+-- Additive per-player, per-season, per-pitch-type accumulators process_trackman keeps up to date at ingest,
+-- so season stats are read from one row instead of every pitch of the player.
+-- For each measure there is the number of pitches that have it, its sum and its sum of squares:
+--     mean = sum / count, variance = sum_squares / count - mean^2.
+-- The pitch type is TaggedPitchType, or AutoPitchType when the pitch was not tagged; role is batting or pitching.
+--
+-- player_game_pitch_type holds each game's contribution. When a game's pitch data is loaded again, its old
+-- rows are subtracted from player_season_pitch_type and replaced by the new ones, in one transaction, so
+-- player_season_pitch_type always equals the sum of player_game_pitch_type by (player_id, role, season, pitch_type).
+-- player_game_pitch_type has no foreign key to game: before a game is deleted, its contribution must be
+-- subtracted (main.remove_season_stats), which also removes its player_game_pitch_type rows.
+CREATE TABLE IF NOT EXISTS player_game_pitch_type (
+    game_id uuid NOT NULL,
+    player_id uuid NOT NULL,
+    role text NOT NULL,
+    pitch_type text NOT NULL,
+    season integer NOT NULL,
+    pitches integer NOT NULL,
+    rel_speed_count integer NOT NULL,
+    rel_speed_sum double precision NOT NULL,
+    rel_speed_sum_squares double precision NOT NULL,
+    spin_rate_count integer NOT NULL,
+    spin_rate_sum double precision NOT NULL,
+    spin_rate_sum_squares double precision NOT NULL,
+    horz_break_count integer NOT NULL,
+    horz_break_sum double precision NOT NULL,
+    horz_break_sum_squares double precision NOT NULL,
+    induced_vert_break_count integer NOT NULL,
+    induced_vert_break_sum double precision NOT NULL,
+    induced_vert_break_sum_squares double precision NOT NULL,
+    exit_speed_count integer NOT NULL,
+    exit_speed_sum double precision NOT NULL,
+    exit_speed_sum_squares double precision NOT NULL,
+    PRIMARY KEY (game_id, player_id, role, pitch_type)
+);
+
+CREATE TABLE IF NOT EXISTS player_season_pitch_type (
+    player_id uuid NOT NULL,
+    role text NOT NULL,
+    season integer NOT NULL,
+    pitch_type text NOT NULL,
+    pitches integer NOT NULL,
+    rel_speed_count integer NOT NULL,
+    rel_speed_sum double precision NOT NULL,
+    rel_speed_sum_squares double precision NOT NULL,
+    spin_rate_count integer NOT NULL,
+    spin_rate_sum double precision NOT NULL,
+    spin_rate_sum_squares double precision NOT NULL,
+    horz_break_count integer NOT NULL,
+    horz_break_sum double precision NOT NULL,
+    horz_break_sum_squares double precision NOT NULL,
+    induced_vert_break_count integer NOT NULL,
+    induced_vert_break_sum double precision NOT NULL,
+    induced_vert_break_sum_squares double precision NOT NULL,
+    exit_speed_count integer NOT NULL,
+    exit_speed_sum double precision NOT NULL,
+    exit_speed_sum_squares double precision NOT NULL,
+    PRIMARY KEY (player_id, role, season, pitch_type)
+);
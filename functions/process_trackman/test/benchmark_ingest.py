@@ -0,0 +1,262 @@
+""" Benchmark the ingest path against a local PostgreSQL database and a stubbed S3.
+
+Files from trackman_generator are served from memory by StubS3 and loaded through main.handler with the
+database settings in the environment (or .env). The database must already have the schema and the
+migrations in sql/ applied; the teams and ballparks the generator uses are added if they are missing.
+Ingest settings (LOAD_MODE, CHUNK_SIZE, TRANSACTION_MODE, PIPELINE_DEPTH, ...) are read from the
+environment as usual, so modes are compared by running the benchmark once per setting.
+
+The first run loads the games from scratch. Later runs mark the games unverified again and deliver their
+verified pitch data (a few pitch types re-tagged) and the same positioning files, which measures the
+re-ingest path.
+
+Example:
+    LOAD_MODE=copy python -m functions.process_trackman.test.benchmark_ingest --games 8 --pitches 300 --runs 3
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import resource
+from contextlib import redirect_stdout
+
+from functions.process_trackman.image.src import main
+from functions.process_trackman.test.trackman_generator import (
+    generate_files, schedule, TEAMS, DEFAULT_START, parse_date,
+)
+
+
+BUCKET = 'benchmark-bucket'
+
+
+class StubS3:
+    """ The S3 calls the ingest makes, served from a dict of {key: bytes}. Objects written by the ingest
+    (ex: quarantined rows) are kept in the same dict.
+    """
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise KeyError(f'NoSuchKey: {Key}')
+        content = self.objects[Key]
+        etag = hashlib.md5(content).hexdigest()
+        if Range:
+            first, last = Range.split('=')[1].split('-')
+            content = content[int(first):int(last) + 1]
+        return {'Body': StubBody(content), 'ContentLength': len(content), 'ETag': f'"{etag}"'}
+
+    def head_object(self, Bucket, Key):
+        content = self.objects[Key]
+        return {'ContentLength': len(content), 'ETag': f'"{hashlib.md5(content).hexdigest()}"'}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+
+    def get_paginator(self, operation_name):
+        return StubPaginator(self)
+
+
+class StubBody:
+    """Just enough of botocore's StreamingBody: read, iter_chunks and close."""
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+
+    def read(self, amount=None):
+        return self.stream.read(amount)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.stream.close()
+
+
+class StubPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix=''):
+        yield {'Contents': [
+            {'Key': key, 'Size': len(content)}
+            for key, content in sorted(self.s3.objects.items()) if key.startswith(Prefix)
+        ]}
+
+
+def s3_event(keys):
+    """An S3 notification event with one record per key."""
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}} for key in keys]}
+
+
+def add_reference_rows(conn, games):
+    """Insert the teams and ballparks of the scheduled games that are not in the database yet."""
+    cursor = conn.cursor()
+    team_codes = {code for game in games for code in (game['home'], game['away'])}
+    # the game's teams are looked up by the first 3 characters of HomeTeam/AwayTeam.
+    for team_code in sorted(team_codes | {code[:3] for code in team_codes}):
+        cursor.execute("INSERT INTO team (team_code) VALUES (%s) ON CONFLICT DO NOTHING;", (team_code,))
+    for ballpark in sorted({game['ballpark'] for game in games}):
+        cursor.execute(
+            """
+            INSERT INTO ballpark (ballpark_name)
+            SELECT %s
+            WHERE NOT EXISTS (SELECT 1 FROM ballpark WHERE ballpark_name = %s);
+            """,
+            (ballpark, ballpark)
+        )
+    conn.commit()
+    main.forget_reference_ids()
+
+
+# The game_ids of a tuple of (ballpark_name, date, daily_game_number).
+GAME_IDS_QUERY = """
+    SELECT game.game_id
+    FROM game JOIN ballpark ON ballpark.ballpark_id = game.ballpark_id
+    WHERE (ballpark.ballpark_name, game.date, game.daily_game_number) IN %s
+"""
+
+
+def scheduled_games(games):
+    return tuple((game['ballpark'], game['date'].isoformat(), game['game_number']) for game in games)
+
+
+def delete_games(conn, games, keys):
+    """Remove what earlier runs loaded for the scheduled games, so the next run loads them from scratch."""
+    cursor = conn.cursor()
+    if main.has_table(conn, 'player_season_pitch_type'):
+        cursor.execute(GAME_IDS_QUERY, (scheduled_games(games),))
+        main.remove_season_stats([game_id for game_id, in cursor.fetchall()], cursor)
+    cursor.execute(f"DELETE FROM pitch WHERE game_id IN ({GAME_IDS_QUERY});", (scheduled_games(games),))
+    cursor.execute(f"DELETE FROM game WHERE game_id IN ({GAME_IDS_QUERY});", (scheduled_games(games),))
+    forget_ingested_files(conn, keys)
+
+
+def mark_games_unverified(conn, games):
+    """Set the scheduled games back to unverified, so their verified pitch data replaces the stored pitches."""
+    cursor = conn.cursor()
+    cursor.execute(f"UPDATE game SET verified = false WHERE game_id IN ({GAME_IDS_QUERY});", (scheduled_games(games),))
+    conn.commit()
+
+
+def forget_ingested_files(conn, keys):
+    """Drop the keys from the ingested_file ledger so delivering them again is not skipped."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM ingested_file WHERE s3_key = ANY(%s);", (list(keys),))
+    conn.commit()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is in KB on Linux and bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(results, elapsed):
+    """Totals over the handler's per-file metrics."""
+    metrics = [file_metrics for result in results for file_metrics in result.get('metrics', [])]
+    rows = sum(file_metrics['rows'] for file_metrics in metrics)
+    stages = {
+        name: {
+            'ms': round(sum(file_metrics['stages'][name]['ms'] for file_metrics in metrics), 1),
+            'statements': sum(file_metrics['stages'][name]['statements'] for file_metrics in metrics),
+        }
+        for name in main.INGEST_STAGES
+    }
+    return {
+        'files': len(metrics),
+        'failed': sum(result['status'] == 'failed' for result in results),
+        'skipped': sum(len(result.get('skipped', [])) for result in results),
+        'rows': rows,
+        'rejected': sum(file_metrics['rejected'] for file_metrics in metrics),
+        'seconds': round(elapsed, 3),
+        'rows_per_s': round(rows / elapsed, 1) if elapsed else None,
+        'statements': sum(file_metrics['statements'] for file_metrics in metrics),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': stages,
+    }
+
+
+def benchmark(games=4, pitches=300, null_density=0.05, doubleheaders=0, seed=0, start=DEFAULT_START, runs=2,
+              batch_size=None, verbose=False):
+    """ Generate the files once, then ingest them `runs` times through main.handler.
+
+    Parameters:
+        batch_size (int): Keys per handler invocation; all of them in one event when None.
+
+    Returns:
+        list: One summary dict per run (see summarize).
+    """
+    scheduled = schedule(games, doubleheaders, start, TEAMS)
+    files = generate_files(games, pitches, null_density, doubleheaders, seed, start)
+    verified_files = generate_files(games, pitches, null_density, doubleheaders, seed, start, verified=True,
+                                    positioning=False)
+    pitch_keys = [key for key in files if main.get_file_type(key.split('/')[-1]) == 'pitch data']
+    positioning_keys = [key for key in files if key not in pitch_keys]
+    verified_keys = list(verified_files)
+    keys = list(files) + verified_keys
+    s3 = StubS3({key: text.encode() for key, text in {**files, **verified_files}.items()})
+    os.environ['BUCKET'] = BUCKET
+    main.s3_client = s3
+    batch_size = batch_size or len(keys)
+    print(f'{len(keys)} files, {sum(map(len, s3.objects.values())) / 1e6:.1f} MB, '
+          f'load mode {main.get_load_mode()}, transaction mode {main.get_transaction_mode()}')
+
+    conn = main.connect_to_db()
+    try:
+        add_reference_rows(conn, scheduled)
+        summaries = []
+        for run in range(runs):
+            if run == 0:
+                delete_games(conn, scheduled, keys)
+            else:
+                mark_games_unverified(conn, scheduled)
+                forget_ingested_files(conn, keys)
+            results = []
+            start_time = time.monotonic()
+            with redirect_stdout(sys.stdout if verbose else io.StringIO()):
+                # positioning files need their game's pitch data in the database, so they are delivered after it.
+                for group in (pitch_keys if run == 0 else verified_keys, positioning_keys):
+                    for first in range(0, len(group), batch_size):
+                        results.extend(main.handler(s3_event(group[first:first + batch_size]), None)['results'])
+            summary = summarize(results, time.monotonic() - start_time)
+            summary['run'] = 'fresh' if run == 0 else 'reingest'
+            summaries.append(summary)
+            print_summary(run + 1, summary)
+    finally:
+        conn.close()
+    return summaries
+
+
+def print_summary(run, summary):
+    print(f"run {run} ({summary['run']}): {summary['files']} files, {summary['rows']} rows in {summary['seconds']}s "
+          f"= {summary['rows_per_s']} rows/s, {summary['statements']} statements, "
+          f"peak RSS {summary['peak_rss_mb']} MB, {summary['failed']} failed, {summary['rejected']} rows rejected")
+    for name, stage in summary['stages'].items():
+        print(f"    {name:<9} {stage['ms']:>10.1f} ms {stage['statements']:>8} statements")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark process_trackman against a local database.')
+    parser.add_argument('--games', type=int, default=4)
+    parser.add_argument('--pitches', type=int, default=300, help='Pitches per game.')
+    parser.add_argument('--null-density', type=float, default=0.05, help='Share of measured values left empty.')
+    parser.add_argument('--doubleheaders', type=int, default=0, help='Matchups played twice in a day.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', type=parse_date, default=DEFAULT_START, help='First game day, YYYY-MM-DD.')
+    parser.add_argument('--runs', type=int, default=2, help='The first run loads from scratch, the rest re-ingest.')
+    parser.add_argument('--batch-size', type=int, help='Files per handler invocation (default: all of them).')
+    parser.add_argument('--json', help='Also write the run summaries to this file.')
+    parser.add_argument('--verbose', action='store_true', help="Show the ingest's own output.")
+    args = parser.parse_args()
+    summaries = benchmark(args.games, args.pitches, args.null_density, args.doubleheaders, args.seed, args.start,
+                          args.runs, args.batch_size, args.verbose)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summaries, file, indent=2)
@@ -1,12 +1,31 @@
 # To run test from terminal: py -m pytest the/test/location.py -s
-from functions.process_trackman.image.src.main import connect_to_db, get_csv, get_game_info, handler, determine_game_id, get_or_insert_player  
+from functions.process_trackman.image.src.main import (
+    connect_to_db, get_csv, get_game_info, handler, determine_game_id,
+    rows_to_csv_buffer, player_key, undefined_to_null, to_integer, read_trackman_csv,
+    get_record_locations, acquire_connection, release_connection, FileTransaction, savepoint,
+    find_rejected_rows, quarantine_records, PITCH_COLUMN_MAP, get_team_id, get_or_insert_team_id,
+    row_hashes, reconcile_handedness, run_in_background, BlockReader,
+    IngestMetrics, metrics_state, upsert_rows, plate_appearances, PLATE_APPEARANCE_PITCH_COLUMNS, game_summaries,
+    season_accumulators, GAME_PITCH_COLUMNS, read_csv_head_teams, probe_csv_teams, has_pitch_upsert_key,
+    load_csv_chunks, load_mapped_rows, process_s3_file, is_file_ingested, write_derived, process_records,
+    resolve_players, PITCH_PLAYER_FIELDS, process_csv, write_game_summaries, PLAYERPOS_INSERT_ONLY_COLUMNS,
+)
+from functions.process_trackman.image.src import backfill
+from functions.process_trackman.image.src.backfill import day_prefixes, group_game_files, process_game_files
+from functions.process_trackman.image.src.trajectory import trajectory_features, batted_ball_features
+from functions.process_trackman.test.trackman_generator import generate_files, generate_game, schedule
+from functions.process_trackman.test.benchmark_ingest import StubS3
 import sys
 import os
+import threading
 import pytest
 import json
 import pandas as pd
 import boto3
+from datetime import date
+from types import SimpleNamespace
 from io import StringIO
+from uuid import uuid4
 # Adjust Python path to enable absolute imports:
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
       
@@ -44,6 +63,21 @@ class TestGetCSV:
         file, filename = get_csv(self.data, s3)
         assert filename == self.data['Records'][0]['s3']['object']['key'].split('/')[-1]
 
+class TestGetRecordLocations:
+    event = json.load(open(os.path.join(test_dir, './test_events/unverified_pitching_test.json')))
+
+    def test_s3_record(self):
+        locations = get_record_locations(self.event['Records'][0])
+        assert locations == [('trackman-datafiles', '2024/06/30/CSV/20240629-ClipperMagazine-1_unverified.csv')]
+
+    def test_sqs_record_wrapping_s3_event(self):
+        record = {'eventSource': 'aws:sqs', 'messageId': '1', 'body': json.dumps(self.event)}
+        assert get_record_locations(record) == get_record_locations(self.event['Records'][0])
+
+    def test_sqs_test_event_has_no_files(self):
+        record = {'eventSource': 'aws:sqs', 'messageId': '1', 'body': json.dumps({'Event': 's3:TestEvent'})}
+        assert get_record_locations(record) == []
+
 class TestDetermineGameIDAndInsertData:
     """These two tests are grouped together because they require similar helper methods."""
     conn = connect_to_db()
@@ -330,180 +364,900 @@ class TestGetGameInfo:
         for key, expected_value in expected_info.items():
             assert expected_value == actual_info[key]
 
-class TestGetOrInsertPlayer:
-    conn = connect_to_db()
+class TestResolvePlayerHandedness:
+    fields = {field[3]: field for field in PITCH_PLAYER_FIELDS}
 
-    def delete_player_by_id(self, cursor, id):
-        if not id:
-            return
+    def resolve(self, conn, name, appearances):
+        """ Resolve one file in which the player appears as each (player type, handedness) in order. """
+        rows = {}
+        for player_type, hand in appearances:
+            name_column, hand_column, team_column, _, _ = self.fields[player_type]
+            rows.setdefault(name_column, []).append(name)
+            rows.setdefault(hand_column, []).append(hand)
+            rows.setdefault(team_column, []).append('LAN')
+        fields = tuple(dict.fromkeys(self.fields[player_type] for player_type, _ in appearances))
+        df = pd.DataFrame({column: pd.Series(values, dtype=object) for column, values in rows.items()})
+        return resolve_players(df, fields, conn)[(name, 'LAN')]
+
+    def select_hands(self, cursor, player_id):
+        cursor.execute(
+            """
+            SELECT player_pitching_handedness, player_batting_handedness FROM player
+            WHERE player_id = %s;
+            """,
+            (player_id,)
+        )
+        return cursor.fetchone()
+
+    def check(self, files, expected_hands):
+        """ Resolve each file in turn and check the player's ids and final (pitching, batting) hands. """
+        name = f'Test Handedness {uuid4().hex[:8]}'
+        conn = connect_to_db()
+        cursor = conn.cursor()
+        try:
+            player_ids = {self.resolve(conn, name, appearances) for appearances in files}
+            assert len(player_ids) == 1
+            assert self.select_hands(cursor, player_ids.pop()) == expected_hands
+        finally:
+            conn.rollback()
+            cursor.execute("DELETE FROM player WHERE player_name = %s;", (name,))
+            conn.commit()
+            conn.close()
 
-        # cursor.execute(
-        #     """
-        #     DELETE FROM player
-        #     WHERE player_id = %s;
-        #     """,
-        #     (id,)
-        # )
-        # self.conn.commit()
-    
     def test_insert_batter(self):
-        cursor = self.conn.cursor()
-        player_id = None
+        self.check([[('batter', 'Right')]], (None, 'Right'))
+
+    def test_insert_pitcher(self):
+        self.check([[('pitcher', 'Left')]], ('Left', None))
+
+    def test_pitch_and_bat_hands_exist(self):
+        self.check([[('pitcher', 'Left')], [('batter', 'Right')]], ('Left', 'Right'))
+
+    def test_update_to_switch_hitter(self):
+        self.check([[('batter', 'Left')], [('batter', 'Right')]], (None, 'Switch'))
+
+    def test_switch_hitter_within_one_file(self):
+        self.check([[('batter', 'Left'), ('batter', 'Right')]], (None, 'Switch'))
+
+    def test_update_switch_hitter_pitch_hand(self):
+        self.check([[('batter', 'Left')], [('batter', 'Right')], [('pitcher', 'Right')]], ('Right', 'Switch'))
+
+
+class TestRowsToCsvBuffer:
+    def test_none_and_nan_become_empty_fields(self):
+        buffer = rows_to_csv_buffer([(1, None, float('nan'), 'Left')])
+        assert buffer.read() == '1,,,Left\r\n'
+
+    def test_values_with_commas_are_quoted(self):
+        buffer = rows_to_csv_buffer([('Doe, John', 2.5)])
+        assert buffer.read() == '"Doe, John",2.5\r\n'
+
+
+class TestResolvePlayersHelpers:
+    def reconcile(self, rows, existing):
+        appearances = pd.DataFrame(rows, columns=['player_name', 'team_code', 'player_type', 'handedness'], dtype=object)
+        return reconcile_handedness(appearances, existing)
+
+    def test_batter_seen_from_both_sides_is_a_switch_hitter(self):
+        hands = self.reconcile([('Test Batter', 'LAN', 'batter', 'Right')], {('Test Batter', 'LAN'): ('id', None, 'Left')})
+        assert hands[('Test Batter', 'LAN')] == (None, 'Switch')
+        hands = self.reconcile([('Test Batter', 'LAN', 'batter', 'Left')], {('Test Batter', 'LAN'): ('id', None, 'Switch')})
+        assert hands[('Test Batter', 'LAN')] == (None, 'Switch')
+
+    def test_same_batting_hand_is_kept(self):
+        hands = self.reconcile([('Test Batter', 'LAN', 'batter', 'Left')], {('Test Batter', 'LAN'): ('id', None, 'Left')})
+        assert hands[('Test Batter', 'LAN')] == (None, 'Left')
+
+    def test_stored_pitching_hand_wins_over_a_conflicting_one(self):
+        hands = self.reconcile([('Test Pitcher', 'LAN', 'pitcher', 'Left')], {('Test Pitcher', 'LAN'): ('id', 'Right', None)})
+        assert hands[('Test Pitcher', 'LAN')] == ('Right', None)
+
+    def test_unknown_hands_are_filled_in_and_never_make_a_switch_hitter(self):
+        hands = self.reconcile([
+            ('Test Batter', 'LAN', 'batter', None),
+            ('Test Batter', 'LAN', 'batter', 'Undefined'),
+            ('Test Pitcher', 'LAN', 'pitcher', 'Left'),
+            ('New Batter', 'LAN', 'batter', None),
+            ('New Batter', 'LAN', 'batter', 'Right'),
+        ], {('Test Batter', 'LAN'): ('id', None, 'Left'), ('Test Pitcher', 'LAN'): ('id', 'nan', None)})
+        assert hands[('Test Batter', 'LAN')] == (None, 'Left')
+        assert hands[('Test Pitcher', 'LAN')] == ('Left', None)
+        assert hands[('New Batter', 'LAN')] == (None, 'Right')
+
+    def test_player_key_treats_missing_values_as_none(self):
+        assert player_key(float('nan'), "LAN") == (None, "LAN")
+        assert player_key("Test Batter", "nan") == ("Test Batter", None)
+
+
+class TestResolvePlayers:
+    columns = [
+        'Pitcher', 'PitcherThrows', 'PitcherTeam', 'Batter', 'BatterSide', 'BatterTeam',
+        'Catcher', 'CatcherThrows', 'CatcherTeam',
+    ]
+
+    def test_new_existing_and_teamless_players(self):
+        suffix = uuid4().hex[:8]
+        existing, new, teamless = (f'Test Resolve {role} {suffix}' for role in ('Pitcher', 'Batter', 'Catcher'))
+        conn = connect_to_db()
+        cursor = conn.cursor()
         try:
-            player_id = get_or_insert_player(
-                "Test Batter",
-                "Right",
-                "LAN",
-                "batter",
-                self.conn,
+            cursor.execute(
+                """
+                INSERT INTO player (player_name, team_id, player_pitching_handedness)
+                SELECT %s, team_id, 'Left' FROM team WHERE team_code = 'LAN'
+                RETURNING player_id;
+                """,
+                (existing,)
+            )
+            existing_id = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO player (player_name) VALUES (%s) RETURNING player_id;", (teamless,))
+            teamless_id = cursor.fetchone()[0]
+            conn.commit()
+            df = pd.DataFrame(
+                [(existing, 'Left', 'LAN', new, 'Right', 'LAN', teamless, 'Right', 'Undefined')],
+                columns=self.columns, dtype=object
             )
+            players = resolve_players(df, PITCH_PLAYER_FIELDS, conn)
+            assert players[(existing, 'LAN')] == existing_id
+            # a missing team code matches the player stored without a team.
+            assert players[(teamless, None)] == teamless_id
             cursor.execute(
                 """
-                SELECT player_name, player_batting_handedness FROM player
-                WHERE player_id = %s
+                SELECT player_id, player_batting_handedness, team.team_code FROM player
+                JOIN team USING (team_id)
+                WHERE player_name = %s;
                 """,
-                (player_id,)
+                (new,)
             )
-            name, bat_hand = cursor.fetchone()
-            print(name, bat_hand)
-            assert (name == "Test Batter" and bat_hand == "Right")
+            assert cursor.fetchall() == [(players[(new, 'LAN')], 'Right', 'LAN')]
+            # resolving the same file again finds the same players instead of inserting them again.
+            assert resolve_players(df, PITCH_PLAYER_FIELDS, conn) == players
+            cursor.execute("SELECT count(*) FROM player WHERE player_name LIKE %s;", (f'Test Resolve % {suffix}',))
+            assert cursor.fetchone() == (3,)
         finally:
-            self.delete_player_by_id(cursor, player_id)
+            conn.rollback()
+            cursor.execute("DELETE FROM player WHERE player_name LIKE %s;", (f'Test Resolve % {suffix}',))
+            conn.commit()
+            conn.close()
 
 
-    def test_insert_pitcher(self):
-        cursor = self.conn.cursor()
-        player_id = None
+class TestColumnTransforms:
+    def test_undefined_to_null(self):
+        series = undefined_to_null(pd.Series(['Stretch', 'Undefined', 'nan', None], dtype=object))
+        assert series[0] == 'Stretch'
+        assert series[1:].isna().all()
+
+    def test_to_integer_keeps_blanks(self):
+        series = to_integer(pd.Series([1.0, None, 3.0]))
+        assert str(series.dtype) == 'Int64'
+        assert series[0] == 1 and pd.isna(series[1])
+
+    def test_to_integer_leaves_fractions_alone(self):
+        series = pd.Series([1.5, 2.0])
+        assert to_integer(series) is series
+
+
+class TestReadTrackmanCsv:
+    def test_typed_columns_and_undefined(self):
+        file = StringIO("PitchNo,Inning,RelSpeed,PitcherSet,PitchCall,Unused\n1,1,90.5,Undefined,Undefined,x\n2,,,Stretch,BallCalled,y\n")
+        df = read_trackman_csv(file, 'pitch data')
+        assert 'Unused' not in df.columns
+        assert str(df['Inning'].dtype) == 'Int16'
+        assert str(df['RelSpeed'].dtype) == 'float64'
+        assert pd.isna(df['PitcherSet'][0])
+        assert df['PitchCall'][0] == 'Undefined'
+
+    def test_chunked_read_tolerates_bad_numbers(self):
+        file = StringIO("PitchNo,RelSpeed,PitchCall\n1,90.5,BallCalled\n2,fast,InPlay\n3,88.0,BallCalled\n")
+        chunks = list(read_trackman_csv(file, 'pitch data', chunksize=2))
+        assert [len(chunk) for chunk in chunks] == [2, 1]
+        assert chunks[0]['RelSpeed'][1] == 'fast'
+
+    def test_falls_back_when_schema_does_not_fit(self):
+        file = StringIO("PitchNo,RelSpeed\n1,fast\n")
+        df = read_trackman_csv(file, 'pitch data')
+        assert df['RelSpeed'][0] == 'fast'
+
+
+class TestConnectionReuse:
+    def test_released_connection_is_reused(self):
+        conn = acquire_connection()
+        release_connection(conn)
+        assert acquire_connection() is conn
+        release_connection(conn)
+
+    def test_closed_connection_is_replaced(self):
+        conn = acquire_connection()
+        conn.close()
+        release_connection(conn)
+        new_conn = acquire_connection()
+        assert new_conn is not conn and not new_conn.closed
+        release_connection(new_conn)
+
+
+class TestProcessRecords:
+    keys = [
+        '2024/06/30/CSV/20240629-ClipperMagazine-1.csv',
+        '2024/06/29/CSV/20240629-ClipperMagazine-2_unverified.csv',
+        '2024/06/29/CSV/20240629-ClipperMagazine-1_playerpositioning_FHC.csv',
+        '2024/06/29/CSV/20240629-ClipperMagazine-1_unverified.csv',
+    ]
+
+    def test_a_games_records_are_processed_in_order_by_one_worker(self, monkeypatch):
+        processed = []
+
+        def process_record(record, conn, s3):
+            key = record['s3']['object']['key']
+            processed.append((threading.current_thread().name, key.split('/')[-1]))
+            return {'message_id': None, 'keys': [key], 'status': 'processed'}
+        monkeypatch.setenv('MAX_WORKERS', '4')
+        monkeypatch.setattr(backfill.main, 'acquire_connection', lambda: SimpleNamespace(closed=False))
+        monkeypatch.setattr(backfill.main, 'release_connection', lambda conn: None)
+        monkeypatch.setattr(backfill.main, 'process_record', process_record)
+        records = [{'s3': {'bucket': {'name': 'bucket'}, 'object': {'key': key}}} for key in self.keys]
+        results = process_records(records, None)
+        assert [result['keys'] for result in results] == [[key] for key in self.keys]
+        game = [(thread, file_name) for thread, file_name in processed if '-1' in file_name]
+        assert len({thread for thread, _ in game}) == 1
+        assert [file_name for _, file_name in game] == [
+            '20240629-ClipperMagazine-1_unverified.csv', '20240629-ClipperMagazine-1.csv',
+            '20240629-ClipperMagazine-1_playerpositioning_FHC.csv',
+        ]
+
+
+class TestFileTransaction:
+    def test_rollback_only_returns_to_savepoint(self):
+        conn = connect_to_db()
         try:
-            player_id = get_or_insert_player(
-                "Test Pitcher",
-                "Left",
-                "LAN",
-                "pitcher",
-                self.conn,
-            )
+            transaction = FileTransaction(conn)
+            cursor = transaction.cursor()
+            cursor.execute("CREATE TEMP TABLE savepoint_test (x integer);")
+            cursor.execute("INSERT INTO savepoint_test VALUES (1);")
+            transaction.commit() # does not end the transaction
+            with savepoint(transaction):
+                cursor.execute("INSERT INTO savepoint_test VALUES (2);")
+                transaction.rollback()
+            with pytest.raises(Exception):
+                with savepoint(transaction):
+                    cursor.execute("INSERT INTO savepoint_test VALUES ('bad');")
+            cursor.execute("SELECT x FROM savepoint_test;")
+            assert cursor.fetchall() == [(1,)]
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+class TestFindRejectedRows:
+    def test_non_numeric_values_are_rejected(self):
+        df = pd.DataFrame({
+            'PitchNo': ['1', '2', '3'],
+            'RelSpeed': ['90.5', 'fast', None],
+            'PitcherSet': ['Stretch', 'Undefined', 'Windup'],
+        })
+        reasons = find_rejected_rows(df, PITCH_COLUMN_MAP)
+        assert list(reasons.index) == [1]
+        assert reasons[1] == 'RelSpeed is not a number'
+        records = quarantine_records(df.loc[reasons.index], reasons)
+        assert records[0]['line'] == 3
+        assert records[0]['row']['RelSpeed'] == 'fast'
+
+    def test_typed_frame_has_no_rejects(self):
+        df = read_trackman_csv(StringIO("PitchNo,RelSpeed\n1,90.5\n2,\n"), 'pitch data')
+        assert find_rejected_rows(df, PITCH_COLUMN_MAP).empty
+
+
+class TestBackfillPlanning:
+    def test_day_prefixes_cross_months(self):
+        assert day_prefixes(date(2024, 6, 30), date(2024, 7, 1)) == ['2024/06/30/CSV/', '2024/07/01/CSV/']
+
+    def test_game_files_are_grouped_and_ordered(self):
+        files = [
+            ('2024/06/30/CSV/20240629-ClipperMagazine-1.csv', 10),
+            ('2024/06/29/CSV/20240629-ClipperMagazine-1_playerpositioning_FHC.csv', 10),
+            ('2024/06/29/CSV/20240629-ClipperMagazine-2_unverified.csv', 10),
+            ('2024/06/29/CSV/20240629-ClipperMagazine-1_unverified.csv', 10),
+        ]
+        groups = [[key.split('/')[-1] for key, _ in group] for group in group_game_files(files)]
+        assert groups == [
+            ['20240629-ClipperMagazine-1_unverified.csv', '20240629-ClipperMagazine-1.csv',
+             '20240629-ClipperMagazine-1_playerpositioning_FHC.csv'],
+            ['20240629-ClipperMagazine-2_unverified.csv'],
+        ]
+
+
+class TestIngestedFileLedger:
+    key = '2024/06/29/CSV/20240629-ClipperMagazine-1.csv'
+    s3 = StubS3({key: b'PitchNo,Date\n1,2024-06-29\n'})
+    etag = s3.head_object(Bucket='bucket', Key=key)['ETag'].strip('"')
+
+    def test_an_ingested_file_is_skipped_before_it_is_loaded(self, monkeypatch):
+        def process_csv(*args):
+            raise AssertionError('the file was loaded again')
+        monkeypatch.setattr(backfill.main, 'process_csv', process_csv)
+        conn = connect_to_db()
+        try:
+            cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT player_name, player_pitching_handedness FROM player
-                WHERE player_id = %s
-                """,
-                (player_id,)
+                "INSERT INTO ingested_file (s3_key, etag, file_type, row_count) VALUES (%s, %s, 'pitch data', 1);",
+                (self.key, self.etag)
             )
-            name, pitch_hand = cursor.fetchone()
-            print(name, pitch_hand)
-            assert (name == "Test Pitcher" and pitch_hand == "Left")
+            assert process_s3_file('bucket', self.key, conn, self.s3) is False
         finally:
-            self.delete_player_by_id(cursor, player_id)
+            conn.rollback()
+            conn.close()
 
+    def test_a_load_that_was_not_clean_is_not_recorded(self, monkeypatch):
+        monkeypatch.setenv('TRANSACTION_MODE', 'statement')
+        monkeypatch.setattr(
+            backfill.main, 'process_csv',
+            lambda *args: {'game_id': None, 'rows': 0, 'rejected': [], 'clean': False}
+        )
+        conn = connect_to_db()
+        try:
+            assert process_s3_file('bucket', self.key, conn, self.s3)
+            assert not is_file_ingested(self.key, self.etag, conn)
+        finally:
+            conn.rollback()
+            conn.close()
 
-    def test_pitch_and_bat_hands_exist(self):
-        cursor = self.conn.cursor()
-        player_id1 = None
-        player_id2 = None
+    def test_a_file_is_recorded_only_once_its_rejected_rows_are_quarantined(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('TRANSACTION_MODE', 'statement')
+        rejected = [{'line': 2, 'reason': 'RelSpeed is not a number', 'row': {'RelSpeed': 'fast'}}]
+        monkeypatch.setattr(
+            backfill.main, 'process_csv',
+            lambda *args: {'game_id': None, 'rows': 0, 'rejected': rejected, 'clean': True}
+        )
+        # a file where the quarantine directory should be, so it cannot be written.
+        (tmp_path / 'quarantine').write_text('')
+        monkeypatch.setenv('QUARANTINE_LOCATION', str(tmp_path / 'quarantine'))
+        conn = connect_to_db()
         try:
-            player_id1 = get_or_insert_player(
-                "Test pitch and bat hands exist",
-                "Left",
-                "LAN",
-                "pitcher",
-                self.conn,
-            )
-            player_id2 = get_or_insert_player(
-                "Test pitch and bat hands exist",
-                "Right",
-                "LAN",
-                "batter",
-                self.conn,
-            )
-            assert(player_id1 == player_id2)
+            assert process_s3_file('bucket', self.key, conn, self.s3)
+            assert not is_file_ingested(self.key, self.etag, conn)
+            monkeypatch.setenv('QUARANTINE_LOCATION', str(tmp_path / 'rejected'))
+            assert process_s3_file('bucket', self.key, conn, self.s3)
+            assert (tmp_path / 'rejected' / f'{self.key}.rejected.ndjson').exists()
+            assert is_file_ingested(self.key, self.etag, conn)
+        finally:
+            conn.cursor().execute("DELETE FROM ingested_file WHERE s3_key = %s;", (self.key,))
+            conn.commit()
+            conn.close()
+
+
+class TestBackfillWorker:
+    keys = ['2024/06/29/CSV/20240629-ClipperMagazine-1_unverified.csv', '2024/06/29/CSV/20240629-ClipperMagazine-1.csv']
+
+    def test_files_whose_game_is_not_written_are_skipped(self, monkeypatch):
+        monkeypatch.setattr(backfill.main, 'get_s3_client', lambda: None)
+        monkeypatch.setattr(backfill.main, 'acquire_connection', connect_to_db)
+        monkeypatch.setattr(backfill.main, 'process_s3_file', lambda bucket, key, conn, s3, force: 'unverified' in key)
+        assert [status for _, status, _ in process_game_files('bucket', self.keys, True)] == ['processed', 'skipped']
+
+    def test_a_failed_connection_fails_the_file_instead_of_the_worker(self, monkeypatch):
+        def acquire_connection():
+            raise OSError('could not connect')
+        monkeypatch.setattr(backfill.main, 'get_s3_client', lambda: None)
+        monkeypatch.setattr(backfill.main, 'acquire_connection', acquire_connection)
+        results = process_game_files('bucket', self.keys, False)
+        assert results == [(key, 'failed', 'could not connect') for key in self.keys]
+
+
+class TestGameReuse:
+    def test_unfinished_games_are_filled_in_and_force_reuses_any_game(self):
+        conn = connect_to_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT team_code FROM team ORDER BY team_code LIMIT 2;")
+        home_team, away_team = [row[0] for row in cursor.fetchall()]
+        game = {
+            'home_team': home_team, 'away_team': away_team, 'ballpark_id': None, 'verified': True,
+            'date': '1999-06-29', 'daily_game_number': 1, 'file_type': 'pitch data',
+        }
+        game_id = determine_game_id('19990629-Test-1.csv', conn, None, game, None)
+        try:
+            # nothing recorded the game as ingested, so a retry of its file fills it in.
+            assert determine_game_id('19990629-Test-1.csv', conn, None, game, None) == game_id
             cursor.execute(
-                """
-                SELECT player_name, player_pitching_handedness, player_batting_handedness FROM player
-                WHERE player_id = %s
-                """,
-                (player_id1,)
+                "INSERT INTO ingested_file (s3_key, etag, file_type, game_id) VALUES ('test', 'test', 'pitch data', %s);",
+                (game_id,)
             )
-            name, pitch_hand, bat_hand = cursor.fetchone()
-            print(name, pitch_hand)
-            assert (name == "Test pitch and bat hands exist" and pitch_hand == "Left" and bat_hand == "Right")
+            conn.commit()
+            # a verified game that loaded completely is not replaced by another verified file, unless forced.
+            assert determine_game_id('19990629-Test-1.csv', conn, None, game, None) is None
+            assert determine_game_id('19990629-Test-1.csv', conn, None, game, None, force=True) == game_id
+            # forcing never lets unverified pitches replace the verified ones.
+            unverified = {**game, 'verified': False}
+            assert determine_game_id('19990629-Test-1_unverified.csv', conn, None, unverified, None, force=True) is None
+            cursor.execute("SELECT verified FROM game WHERE game_id = %s;", (game_id,))
+            assert cursor.fetchone() == (True,)
         finally:
-            self.delete_player_by_id(cursor, player_id1)
-            self.delete_player_by_id(cursor, player_id2)
+            cursor.execute("DELETE FROM ingested_file WHERE game_id = %s;", (game_id,))
+            cursor.execute("DELETE FROM game WHERE game_id = %s;", (game_id,))
+            conn.commit()
+            conn.close()
 
 
-    def test_update_to_switch_hitter(self):
-        cursor = self.conn.cursor()
-        player_id1 = None
-        player_id2 = None
+class TestReferenceMap:
+    def test_unknown_team_code_raises_key_error(self):
+        conn = connect_to_db()
+        try:
+            with pytest.raises(KeyError):
+                get_team_id('not a team code', conn.cursor())
+        finally:
+            conn.close()
+
+    def test_lookups_match_get_or_insert_team_id(self):
+        conn = connect_to_db()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT team_code, team_id FROM team LIMIT 1;")
+            team_code, team_id = cursor.fetchone()
+            assert get_team_id(team_code, cursor) == team_id
+            assert get_or_insert_team_id(team_code, conn) == team_id
+        finally:
+            conn.close()
+
+
+class TestRowHashes:
+    def test_hash_ignores_game_id_and_tracks_values(self):
+        mapped = pd.DataFrame({'pitch_number': [1, 2], 'pitch_call': ['BallCalled', None], 'game_id': ['a', 'a']}, dtype=object)
+        hashes = row_hashes(mapped)
+        assert hashes[0] == row_hashes(mapped.assign(game_id='b'))[0]
+        assert hashes[0] != hashes[1]
+        changed = mapped.copy()
+        changed.loc[1, 'pitch_call'] = 'StrikeCalled'
+        assert list(row_hashes(changed) == hashes) == [True, False]
+
+
+class TestReconcileHandedness:
+    def test_matches_replaying_appearances(self):
+        appearances = pd.DataFrame([
+            ('Test Batter', 'LAN', 'batter', 'Left'),
+            ('Test Batter', 'LAN', 'batter', 'Left'),
+            ('Test Batter', 'LAN', 'batter', 'Right'),
+            ('Test Pitcher', 'LAN', 'pitcher', None),
+            ('Test Pitcher', 'LAN', 'pitcher', 'Right'),
+            ('Test Pitcher', 'LAN', 'pitcher', 'Left'),
+            ('Test Catcher', None, 'catcher', 'Right'),
+        ], columns=['player_name', 'team_code', 'player_type', 'handedness'], dtype=object)
+        existing = {('Test Catcher', None): ('id', 'Left', 'Right')}
+        assert reconcile_handedness(appearances, existing) == {
+            ('Test Batter', 'LAN'): (None, 'Switch'),
+            ('Test Pitcher', 'LAN'): ('Right', None),
+            ('Test Catcher', None): ('Left', 'Right'),
+        }
+
+
+class TestPipeline:
+    def test_background_items_arrive_in_order(self):
+        assert list(run_in_background(lambda: iter(range(50)), 2)) == list(range(50))
+
+    def test_background_error_is_raised_to_consumer(self):
+        def failing():
+            yield 1
+            raise ValueError('bad block')
+        items = run_in_background(failing, 1)
+        assert next(items) == 1
+        with pytest.raises(ValueError):
+            next(items)
+
+    def test_block_reader_parses_with_pandas(self):
+        blocks = iter([b'PitchNo,RelSp', b'eed\n1,90.5\n', b'2,88.0\n'])
+        df = pd.read_csv(BlockReader(blocks))
+        assert list(df['RelSpeed']) == [90.5, 88.0]
+
+
+class TestIngestMetrics:
+    def test_statements_are_counted_toward_the_running_stage(self, capsys):
+        conn = connect_to_db()
+        metrics = IngestMetrics('2024/06/30/CSV/test.csv')
+        metrics_state.metrics = metrics
+        try:
+            cursor = conn.cursor()
+            with metrics.stage('game'):
+                cursor.execute("SELECT 1;")
+                cursor.execute("SELECT 2;")
+            cursor.execute("SELECT 3;")
+        finally:
+            metrics_state.metrics = None
+            conn.close()
+        metrics.rows = 10
+        result = metrics.as_dict()
+        assert result['stages']['game']['statements'] == 2
+        assert result['statements'] == 3
+        metrics.emit('pitch data')
+        line = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+        assert line['FileType'] == 'pitch data' and line['Rows'] == 10 and line['GameStatements'] == 2
+        assert {'Name': 'GameMs', 'Unit': 'Milliseconds'} in line['_aws']['CloudWatchMetrics'][0]['Metrics']
+
+
+class TestTrackmanGenerator:
+    def test_same_arguments_give_identical_files(self):
+        assert generate_files(games=2, pitches=60, seed=7) == generate_files(games=2, pitches=60, seed=7)
+        assert generate_files(games=1, pitches=60, seed=7) != generate_files(games=1, pitches=60, seed=8)
+
+    def test_doubleheaders_are_numbered_games_1_and_2(self):
+        games = schedule(5, doubleheaders=1)
+        assert [game['game_number'] for game in games] == [1, 2, 1, 1, 1]
+        assert games[0]['date'] == games[1]['date'] and games[0]['ballpark'] == games[1]['ballpark']
+
+    def test_files_read_with_the_trackman_schema(self):
+        files = generate_files(games=1, pitches=120, null_density=0.1)
+        pitch_key, positioning_key = files
+        assert positioning_key.endswith('-1_unverified_playerpositioning_FHC.csv')
+        df = read_trackman_csv(StringIO(files[pitch_key]), 'pitch data')
+        assert len(df) == 120 and str(df['RelSpeed'].dtype) == 'float64'
+        assert list(df['PitchNo']) == list(range(1, 121))
+        assert df['RelSpeed'].isna().any() and df['RelSpeed'].notna().any()
+        assert find_rejected_rows(df, PITCH_COLUMN_MAP).empty
+        positioning = read_trackman_csv(StringIO(files[positioning_key]), 'player positioning')
+        assert len(positioning) == 120
+
+
+class TestPitchUpsert:
+    columns = ('game_id', 'pitch_number', 'pitch_call', 'row_hash')
+
+    def test_fills_in_a_partially_loaded_game_and_skips_unchanged_pitches(self):
+        conn = connect_to_db()
         try:
-            player_id1 = get_or_insert_player(
-                "Test update to switch hitter",
-                "Left",
-                "LAN",
-                "batter",
-                self.conn,
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO game (verified) VALUES (false) RETURNING game_id;")
+            game_id = cursor.fetchone()[0]
+            assert upsert_rows(self.columns, [(game_id, 1, 'BallCalled', 'a'), (game_id, 2, 'FoulBall', 'b')], conn) == 2
+            rows = [(game_id, 1, 'BallCalled', 'a'), (game_id, 2, 'InPlay', 'c'), (game_id, 3, 'BallCalled', 'd')]
+            # pitch 1 is unchanged, pitch 2 is updated and pitch 3 was missing.
+            assert upsert_rows(self.columns, rows, conn) == 2
+            cursor.execute("SELECT pitch_number, pitch_call FROM pitch WHERE game_id = %s ORDER BY 1;", (game_id,))
+            assert cursor.fetchall() == [(1, 'BallCalled'), (2, 'InPlay'), (3, 'BallCalled')]
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def test_rows_the_database_refuses_are_returned_with_the_error(self):
+        conn = connect_to_db()
+        try:
+            transaction = FileTransaction(conn)
+            cursor = transaction.cursor()
+            cursor.execute("INSERT INTO game (verified) VALUES (false) RETURNING game_id;")
+            game_id = cursor.fetchone()[0]
+            mapped = pd.DataFrame(
+                [(game_id, 1, 'BallCalled', 'a'), (game_id, 'two', 'InPlay', 'b'), (game_id, 3, 'FoulBall', 'c')],
+                columns=self.columns, index=[10, 11, 12]
             )
-            player_id2 = get_or_insert_player(
-                "Test update to switch hitter",
-                "Right",
-                "LAN",
-                "batter",
-                self.conn,
+            failed = load_mapped_rows(mapped, transaction)
+            # the index is the source row's, so quarantine_records can give its line number.
+            assert list(failed.index) == [11]
+            assert 'invalid input syntax' in failed[11]
+            cursor.execute("SELECT pitch_number FROM pitch WHERE game_id = %s ORDER BY 1;", (game_id,))
+            assert cursor.fetchall() == [(1,), (3,)]
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def test_positioning_rows_do_not_overwrite_pitch_data(self, monkeypatch):
+        conn = connect_to_db()
+        try:
+            transaction = FileTransaction(conn)
+            cursor = transaction.cursor()
+            for load_mode in ('row', 'copy'):
+                monkeypatch.setenv('LOAD_MODE', load_mode)
+                cursor.execute("INSERT INTO game (verified) VALUES (false) RETURNING game_id;")
+                game_id = cursor.fetchone()[0]
+                upsert_rows(self.columns, [(game_id, 1, 'InPlay', 'a')], transaction)
+                mapped = pd.DataFrame(
+                    [(game_id, 1, 'FoulBall', None, 1.5), (game_id, 2, 'BallCalled', None, 2.5)],
+                    columns=[*self.columns, 'first_b_position_at_release_x']
+                )
+                assert load_mapped_rows(mapped, transaction, insert_only=PLAYERPOS_INSERT_ONLY_COLUMNS).empty
+                cursor.execute(
+                    """
+                    SELECT pitch_number, pitch_call, row_hash, first_b_position_at_release_x FROM pitch
+                    WHERE game_id = %s ORDER BY 1;
+                    """,
+                    (game_id,)
+                )
+                # pitch 1 keeps its pitch data, so the derived tables built from it stay right.
+                assert cursor.fetchall() == [(1, 'InPlay', 'a', 1.5), (2, 'BallCalled', None, 2.5)]
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def test_a_missing_unique_index_fails_the_file(self, monkeypatch):
+        conn = connect_to_db()
+        try:
+            monkeypatch.setattr(backfill.main, 'pitch_indexes', None)
+            assert has_pitch_upsert_key(conn)
+            # as if sql/004 had not been applied: the file fails before its game is looked up.
+            monkeypatch.setattr(backfill.main, 'pitch_indexes', frozenset())
+            with pytest.raises(RuntimeError, match='sql/004'):
+                load_csv_chunks(iter([]), '20240629-ClipperMagazine-1.csv', conn, None)
+        finally:
+            conn.close()
+
+
+class TestTrajectoryFeatures:
+    # One pitch of a TrackMan pitch data file (a right-handed four-seam fastball), in the production
+    # layout: x runs from home plate toward the mound, y toward first base and z up.
+    TRACKMAN_ROW = (
+        'PitchNo,PitchTrajectoryXc0,PitchTrajectoryXc1,PitchTrajectoryXc2,PitchTrajectoryYc0,PitchTrajectoryYc1,'
+        'PitchTrajectoryYc2,PitchTrajectoryZc0,PitchTrajectoryZc1,PitchTrajectoryZc2,PlateLocSide,PlateLocHeight\n'
+        '1,50.0,-132.41876,7.94213,-1.43829,4.21573,-3.10452,5.48312,-4.95718,-8.31247,-0.29332,2.45142\n'
+    )
+
+    def pitches(self, *coefficients):
+        columns = [f'pitch_trajectory_{axis}c{power}' for axis in 'xyz' for power in range(3)]
+        return pd.DataFrame(list(coefficients), columns=columns, dtype=object)
+
+    def test_plate_location_of_a_trackman_row(self):
+        row = pd.read_csv(StringIO(self.TRACKMAN_ROW))
+        pitches = row.rename(columns={csv_column: db_column for csv_column, db_column, _ in PITCH_COLUMN_MAP})
+        features = trajectory_features(pitches)
+        assert features['trajectory_plate_side'][0] == pytest.approx(row['PlateLocSide'][0], abs=1e-4)
+        assert features['trajectory_plate_height'][0] == pytest.approx(row['PlateLocHeight'][0], abs=1e-4)
+        assert 0.35 < features['trajectory_plate_time'][0] < 0.45
+        assert features['trajectory_plate_vx'][0] < -120
+
+    def test_features_of_a_constant_acceleration_pitch(self):
+        # 130 ft/s toward the plate from x = 55, drifting 4 ft/s^2 to the side and falling with gravity.
+        features = trajectory_features(self.pitches((55.0, -130.0, 0.0, 0.5, 0.0, 2.0, 6.0, -4.0, -16.087)))
+        plate_time = (55 - 17 / 12) / 130
+        assert features['trajectory_plate_time'][0] == pytest.approx(plate_time)
+        assert features['trajectory_plate_side'][0] == pytest.approx(0.5 + 2.0 * plate_time ** 2)
+        assert features['trajectory_plate_vz'][0] == pytest.approx(-4.0 - 2 * 16.087 * plate_time)
+        last_40_ft = (40 - 17 / 12) / 130
+        assert features['trajectory_horz_break_40'][0] == pytest.approx(2.0 * last_40_ft ** 2 * 12)
+        assert features['trajectory_vert_break_40'][0] == pytest.approx(-16.087 * last_40_ft ** 2 * 12)
+        assert features['trajectory_induced_vert_break_40'][0] == pytest.approx(0.0, abs=1e-2)
+
+    def test_missing_coefficients_give_missing_features(self):
+        features = trajectory_features(self.pitches(
+            (None, None, None, None, None, None, None, None, None),
+            (55.0, -130.0, 0.0, 0.0, 0.0, 0.0, 6.0, 0.0, 0.0),
+        ))
+        assert features.iloc[0].isna().all() and features.iloc[0].tolist() == [None] * len(features.columns)
+        assert features['trajectory_horz_break_40'][1] == pytest.approx(0.0)
+
+    def test_generated_pitches_cross_the_plate_at_their_plate_location(self):
+        files = generate_files(games=1, pitches=40, null_density=0.0, positioning=False)
+        df = pd.read_csv(StringIO(next(iter(files.values()))))
+        pitches = df.rename(columns={csv_column: db_column for csv_column, db_column, _ in PITCH_COLUMN_MAP})
+        features = trajectory_features(pitches)
+        assert features['trajectory_plate_side'].astype(float).to_numpy() == pytest.approx(df['PlateLocSide'], abs=1e-3)
+        assert features['trajectory_plate_height'].astype(float).to_numpy() == pytest.approx(df['PlateLocHeight'], abs=1e-3)
+
+
+class TestBattedBallFeatures:
+    def balls(self, *coefficients):
+        columns = [f'hit_trajectory_{axis}c{power}' for axis in 'xyz' for power in range(9)]
+        return pd.DataFrame(
+            [[*x, *[0.0] * 7, *y, *[0.0] * 7, *z, *[0.0] * 6] for x, y, z in coefficients],
+            columns=columns, dtype=object
+        )
+
+    def test_features_of_a_fly_ball(self):
+        # 100 ft/s toward center, 20 ft/s toward first base and 50 ft/s up from 3 ft, falling with gravity.
+        balls = self.balls(((0.0, 100.0), (0.0, 20.0), (3.0, 50.0, -16.0)))
+        features = batted_ball_features(balls)
+        hang_time = (50 + (50 ** 2 + 4 * 16 * 3) ** 0.5) / 32
+        assert features['hang_time'][0] == pytest.approx(hang_time)
+        assert features['landing_x'][0] == pytest.approx(100 * hang_time)
+        assert features['landing_y'][0] == pytest.approx(20 * hang_time)
+        assert features['distance'][0] == pytest.approx((100 ** 2 + 20 ** 2) ** 0.5 * hang_time)
+        assert features['spray_angle'][0] == pytest.approx(11.3099, abs=1e-4)
+        assert features['apex_height'][0] == pytest.approx(3 + 50 ** 2 / 64, abs=1e-3)
+
+    def test_balls_without_a_full_trajectory_are_left_out(self):
+        balls = self.balls(((0.0, 100.0), (0.0, 0.0), (3.0, 50.0, -16.0)), ((0.0, 100.0), (0.0, 0.0), (3.0, 50.0, -16.0)))
+        balls.loc[0, 'hit_trajectory_zc4'] = None
+        features = batted_ball_features(balls)
+        assert features.index.tolist() == [1]
+        assert features['spray_angle'][1] == pytest.approx(0.0)
+
+
+class TestPlateAppearances:
+    def pitches(self, *rows):
+        return pd.DataFrame(list(rows), columns=list(PLATE_APPEARANCE_PITCH_COLUMNS), dtype=object)
+
+    def test_pitches_are_grouped_in_pitch_order(self):
+        # a strikeout spread over chunks (delivered out of order), then a hit batter.
+        pitches = self.pitches(
+            (3, 1, 'Top', 1, 'b1', 'p1', 0, 1, 1, 'StrikeSwinging', 'Strikeout', 'Undefined', 0, 0),
+            (1, 1, 'Top', 1, 'b1', 'p1', 0, 0, 0, 'BallCalled', 'Undefined', 'Undefined', 0, 0),
+            (2, 1, 'Top', 1, 'b1', 'p1', 0, 1, 0, 'StrikeCalled', 'Undefined', 'Undefined', 0, 0),
+            (4, 1, 'Top', 2, 'b2', 'p1', 1, 0, 0, 'HitByPitch', 'Undefined', 'Undefined', 0, 0),
+            (5, None, 'Top', 3, 'b3', 'p1', 1, 0, 0, 'InPlay', 'Undefined', 'Single', 0, 0),
+        )
+        appearances = plate_appearances(pitches, 'game')
+        assert appearances['pa_of_inning'].tolist() == [1, 2]
+        strikeout, hit_by_pitch = appearances.to_dict('records')
+        assert strikeout['counts'] == ['0-0', '1-0', '1-1'] and strikeout['pitch_count'] == 3
+        assert (strikeout['first_pitch_number'], strikeout['last_pitch_number']) == (1, 3)
+        assert strikeout['result'] == 'Strikeout' and strikeout['game_id'] == 'game'
+        assert hit_by_pitch['result'] == 'HitByPitch' and hit_by_pitch['outs'] == 1
+
+    def test_unfinished_plate_appearance_has_no_result(self):
+        appearances = plate_appearances(self.pitches(
+            (1, 9, 'Bottom', 4, 'b1', 'p1', 2, None, 0, 'BallCalled', 'Undefined', 'Undefined', 0, 0),
+        ), 'game')
+        assert appearances['result'][0] is None
+        assert appearances['counts'][0] == [None]
+
+
+class TestGameSummaries:
+    def test_counts_by_game_team_and_player(self):
+        pitches = pd.DataFrame([
+            (1, 1, 'Top', 1, 'b1', 'p1', 0, 0, 0, 'StrikeSwinging', 'Undefined', 'Undefined', 0, 0),
+            (2, 1, 'Top', 1, 'b1', 'p1', 0, 0, 1, 'InPlay', 'Undefined', 'HomeRun', 0, 1),
+            (3, 1, 'Top', 2, 'b2', 'p1', 0, 0, 0, 'BallCalled', 'Walk', 'Undefined', 0, 0),
+            (4, 1, 'Bottom', 1, 'b3', 'p2', 0, 0, 0, 'InPlay', 'Undefined', 'Double', 0, None),
+        ], columns=list(PLATE_APPEARANCE_PITCH_COLUMNS), dtype=object)
+        game, teams, players = game_summaries(pitches, plate_appearances(pitches, 'game'), 'game')
+        totals = game.to_dict('records')[0]
+        assert (totals['game_id'], totals['innings'], totals['pitches'], totals['plate_appearances']) == ('game', 1, 4, 3)
+        assert (totals['hits'], totals['home_runs'], totals['doubles'], totals['walks'], totals['runs']) == (2, 1, 1, 1, 1)
+        visiting, home = teams.sort_values('home').to_dict('records')
+        assert (visiting['home'], visiting['pitches'], visiting['hits'], visiting['runs']) == (False, 3, 1, 1)
+        assert (home['home'], home['hits'], home['runs']) == (True, 1, 0)
+        lines = {(line['role'], line['player_id']): line for line in players.to_dict('records')}
+        assert lines[('batting', 'b1')]['home_runs'] == 1 and lines[('batting', 'b1')]['home'] is False
+        assert lines[('pitching', 'p1')]['walks'] == 1 and lines[('pitching', 'p1')]['home'] is True
+        assert lines[('pitching', 'p2')]['plate_appearances'] == 1 and lines[('pitching', 'p2')]['home'] is False
+
+    def test_a_player_without_an_inning_half_gets_no_team(self):
+        conn = connect_to_db()
+        try:
+            transaction = FileTransaction(conn)
+            cursor = transaction.cursor()
+            cursor.execute("SELECT team_id FROM team ORDER BY team_code LIMIT 2;")
+            home_team_id, visiting_team_id = (row[0] for row in cursor.fetchall())
+            cursor.execute(
+                "INSERT INTO game (verified, home_team_id, visiting_team_id) VALUES (false, %s, %s) RETURNING game_id;",
+                (home_team_id, visiting_team_id)
             )
-            assert(player_id1 == player_id2)
+            game_id = cursor.fetchone()[0]
+            batter_id, pitcher_id, unknown_id = (str(uuid4()) for _ in range(3))
+            pitches = pd.DataFrame([
+                (1, 1, 'Top', 1, batter_id, pitcher_id, 0, 0, 0, 'InPlay', 'Undefined', 'Single', 0, 0),
+                (2, 1, None, 2, unknown_id, pitcher_id, 0, 0, 0, 'InPlay', 'Undefined', 'Out', 1, 0),
+            ], columns=list(PLATE_APPEARANCE_PITCH_COLUMNS), dtype=object)
+            write_game_summaries(pitches, plate_appearances(pitches, game_id), game_id, transaction)
             cursor.execute(
-                """
-                SELECT player_name, player_batting_handedness FROM player
-                WHERE player_id = %s
-                """,
-                (player_id1,)
+                "SELECT player_id::text, role, team_id, home FROM player_game_summary WHERE game_id = %s;",
+                (game_id,)
             )
-            name, bat_hand = cursor.fetchone()
-            print(name, bat_hand)
-            assert (name == "Test update to switch hitter" and bat_hand == "Switch")
+            teams = {(player_id, role): (team_id, home) for player_id, role, team_id, home in cursor.fetchall()}
+            assert teams[(batter_id, 'batting')] == (visiting_team_id, False)
+            assert teams[(pitcher_id, 'pitching')] == (home_team_id, True)
+            assert teams[(unknown_id, 'batting')] == (None, None)
         finally:
-            self.delete_player_by_id(cursor, player_id1)
-            self.delete_player_by_id(cursor, player_id2)
+            conn.rollback()
+            conn.close()
 
 
-    def test_update_switch_hitter_pitch_hand(self):
-        cursor = self.conn.cursor()
-        player_id1 = None
-        player_id2 = None
+class TestSeasonAccumulators:
+    def test_sums_by_player_role_and_pitch_type(self):
+        pitches = pd.DataFrame(None, index=range(3), columns=list(GAME_PITCH_COLUMNS), dtype=object)
+        pitches['pitcher_id'] = 'p1'
+        pitches['batter_id'] = ['b1', 'b1', None]
+        pitches['tagged_pitch_type'] = ['Fastball', 'Undefined', 'Fastball']
+        pitches['auto_pitch_type'] = ['Four-Seam', 'Slider', 'Four-Seam']
+        pitches['rel_speed'] = [92.0, 84.0, 94.0]
+        pitches['exit_speed'] = [101.0, None, None]
+        stats = season_accumulators(pitches)
+        lines = {(line['role'], line['player_id'], line['pitch_type']): line for line in stats.to_dict('records')}
+        assert set(lines) == {
+            ('pitching', 'p1', 'Fastball'), ('pitching', 'p1', 'Slider'),
+            ('batting', 'b1', 'Fastball'), ('batting', 'b1', 'Slider'),
+        }
+        fastballs = lines[('pitching', 'p1', 'Fastball')]
+        assert (fastballs['pitches'], fastballs['rel_speed_count'], fastballs['exit_speed_count']) == (2, 2, 1)
+        assert fastballs['rel_speed_sum'] == 186.0 and fastballs['rel_speed_sum_squares'] == 92.0 ** 2 + 94.0 ** 2
+        assert fastballs['spin_rate_count'] == 0 and fastballs['spin_rate_sum'] == 0
+        assert lines[('batting', 'b1', 'Fastball')]['exit_speed_sum'] == 101.0
+
+
+class TestSeasonStatsReingest:
+    def season_rows(self, cursor):
+        cursor.execute(
+            """
+            SELECT player_id, role, pitch_type, pitches, rel_speed_count, rel_speed_sum, rel_speed_sum_squares
+            FROM player_season_pitch_type WHERE season = 1999;
+            """
+        )
+        return {row[:3]: row[3:] for row in cursor.fetchall()}
+
+    def test_a_changed_pitch_moves_the_season_totals_by_that_pitch(self):
+        game = schedule(1, start=date(1999, 6, 29))[0]
+        (key, content), = generate_game(game, pitches=60, positioning=False).items()
+        s3 = StubS3({key: content.encode()})
+        conn = connect_to_db()
         try:
-            player_id1 = get_or_insert_player(
-                "Test update switch hitter hand",
-                "Left",
-                "LAN",
-                "batter",
-                self.conn,
-            )
-            player_id2 = get_or_insert_player(
-                "Test update switch hitter hand",
-                "Right",
-                "LAN",
-                "batter",
-                self.conn,
-            )
-            player_id3 = get_or_insert_player(
-                "Test update switch hitter hand",
-                "Right",
-                "LAN",
-                "Pitcher",
-                self.conn,
-            )
-            assert(player_id1 == player_id2 == player_id3)
+            transaction = FileTransaction(conn)
+            cursor = transaction.cursor()
+            before = self.season_rows(cursor)
+            game_id = process_csv(StringIO(content), key, transaction, s3)['game_id']
+            ingested = self.season_rows(cursor)
+            assert sum(row[0] for row in ingested.values()) - sum(row[0] for row in before.values()) == 2 * 60
+
+            raw = pd.read_csv(StringIO(content), dtype=str, keep_default_na=False)
+            index = raw.index[raw['RelSpeed'] != ''][0]
+            old_speed = float(raw.at[index, 'RelSpeed'])
+            raw.at[index, 'RelSpeed'] = str(old_speed + 1.5)
+            assert process_csv(StringIO(raw.to_csv(index=False)), key, transaction, s3)['game_id'] == game_id
+            reingested = self.season_rows(cursor)
+
             cursor.execute(
-                """
-                SELECT player_name, player_batting_handedness, player_pitching_handedness FROM player
-                WHERE player_id = %s
-                """,
-                (player_id1,)
+                "SELECT pitcher_id, batter_id FROM pitch WHERE game_id = %s AND pitch_number = %s;",
+                (game_id, int(raw.at[index, 'PitchNo']))
             )
-            name, bat_hand, pitch_hand = cursor.fetchone()
-            print(name, bat_hand)
-            assert (name == "Test update switch hitter hand" and bat_hand == "Switch" and pitch_hand == "Right")
+            pitcher_id, batter_id = cursor.fetchone()
+            changed = {key: (ingested[key], row) for key, row in reingested.items() if ingested.get(key) != row}
+            assert set(ingested) == set(reingested)
+            assert {(player_id, role) for player_id, role, _ in changed} == {(pitcher_id, 'pitching'), (batter_id, 'batting')}
+            for (pitches, count, total, squares), (new_pitches, new_count, new_total, new_squares) in changed.values():
+                # the old game was subtracted before the new one was added: only the changed speed moved.
+                assert (new_pitches, new_count) == (pitches, count)
+                assert new_total - total == pytest.approx(1.5)
+                assert new_squares - squares == pytest.approx((old_speed + 1.5) ** 2 - old_speed ** 2)
         finally:
-            self.delete_player_by_id(cursor, player_id1)
-            self.delete_player_by_id(cursor, player_id2)
+            conn.rollback()
+            conn.close()
+
+
+class TestWriteDerived:
+    def test_an_error_is_rolled_back_and_fails_the_file(self):
+        conn = connect_to_db()
+        try:
+            transaction = FileTransaction(conn)
+            cursor = transaction.cursor()
+            cursor.execute("CREATE TEMP TABLE derived_test (x integer);")
+
+            def write(cursor):
+                cursor.execute("INSERT INTO derived_test VALUES (1);")
+                cursor.execute("SELECT 1 / 0;")
+            with pytest.raises(Exception, match='division by zero'):
+                write_derived('derived_test', write, transaction)
+            # only the failed write is undone; file_transaction then rolls back the rest of the file.
+            cursor.execute("SELECT count(*) FROM derived_test;")
+            assert cursor.fetchone() == (0,)
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+class TestReadCsvHeadTeams:
+    HEAD = 'PitchNo,HomeTeam,AwayTeam,Notes\n1,LAN_STO,YOR_REV,'
+
+    class CountingS3(StubS3):
+        def __init__(self, objects):
+            super().__init__(objects)
+            self.full_reads = 0
+
+        def get_object(self, Bucket, Key, Range=None):
+            self.full_reads += Range is None
+            return super().get_object(Bucket, Key, Range)
+
+    def read(self, content, head_bytes):
+        s3 = self.CountingS3({'2024/06/30/CSV/test.csv': content.encode()})
+        return read_csv_head_teams('bucket', '2024/06/30/CSV/test.csv', s3, head_bytes=head_bytes), s3.full_reads
+
+    def test_truncated_final_line_is_ignored(self):
+        # the range ends partway through the second data row.
+        content = self.HEAD + 'first\n2,LAN_STO,YOR_REV,a much longer second row\n'
+        assert self.read(content, len(self.HEAD) + 12) == (('LAN', 'YOR'), 0)
+
+    def test_first_row_cut_at_the_range_boundary_reads_the_whole_file(self):
+        content = self.HEAD + 'first\n2,LAN_STO,YOR_REV,second\n'
+        assert self.read(content, len(self.HEAD) - 4) == (('LAN', 'YOR'), 1)
+        # the header itself cut off.
+        assert self.read(content, 10) == (('LAN', 'YOR'), 1)
+
+    def test_file_shorter_than_the_range(self):
+        assert self.read(self.HEAD + 'only row', 16384) == (('LAN', 'YOR'), 0)
+        assert self.read(self.HEAD + 'only row\n', 16384) == (('LAN', 'YOR'), 0)
 
+    def test_probe_reports_an_unreadable_file(self):
+        teams, error = probe_csv_teams('bucket', 'missing.csv', StubS3())
+        assert teams is None and isinstance(error, KeyError)
+        # a file with a header but no data row.
+        teams, error = probe_csv_teams('bucket', 'empty.csv', StubS3({'empty.csv': b'PitchNo,HomeTeam,AwayTeam\n'}))
+        assert teams is None and error is not None
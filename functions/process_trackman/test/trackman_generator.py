@@ -0,0 +1,686 @@
+""" Deterministic generator of synthetic TrackMan pitch data and player positioning CSVs.
+
+The same arguments always produce byte-identical files, so tests and benchmark runs can be compared
+across commits. Games are simulated pitch by pitch (counts, outs, base runners, lineups and pitching
+changes), and each pitch's measurements come from one release and flight model, so related columns
+(ex: the trajectory coefficients, PlateLocSide/PlateLocHeight and ZoneSpeed) agree the way they do in
+real files. Columns are taken from the column maps in main.py, so new mapped columns are generated too.
+
+Example:
+    python -m functions.process_trackman.test.trackman_generator --games 4 --pitches 300 --out /tmp/trackman
+"""
+import os
+import io
+import csv
+import math
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+from functions.process_trackman.image.src.main import (
+    PITCH_COLUMN_MAP, PLAYERPOS_COLUMN_MAP, PITCH_PLAYER_FIELDS, PLAYERPOS_PLAYER_FIELDS, TRACKMAN_DTYPES,
+)
+
+
+# (team code as written in the CSVs, home ballpark). The ingest keeps the first 3 characters of HomeTeam.
+TEAMS = (
+    ('LAN_STO', 'ClipperMagazine'),
+    ('SMD_BLU', 'RegencyFurnitureStadium'),
+    ('YOR_REV', 'WellSpanPark'),
+    ('LI', 'FairfieldPropertiesBallpark'),
+)
+DEFAULT_START = date(2024, 6, 18)
+
+FIRST_NAMES = (
+    'Aaron', 'Ben', 'Carlos', 'Dylan', 'Eli', 'Frankie', 'Gabe', 'Hunter', 'Isaac', 'Jake', 'Kyle', 'Luis',
+    'Mason', 'Nolan', 'Oscar', 'Pedro', 'Quinn', 'Ryan', 'Sam', 'Tyler', 'Victor', 'Wes', 'Xavier', 'Zach',
+)
+LAST_NAMES = (
+    'Alvarez', 'Brooks', 'Castillo', 'Diaz', 'Ellis', 'Foster', 'Garcia', 'Hayes', 'Iglesias', 'Jensen',
+    'Kemp', 'Lopez', 'Morales', 'Nunez', 'Ortiz', 'Perez', 'Reyes', 'Santos', 'Torres', 'Vargas', 'Walsh',
+    'Young', 'Zamora', 'Miller',
+)
+
+# name: (mph below the pitcher's fastball, spin rpm, induced vertical break, arm-side horizontal break), inches.
+PITCH_TYPES = {
+    'Fastball': (0.0, 2250, 16.0, 8.0),
+    'Sinker': (1.0, 2150, 8.0, 15.0),
+    'Cutter': (4.0, 2350, 9.0, -3.0),
+    'Slider': (8.0, 2450, 2.0, -6.0),
+    'Curveball': (14.0, 2550, -12.0, -8.0),
+    'ChangeUp': (8.0, 1750, 6.0, 14.0),
+    'Splitter': (7.0, 1400, 3.0, 9.0),
+}
+AUTO_PITCH_TYPES = {
+    'Fastball': 'Four-Seam', 'Sinker': 'Sinker', 'Cutter': 'Cutter', 'Slider': 'Slider',
+    'Curveball': 'Curveball', 'ChangeUp': 'Changeup', 'Splitter': 'Splitter',
+}
+FIELD_POSITIONS = ('C', '1B', '2B', '3B', 'SS', 'LF', 'CF', 'RF', 'DH')
+# standard (X, Z) depth and lateral position of each fielder at release, in feet from home plate.
+FIELDER_DEPTHS = {
+    '1B': (80.0, 50.0), '2B': (140.0, 35.0), '3B': (85.0, -50.0), 'SS': (140.0, -35.0),
+    'LF': (270.0, -120.0), 'CF': (310.0, 0.0), 'RF': (270.0, 120.0),
+}
+
+GRAVITY = 32.174  # ft/s^2
+MPH = 5280 / 3600  # ft/s per mph
+PLATE_X = 17 / 12  # front of home plate, in feet from its back tip
+HIT_DRAG = 0.18  # 1/s; horizontal speed of a batted ball decays as e^(-kt)
+CONFIDENCES = ('High', 'High', 'High', 'Medium', 'Low')
+
+# Columns the simulation writes first, in the order TrackMan exports them; every other mapped column follows.
+LEADING_COLUMNS = (
+    'PitchNo', 'Date', 'Time', 'PAofInning', 'PitchofPA', 'Pitcher', 'PitcherId', 'PitcherThrows',
+    'PitcherTeam', 'Batter', 'BatterId', 'BatterSide', 'BatterTeam', 'PitcherSet', 'Inning', 'Top/Bottom',
+    'Outs', 'Balls', 'Strikes', 'TaggedPitchType', 'AutoPitchType', 'PitchCall', 'KorBB', 'TaggedHitType',
+    'PlayResult', 'OutsOnPlay', 'RunsScored', 'Notes',
+)
+TRAILING_COLUMNS = (
+    'HomeTeam', 'AwayTeam', 'Stadium', 'Level', 'League', 'GameID',
+    'Catcher', 'CatcherId', 'CatcherThrows', 'CatcherTeam',
+)
+
+
+def unique(columns):
+    return list(dict.fromkeys(columns))
+
+
+def mapped_columns(column_map, player_fields):
+    columns = [csv_column for csv_column, _, _ in column_map]
+    for name_column, hand_column, team_column, _, _ in player_fields:
+        columns.extend(column for column in (name_column, hand_column, team_column) if column)
+    return columns
+
+
+PITCH_HEADER = unique(LEADING_COLUMNS + tuple(mapped_columns(PITCH_COLUMN_MAP, PITCH_PLAYER_FIELDS)) + TRAILING_COLUMNS)
+PLAYERPOS_HEADER = unique(
+    ('PitchNo', 'Date', 'Time', 'Inning', 'Top/Bottom', 'Pitcher', 'Batter', 'BatterTeam')
+    + tuple(mapped_columns(PLAYERPOS_COLUMN_MAP, PLAYERPOS_PLAYER_FIELDS))
+)
+# Measured values: mapped numeric columns that are not counts. These are the ones null_density blanks.
+MEASURED_COLUMNS = frozenset(
+    csv_column for csv_column, _, _ in PITCH_COLUMN_MAP + PLAYERPOS_COLUMN_MAP
+    if csv_column not in TRACKMAN_DTYPES
+)
+
+
+def schedule(games, doubleheaders=0, start=DEFAULT_START, teams=TEAMS):
+    """ Return the games to generate, in order. Every day each team plays once (a round robin at the home
+    team's ballpark); the first `doubleheaders` matchups are played twice that day, as games 1 and 2.
+
+    Returns:
+        list: One dict per game with 'date', 'ballpark', 'game_number', 'home' and 'away'.
+    """
+    scheduled = []
+    rotation = list(teams)
+    day = start
+    while len(scheduled) < games:
+        half = len(rotation) // 2
+        for index in range(half):
+            home, away = rotation[index], rotation[-1 - index]
+            if (day - start).days % 2:
+                home, away = away, home
+            game_numbers = (1, 2) if doubleheaders > 0 else (1,)
+            doubleheaders -= len(game_numbers) - 1
+            for game_number in game_numbers:
+                if len(scheduled) < games:
+                    scheduled.append({
+                        'date': day, 'ballpark': home[1], 'game_number': game_number,
+                        'home': home[0], 'away': away[0],
+                    })
+        # circle method: keep the first team in place and rotate the others.
+        rotation = [rotation[0], rotation[-1]] + rotation[1:-1]
+        day += timedelta(days=1)
+    return scheduled
+
+
+def pitch_key(game, verified=False):
+    """S3 key the FTP job would write the game's pitch data to."""
+    suffix = '' if verified else '_unverified'
+    return f"{game_prefix(game)}{suffix}.csv"
+
+
+def positioning_key(game):
+    """S3 key the FTP job would write the game's player positioning data to."""
+    return f"{game_prefix(game)}_unverified_playerpositioning_FHC.csv"
+
+
+def game_prefix(game):
+    day = game['date']
+    return f"{day.year}/{day.month:02d}/{day.day:02d}/CSV/{day:%Y%m%d}-{game['ballpark']}-{game['game_number']}"
+
+
+def make_roster(team_code):
+    """The team's players. Seeded by the team code alone, so a team has the same players in every game."""
+    rng = random.Random(f'roster-{team_code}')
+    names = set()
+    while len(names) < 26:
+        names.add(f'{rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}')
+    names = sorted(names)
+    rng.shuffle(names)
+    base_id = 1000000 + sum(ord(char) for char in team_code) * 1000
+    pitchers = []
+    for index, name in enumerate(names[:13]):
+        throws = 'Left' if rng.random() < 0.3 else 'Right'
+        repertoire = ['Fastball'] + rng.sample(sorted(set(PITCH_TYPES) - {'Fastball'}), rng.randint(2, 3))
+        pitchers.append({
+            'name': name, 'id': base_id + index, 'throws': throws, 'bats': throws,
+            'velocity': rng.uniform(87, 96), 'release_height': rng.uniform(5.2, 6.4),
+            'release_side': rng.uniform(1.4, 2.4) * (-1 if throws == 'Right' else 1),
+            'extension': rng.uniform(5.6, 6.8),
+            'repertoire': repertoire, 'weights': [3.0] + [rng.uniform(0.8, 2.0) for _ in repertoire[1:]],
+        })
+    hitters = [
+        {
+            'name': name, 'id': base_id + 13 + index,
+            'throws': 'Left' if rng.random() < 0.15 else 'Right',
+            'bats': rng.choice(('Right', 'Right', 'Left', 'Both')),
+        }
+        for index, name in enumerate(names[13:])
+    ]
+    return {'code': team_code, 'pitchers': pitchers, 'hitters': hitters}
+
+
+def game_seed(seed, game):
+    return f"{seed}-{game['date']:%Y%m%d}-{game['ballpark']}-{game['game_number']}"
+
+
+def simulate_game(game, pitches, seed=0):
+    """ Simulate a game pitch by pitch until `pitches` have been thrown, going into extra innings if needed.
+
+    Returns:
+        list: One dict per pitch holding its pitch data and player positioning values.
+    """
+    rng = random.Random(game_seed(seed, game))
+    teams = {}
+    for side, code in (('away', game['away']), ('home', game['home'])):
+        roster = make_roster(code)
+        hitters = rng.sample(roster['hitters'], 9)
+        starter_index = (game['date'].toordinal() + game['game_number']) % 5
+        teams[side] = {
+            'code': code,
+            'lineup': hitters,
+            'positions': dict(zip(FIELD_POSITIONS, hitters)),
+            'bullpen': roster['pitchers'][5:] + [roster['pitchers'][i] for i in range(5) if i != starter_index],
+            'pitcher': roster['pitchers'][starter_index],
+            'pitch_limit': rng.randint(80, 105),
+            'pitcher_count': 0,
+            'batter_index': 0,
+            'runs': 0,
+        }
+
+    clock = datetime.combine(game['date'], datetime.min.time()) + timedelta(hours=18, minutes=35)
+    rows = []
+    inning = 1
+    while len(rows) < pitches:
+        for half, batting, fielding in (('Top', 'away', 'home'), ('Bottom', 'home', 'away')):
+            offense, defense = teams[batting], teams[fielding]
+            outs, bases, pa_of_inning = 0, [False, False, False], 0
+            clock += timedelta(minutes=2, seconds=rng.randint(0, 40))
+            while outs < 3 and len(rows) < pitches:
+                if defense['pitcher_count'] >= defense['pitch_limit'] and defense['bullpen']:
+                    defense['pitcher'] = defense['bullpen'].pop(0)
+                    defense['pitcher_count'] = 0
+                    defense['pitch_limit'] = rng.randint(15, 35)
+                pa_of_inning += 1
+                batter = offense['lineup'][offense['batter_index'] % 9]
+                offense['batter_index'] += 1
+                outs, runs = simulate_plate_appearance(
+                    rng, rows, pitches, game, inning, half, offense, defense, batter, outs, bases, pa_of_inning,
+                    clock,
+                )
+                offense['runs'] += runs
+                clock = rows[-1]['time'] + timedelta(seconds=rng.randint(15, 30))
+            if len(rows) >= pitches:
+                break
+        inning += 1
+    return rows
+
+
+def simulate_plate_appearance(rng, rows, pitches, game, inning, half, offense, defense, batter, outs, bases,
+                              pa_of_inning, clock):
+    """Append the plate appearance's pitches to rows. Returns the (outs, runs) after it."""
+    pitcher = defense['pitcher']
+    batter_side = batter['bats']
+    if batter_side == 'Both':
+        batter_side = 'Left' if pitcher['throws'] == 'Right' else 'Right'
+    balls = strikes = 0
+    pitch_of_pa = 0
+    shift = rng.random() < 0.2 and batter_side == 'Left'
+    while len(rows) < pitches:
+        pitch_of_pa += 1
+        pitch_type = rng.choices(pitcher['repertoire'], pitcher['weights'])[0]
+        flight = pitch_flight(rng, pitcher, pitch_type)
+        call = pitch_call(rng, flight, strikes)
+        row = {
+            'pitch_no': len(rows) + 1, 'time': clock, 'inning': inning, 'half': half,
+            'pa_of_inning': pa_of_inning, 'pitch_of_pa': pitch_of_pa, 'outs': outs, 'balls': balls,
+            'strikes': strikes, 'pitcher': pitcher, 'batter': batter, 'batter_side': batter_side,
+            'catcher': defense['positions']['C'], 'offense': offense['code'], 'defense': defense,
+            'pitch_type': pitch_type, 'flight': flight, 'call': call, 'runners_on': any(bases),
+            'korbb': 'Undefined', 'play_result': 'Undefined', 'hit': None, 'outs_on_play': 0, 'runs_scored': 0,
+            'shift': shift,
+        }
+        rows.append(row)
+        defense['pitcher_count'] += 1
+        clock += timedelta(seconds=rng.uniform(14, 28))
+
+        if call == 'BallCalled':
+            balls += 1
+            if balls == 4:
+                row['korbb'] = 'Walk'
+                row['runs_scored'] = advance_forced(bases)
+                return outs, row['runs_scored']
+        elif call == 'HitByPitch':
+            row['runs_scored'] = advance_forced(bases)
+            return outs, row['runs_scored']
+        elif call in ('StrikeCalled', 'StrikeSwinging'):
+            strikes += 1
+            if strikes == 3:
+                row['korbb'] = 'Strikeout'
+                row['outs_on_play'] = 1
+                return outs + 1, 0
+        elif call == 'FoulBall':
+            strikes = min(strikes + 1, 2)
+        else:
+            row['hit'] = batted_ball(rng)
+            row['play_result'], row['outs_on_play'], row['runs_scored'] = play_result(rng, row['hit'], bases, outs)
+            return outs + row['outs_on_play'], row['runs_scored']
+    return outs, 0
+
+
+def pitch_flight(rng, pitcher, pitch_type):
+    """ Release, movement and plate location of one pitch, and its constant-acceleration trajectory in
+    TrackMan's field frame (x: from the back tip of home plate toward the mound, y: toward first base,
+    z: up; feet and seconds).
+    """
+    slower, spin, ivb, arm_side_break = PITCH_TYPES[pitch_type]
+    hand = -1 if pitcher['throws'] == 'Right' else 1
+    speed = rng.gauss(pitcher['velocity'] - slower, 1.0)
+    ivb = rng.gauss(ivb, 2.0)
+    horz_break = hand * rng.gauss(arm_side_break, 2.0)
+    extension = rng.gauss(pitcher['extension'], 0.1)
+    release = (60.5 - extension, rng.gauss(pitcher['release_side'], 0.1), rng.gauss(pitcher['release_height'], 0.1))
+    target = (rng.gauss(0.0, 0.75), rng.gauss(2.45, 0.75))
+
+    # aim the pitch at the target: the accelerations depend on the flight time, which depends on the velocity.
+    v0 = speed * MPH
+    ax = 0.0016 * v0 * v0
+    vy = vz = 0.0
+    flight_time = (release[0] - PLATE_X) / v0
+    for _ in range(3):
+        ay = 2 * (horz_break / 12) / flight_time ** 2
+        az = -GRAVITY + 2 * (ivb / 12) / flight_time ** 2
+        vy = (target[0] - release[1] - ay * flight_time ** 2 / 2) / flight_time
+        vz = (target[1] - release[2] - az * flight_time ** 2 / 2) / flight_time
+        vx = math.sqrt(v0 * v0 - vy * vy - vz * vz)
+        flight_time = time_to_reach(release[0], vx, ax, PLATE_X)
+    return {
+        'speed': speed, 'spin': rng.gauss(spin, 120), 'ivb': ivb, 'horz_break': horz_break,
+        'extension': extension, 'release': release, 'velocity': (-vx, vy, vz), 'acceleration': (ax, ay, az),
+        'time': flight_time, 'plate': position_at(release, (-vx, vy, vz), (ax, ay, az), flight_time),
+    }
+
+
+def time_to_reach(x0, vx, ax, x):
+    """Time for a pitch released at x0 toward the plate at speed vx (slowing by ax) to reach x."""
+    return (vx - math.sqrt(vx * vx - 2 * ax * (x0 - x))) / ax
+
+
+def position_at(origin, velocity, acceleration, t):
+    return tuple(p + v * t + a * t * t / 2 for p, v, a in zip(origin, velocity, acceleration))
+
+
+def pitch_call(rng, flight, strikes):
+    side, height = flight['plate'][1], flight['plate'][2]
+    in_zone = abs(side) < 0.83 and 1.5 < height < 3.5
+    if rng.random() < (0.68 if in_zone else 0.3 + 0.05 * strikes):
+        if rng.random() < (0.85 if in_zone else 0.6):
+            return 'InPlay' if rng.random() < 0.45 else 'FoulBall'
+        return 'StrikeSwinging'
+    if in_zone:
+        return 'StrikeCalled'
+    return 'HitByPitch' if rng.random() < 0.02 else 'BallCalled'
+
+
+def batted_ball(rng):
+    """ Launch conditions of a batted ball and its flight, with drag slowing the ball as e^(-kt)
+    (X: toward center field, Y: toward the first base side, Z: up).
+    """
+    exit_speed = min(max(rng.gauss(88, 12), 40), 115)
+    angle = min(max(rng.gauss(12, 24), -60), 75)
+    direction = rng.uniform(-45, 45)
+    v = exit_speed * MPH
+    v_horizontal = v * math.cos(math.radians(angle))
+    velocity = (
+        v_horizontal * math.cos(math.radians(direction)),
+        v_horizontal * math.sin(math.radians(direction)),
+        v * math.sin(math.radians(angle)),
+    )
+    contact = (rng.gauss(1.5, 0.3), rng.gauss(0.0, 0.3), rng.gauss(2.6, 0.4))
+    hit = {
+        'exit_speed': exit_speed, 'angle': angle, 'direction': direction,
+        'contact': contact, 'velocity': velocity, 'spin': rng.gauss(2300, 600), 'spin_axis': rng.uniform(0, 360),
+    }
+    hit['hang_time'] = landing_time(hit)
+    hit['landing'] = hit_position(hit, hit['hang_time'])
+    hit['distance'] = math.hypot(hit['landing'][0], hit['landing'][1])
+    apex = math.log((velocity[2] + GRAVITY / HIT_DRAG) / (GRAVITY / HIT_DRAG)) / HIT_DRAG if velocity[2] > 0 else 0.0
+    hit['max_height'] = hit_position(hit, apex)[2]
+    return hit
+
+
+def hit_position(hit, t):
+    decay = (1 - math.exp(-HIT_DRAG * t)) / HIT_DRAG
+    (x0, y0, z0), (vx, vy, vz) = hit['contact'], hit['velocity']
+    return (
+        x0 + vx * decay,
+        y0 + vy * decay,
+        z0 + (vz + GRAVITY / HIT_DRAG) * decay - GRAVITY / HIT_DRAG * t,
+    )
+
+
+def landing_time(hit):
+    low, high = 0.0, 15.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if hit_position(hit, middle)[2] > 0:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def hit_coefficients(hit):
+    """ The 9-term polynomial (in t) TrackMan fits to a batted ball's flight, per axis: the Taylor series
+    of the drag model in hit_position.
+    """
+    coefficients = []
+    for axis in range(3):
+        origin, velocity = hit['contact'][axis], hit['velocity'][axis]
+        scale = velocity / HIT_DRAG if axis < 2 else (velocity + GRAVITY / HIT_DRAG) / HIT_DRAG
+        terms = [origin]
+        for n in range(1, 9):
+            terms.append(scale * (-1) ** (n + 1) * HIT_DRAG ** n / math.factorial(n))
+        if axis == 2:
+            terms[1] -= GRAVITY / HIT_DRAG
+        coefficients.append(terms)
+    return coefficients
+
+
+def play_result(rng, hit, bases, outs):
+    """Decide the result of a ball in play and move the runners. Returns (PlayResult, OutsOnPlay, RunsScored)."""
+    angle, distance = hit['angle'], hit['distance']
+    if distance > 375 and angle > 20:
+        result = 'HomeRun'
+    elif angle < 10:
+        result = rng.choices(('Out', 'Single', 'Error', 'FieldersChoice'), (70, 25, 3, 2))[0]
+    elif angle < 25:
+        result = rng.choices(('Single', 'Out', 'Double', 'Triple'), (50, 30, 16, 4))[0]
+    elif angle < 50:
+        result = rng.choices(('Out', 'Double', 'Single', 'Triple', 'Sacrifice'), (62, 16, 10, 4, 8))[0]
+    else:
+        result = 'Out'
+    if result == 'Sacrifice' and (not bases[2] or outs == 2):
+        result = 'Out'
+    if result == 'FieldersChoice' and not any(bases):
+        result = 'Out'
+
+    runs = 0
+    if result == 'HomeRun':
+        runs = sum(bases) + 1
+        bases[:] = [False, False, False]
+    elif result in ('Single', 'Error'):
+        runs = bases[2] + (bases[1] and result == 'Single')
+        bases[:] = [True, bases[0], bases[1] and result == 'Error']
+    elif result == 'Double':
+        runs = bases[1] + bases[2]
+        bases[:] = [False, True, bases[0]]
+    elif result == 'Triple':
+        runs = sum(bases)
+        bases[:] = [False, False, True]
+    elif result == 'Sacrifice':
+        runs = 1
+        bases[2] = False
+        return result, 1, runs
+    elif result == 'FieldersChoice':
+        # the lead runner is out and everyone else moves up one base.
+        lead = max(index for index in range(3) if bases[index])
+        bases[lead] = False
+        runs = advance_forced(bases)
+        return result, 1, runs
+    else:
+        return result, 1, 0
+    return result, 0, runs
+
+
+def advance_forced(bases):
+    """Put the batter on first, pushing forced runners ahead. Returns the runs forced in."""
+    if not bases[0]:
+        bases[0] = True
+        return 0
+    if not bases[1]:
+        bases[1] = True
+        return 0
+    if not bases[2]:
+        bases[2] = True
+        return 0
+    return 1
+
+
+def clock_time(moment):
+    return f'{moment:%H:%M:%S}.{moment.microsecond // 10000:02d}'
+
+
+def tilt(axis):
+    """Spin axis in degrees as the clock face TrackMan writes to Tilt, ex: 180 -> '12:00'."""
+    minutes = round(((axis + 180) % 360) * 2) % 720
+    return f'{minutes // 60 or 12}:{minutes % 60:02d}'
+
+
+def pitch_row(game, pitch):
+    """The pitch's values in the pitch data CSV, by column."""
+    flight, pitcher, batter, catcher = pitch['flight'], pitch['pitcher'], pitch['batter'], pitch['catcher']
+    (xr, yr, zr), (vx, vy, vz), (ax, ay, az) = flight['release'], flight['velocity'], flight['acceleration']
+    plate, t = flight['plate'], flight['time']
+    plate_velocity = (vx + ax * t, vy + ay * t, vz + az * t)
+    t50 = time_to_reach(xr, -vx, ax, 50.0)
+    at50 = position_at(flight['release'], flight['velocity'], flight['acceleration'], t50)
+    spin_axis = (math.degrees(math.atan2(flight['horz_break'], flight['ivb'])) + 180) % 360
+    hit = pitch['hit']
+    day = game['date']
+    row = {
+        'PitchNo': pitch['pitch_no'],
+        'Date': day.isoformat(),
+        'Time': clock_time(pitch['time']),
+        'LocalDateTime': f"{day.isoformat()}T{clock_time(pitch['time'])}",
+        'PAofInning': pitch['pa_of_inning'],
+        'PitchofPA': pitch['pitch_of_pa'],
+        'Pitcher': pitcher['name'], 'PitcherId': pitcher['id'], 'PitcherThrows': pitcher['throws'],
+        'PitcherTeam': pitch['defense']['code'],
+        'Batter': batter['name'], 'BatterId': batter['id'], 'BatterSide': pitch['batter_side'],
+        'BatterTeam': pitch['offense'],
+        'PitcherSet': 'Stretch' if pitch['runners_on'] else 'Windup',
+        'Inning': pitch['inning'], 'Top/Bottom': pitch['half'],
+        'Outs': pitch['outs'], 'Balls': pitch['balls'], 'Strikes': pitch['strikes'],
+        'TaggedPitchType': pitch['pitch_type'], 'AutoPitchType': AUTO_PITCH_TYPES[pitch['pitch_type']],
+        'PitchCall': pitch['call'], 'KorBB': pitch['korbb'],
+        'TaggedHitType': hit_type(hit['angle']) if hit else 'Undefined',
+        'PlayResult': pitch['play_result'], 'OutsOnPlay': pitch['outs_on_play'], 'RunsScored': pitch['runs_scored'],
+        'Notes': '',
+        'RelSpeed': flight['speed'],
+        'VertRelAngle': math.degrees(math.atan2(vz, -vx)),
+        'HorzRelAngle': math.degrees(math.atan2(vy, -vx)),
+        'SpinRate': flight['spin'], 'SpinAxis': spin_axis, 'Tilt': tilt(spin_axis),
+        'RelHeight': zr, 'RelSide': yr, 'Extension': flight['extension'],
+        'VertBreak': flight['ivb'] - GRAVITY * t * t / 2 * 12,
+        'InducedVertBreak': flight['ivb'], 'HorzBreak': flight['horz_break'],
+        'PlateLocHeight': plate[2], 'PlateLocSide': plate[1],
+        'ZoneSpeed': math.sqrt(sum(v * v for v in plate_velocity)) / MPH,
+        'VertApprAngle': math.degrees(math.atan2(plate_velocity[2], -plate_velocity[0])),
+        'HorzApprAngle': math.degrees(math.atan2(plate_velocity[1], -plate_velocity[0])),
+        'ZoneTime': t,
+        'pfxx': flight['horz_break'], 'pfxz': flight['ivb'],
+        # x0 ... az0 use the PITCHf/x frame: x toward first base and y toward the mound.
+        'x0': at50[1], 'y0': 50.0, 'z0': at50[2],
+        'vx0': vy + ay * t50, 'vy0': vx + ax * t50, 'vz0': vz + az * t50,
+        'ax0': ay, 'ay0': ax, 'az0': az,
+        'EffectiveVelo': flight['speed'] + (flight['extension'] - 6.0) * 1.5,
+        'MeasuredDuration': t,
+        'SpeedDrop': flight['speed'] - math.sqrt(sum(v * v for v in plate_velocity)) / MPH,
+        'PitchLastMeasuredX': PLATE_X, 'PitchLastMeasuredY': plate[1], 'PitchLastMeasuredZ': plate[2],
+        'PitchReleaseConfidence': 'High', 'PitchLocationConfidence': 'High', 'PitchMovementConfidence': 'High',
+        'HomeTeam': game['home'], 'AwayTeam': game['away'], 'Stadium': game['ballpark'],
+        'Level': 'Independent', 'League': 'ALPB', 'GameID': game_prefix(game).split('/')[-1],
+        'Catcher': catcher['name'], 'CatcherId': catcher['id'], 'CatcherThrows': catcher['throws'],
+        'CatcherTeam': pitch['defense']['code'],
+    }
+    for axis, velocity, acceleration, origin in zip('XYZ', (vx, vy, vz), (ax, ay, az), (xr, yr, zr)):
+        row[f'PitchTrajectory{axis}c0'] = origin
+        row[f'PitchTrajectory{axis}c1'] = velocity
+        row[f'PitchTrajectory{axis}c2'] = acceleration / 2
+    if hit:
+        landing = hit['landing']
+        row.update({
+            'ExitSpeed': hit['exit_speed'], 'Angle': hit['angle'], 'Direction': hit['direction'],
+            'HitSpinRate': hit['spin'], 'HitSpinAxis': hit['spin_axis'],
+            'Distance': hit['distance'], 'LastTrackedDistance': hit['distance'] * 0.92,
+            'Bearing': math.degrees(math.atan2(landing[1], landing[0])), 'HangTime': hit['hang_time'],
+            'MaxHeight': hit['max_height'],
+            'ContactPositionX': hit['contact'][0], 'ContactPositionY': hit['contact'][1],
+            'ContactPositionZ': hit['contact'][2],
+            'HitLaunchConfidence': 'High', 'HitLandingConfidence': 'Medium', 'AutoHitType': hit_type(hit['angle']),
+        })
+        for axis, coefficients in zip('XYZ', hit_coefficients(hit)):
+            for n, coefficient in enumerate(coefficients):
+                row[f'HitTrajectory{axis}c{n}'] = coefficient
+        v_horizontal = math.hypot(hit['velocity'][0], hit['velocity'][1])
+        if HIT_DRAG * 110 < v_horizontal:
+            at_110 = hit_position(hit, -math.log(1 - HIT_DRAG * 110 / v_horizontal) / HIT_DRAG)
+            if at_110[2] > 0:
+                row['PositionAt110X'], row['PositionAt110Y'], row['PositionAt110Z'] = at_110
+    return row
+
+
+def hit_type(angle):
+    if angle < 10:
+        return 'GroundBall'
+    if angle < 25:
+        return 'LineDrive'
+    if angle < 50:
+        return 'FlyBall'
+    return 'Popup'
+
+
+def positioning_row(game, pitch, rng):
+    """The pitch's values in the player positioning CSV, by column."""
+    positions = pitch['defense']['positions']
+    row = {
+        'PitchNo': pitch['pitch_no'], 'Date': game['date'].isoformat(), 'Time': clock_time(pitch['time']),
+        'Inning': pitch['inning'], 'Top/Bottom': pitch['half'],
+        'Pitcher': pitch['pitcher']['name'], 'Batter': pitch['batter']['name'], 'BatterTeam': pitch['offense'],
+        'PitcherTeam': pitch['defense']['code'],
+        'PitchCall': pitch['call'], 'PlayResult': pitch['play_result'],
+        'DetectedShift': 'Infield Shift' if pitch['shift'] else 'None',
+    }
+    for position, (depth, lateral) in FIELDER_DEPTHS.items():
+        if pitch['shift'] and position in ('1B', '2B', 'SS', '3B'):
+            lateral += 30.0
+        row[f'{position}_Name'] = positions[position]['name']
+        row[f'{position}_PositionAtReleaseX'] = rng.gauss(depth, 6.0)
+        row[f'{position}_PositionAtReleaseZ'] = rng.gauss(lateral, 6.0)
+    return row
+
+
+def blank_measurements(row, rng, null_density):
+    """ Blank measured values the way tracking gaps do: the whole pitch with probability null_density
+    (a dropped track), and otherwise each value with probability null_density.
+    """
+    if not null_density:
+        return row
+    dropped = rng.random() < null_density
+    # in row order: a set's order changes with the string hash seed, and with it the values blanked.
+    for column in [column for column in row if column in MEASURED_COLUMNS]:
+        if dropped or rng.random() < null_density:
+            row[column] = None
+    return row
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f'{value:.5f}'.rstrip('0').rstrip('.')
+    return value
+
+
+def to_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([format_value(row.get(column)) for column in header])
+    return buffer.getvalue()
+
+
+def generate_game(game, pitches=300, null_density=0.05, seed=0, verified=False, positioning=True):
+    """ Generate one game's files.
+
+    With verified=True, the pitch data is the game's verified re-delivery: the same pitches, with a few
+    TaggedPitchType values corrected the way the verification step does.
+
+    Returns:
+        dict: {S3 key: CSV text}, pitch data first.
+    """
+    rows = simulate_game(game, pitches, seed)
+    rng = random.Random(f'{game_seed(seed, game)}-values')
+    pitch_rows = [blank_measurements(pitch_row(game, pitch), rng, null_density) for pitch in rows]
+    if verified:
+        retag = random.Random(f'{game_seed(seed, game)}-verified')
+        for row in pitch_rows:
+            if retag.random() < 0.05:
+                row['TaggedPitchType'] = retag.choice(sorted(PITCH_TYPES))
+    files = {pitch_key(game, verified): to_csv(PITCH_HEADER, pitch_rows)}
+    if positioning:
+        positioning_rows = [blank_measurements(positioning_row(game, pitch, rng), rng, null_density) for pitch in rows]
+        files[positioning_key(game)] = to_csv(PLAYERPOS_HEADER, positioning_rows)
+    return files
+
+
+def generate_files(games=1, pitches=300, null_density=0.05, doubleheaders=0, seed=0, start=DEFAULT_START,
+                   verified=False, positioning=True):
+    """ Generate the files for `games` scheduled games (see schedule and generate_game).
+
+    Returns:
+        dict: {S3 key: CSV text}, in the order the FTP job would deliver them.
+    """
+    files = {}
+    for game in schedule(games, doubleheaders, start):
+        files.update(generate_game(game, pitches, null_density, seed, verified, positioning))
+    return files
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic TrackMan CSVs laid out like the S3 bucket.')
+    parser.add_argument('--out', required=True, help='Directory to write the YYYY/MM/DD/CSV/ tree to.')
+    parser.add_argument('--games', type=int, default=4)
+    parser.add_argument('--pitches', type=int, default=300, help='Pitches per game.')
+    parser.add_argument('--null-density', type=float, default=0.05, help='Share of measured values left empty.')
+    parser.add_argument('--doubleheaders', type=int, default=0, help='Matchups played twice in a day.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', type=parse_date, default=DEFAULT_START, help='First game day, YYYY-MM-DD.')
+    parser.add_argument('--verified', action='store_true', help='Write verified pitch data file names.')
+    parser.add_argument('--no-positioning', action='store_true', help='Only write pitch data files.')
+    args = parser.parse_args()
+    generated = generate_files(args.games, args.pitches, args.null_density, args.doubleheaders, args.seed,
+                               args.start, args.verified, not args.no_positioning)
+    for key, text in generated.items():
+        path = os.path.join(args.out, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', newline='') as file:
+            file.write(text)
+    print(f'Wrote {len(generated)} files to {args.out}')